@@ -9,9 +9,9 @@ import streamlit as st
 import streamlit.components.v1 as components
 import os
 import uuid
+import hashlib
 import json
 import shutil
-import traceback
 import requests
 import gc
 import math
@@ -19,7 +19,6 @@ import psutil
 from datetime import datetime
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
-from pptx import Presentation
 
 # -------------------------------------------------
 # 0. 雲端日誌系統 (Drive Logger)
@@ -63,7 +62,8 @@ def upload_log_to_drive(creds, filename=LOG_FILE):
 # 1. 依賴與環境檢查
 # -------------------------------------------------
 try:
-    from ppt_processor import PPTAutomationBot
+    from ppt_processor import SPLIT_SIZE_BUDGET_MB, PackageIndex, PPTAutomationBot, scan_slide_titles
+    from job_runner import ACTIVE_STATES, JOB_CONCURRENCY, JobRunner
 except ImportError:
     st.error("❌ 嚴重錯誤：找不到 `ppt_processor.py`，請確認檔案已上傳。")
     st.stop()
@@ -119,11 +119,15 @@ div[data-testid="column"] button:hover { color: #cc0000 !important; border-color
 # -------------------------------------------------
 # 4. 核心功能函數
 # -------------------------------------------------
+def session_dir():
+    # 每個瀏覽器工作階段各自的上傳目錄，多人同時使用不會互相覆蓋
+    return os.path.join(WORK_DIR, st.session_state.session_id)
+
 def cleanup_workspace():
-    if os.path.exists(WORK_DIR):
-        try: shutil.rmtree(WORK_DIR)
+    if os.path.exists(session_dir()):
+        try: shutil.rmtree(session_dir())
         except: pass
-    os.makedirs(WORK_DIR, exist_ok=True)
+    os.makedirs(session_dir(), exist_ok=True)
 
 def reset_callback():
     cleanup_workspace()
@@ -161,6 +165,42 @@ def save_history(filename, jobs):
         with open(HISTORY_FILE, "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False, indent=2)
     except: pass
 
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""): h.update(chunk)
+    return h.hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def scan_preview(file_hash, _source_path):
+    # 以檔案雜湊快取：同一份簡報重新整理或重新上傳都不必再掃描
+    return [{"頁碼": i+1, "內容摘要": txt} for i, txt in enumerate(scan_slide_titles(_source_path))]
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_package_index(file_hash, _source_path):
+    # 拆分大小預估用的 rels 依賴圖，同樣以檔案雜湊快取；各工作階段共用同一份索引，
+    # 因此建立時就讀好圖片尺寸，之後不再開啟 (可能已被清除的) 原檔
+    return PackageIndex(_source_path, probe_images=True)
+
+def render_size_estimate(job):
+    # 執行前預估拆分檔大小，先標出可能超過上限的頁數範圍 (壓縮後為偏大的估計)
+    file_hash = st.session_state.ppt_meta.get("file_hash")
+    if not file_hash or job["start"] > job["end"]: return
+    try:
+        sizes = load_package_index(file_hash, os.path.join(session_dir(), "source.pptx")).predict_range_sizes(job["start"], job["end"])
+    except Exception as e:
+        write_log(f"拆分大小預估失敗 ({job['start']}-{job['end']}): {e}")
+        st.caption(f"📦 無法預估大小：{e}")
+        return
+    mb = {k: v / (1024 * 1024) for k, v in sizes.items()}
+    text = f"📦 預估大小：原始 {mb['original']:.1f} MB → 影片/音訊雲端化 {mb['offloaded']:.1f} MB → 壓縮後約 {mb['shrunk']:.1f} MB"
+    if mb["lowest"] > SPLIT_SIZE_BUDGET_MB:
+        st.error(f"{text}\n\n⛔️ 即使降到最低畫質仍超過 {SPLIT_SIZE_BUDGET_MB} MB 上限，請縮小頁數範圍。")
+    elif mb["shrunk"] > SPLIT_SIZE_BUDGET_MB:
+        st.warning(f"{text}\n\n⚠️ 可能超過 {SPLIT_SIZE_BUDGET_MB} MB 上限，執行時會自動降低圖片畫質。")
+    else:
+        st.caption(text)
+
 def add_split_job(total_pages):
     new_id = str(uuid.uuid4())[:8]
     st.session_state.split_jobs.insert(0, {
@@ -195,158 +235,76 @@ def render_copy_btn(text):
     return f"""<html><body style="margin:0;padding:0;"><button onclick="navigator.clipboard.writeText('{text}')" style="border:1px solid #004280;background:#fff;color:#004280;padding:4px 8px;border-radius:4px;cursor:pointer;font-size:13px;">📋 複製</button></body></html>"""
 
 # -------------------------------------------------
-# 5. 核心執行邏輯 (Drive Logging)
+# 5. 核心執行邏輯 (背景任務 + Drive Logging)
 # -------------------------------------------------
-def execute_automation_logic(bot, source_path, file_prefix, jobs, auto_clean):
-    main_progress = st.progress(0, text="準備開始...")
-    status_area = st.empty()
-    detail_bar = st.empty()
-    
-    # 清空並初始化日誌
-    if os.path.exists(LOG_FILE): os.remove(LOG_FILE)
-    write_log(f"=== 新任務啟動 v2.5 ===")
-    write_log(f"檔案路徑: {source_path}")
+@st.cache_resource
+def get_job_runner():
+    # 整個伺服器共用一個執行器；任務失敗時把該任務的日誌上傳到 Drive
+    return JobRunner(
+        concurrency=JOB_CONCURRENCY,
+        on_error=lambda bot, log_path: upload_log_to_drive(bot.creds, log_path),
+    )
+
+def render_job_progress():
+    runner = get_job_runner()
+    records = [r for r in (runner.get(j) for j in st.session_state.publish_job_ids) if r]
+    if not records: return
 
-    def update_bar(text, pct):
-        detail_bar.progress(pct, text=text)
-
-    try:
-        # Step 1
-        status_area.info("1️⃣ 步驟 1/5：提取 PPT 內影片並上傳至雲端...")
-        main_progress.progress(5, text="Step 1: 影片雲端化")
-        
-        file_size_mb = os.path.getsize(source_path) / (1024 * 1024)
-        write_log(f"PPT 檔案大小: {file_size_mb:.2f} MB")
-        
-        if file_size_mb > 50:
-            write_log("⚠️ 警告：檔案 > 50MB，高風險")
-            st.warning("⚠️ 檔案過大，若失敗請壓縮 PPT。")
-
-        video_map = bot.extract_and_upload_videos(
-            source_path,
-            os.path.join(WORK_DIR, "media"),
-            file_prefix=file_prefix,
-            progress_callback=lambda f, c, t: update_bar(f"上傳中: {f}", c/t if t else 0),
-            log_callback=lambda msg: write_log(f"[Bot] {msg}")
-        )
-        write_log(f"影片上傳完成，共 {len(video_map)} 個")
-        gc.collect()
-
-        # Step 2
-        status_area.info("2️⃣ 步驟 2/5：置換影片連結...")
-        main_progress.progress(25, text="Step 2: 連結置換")
-        
-        final_mod_path = os.path.join(WORK_DIR, "modified.pptx")
-        temp_working_path = os.path.join(WORK_DIR, "temp_working.pptx")
-        shutil.copy(source_path, temp_working_path)
-        
-        video_items = list(video_map.items())
-        total_items = len(video_items)
-        BATCH_SIZE = 1 
-        
-        for i in range(0, total_items, BATCH_SIZE):
-            current_item_num = i + 1
-            batch_items = dict(video_items[i : i + BATCH_SIZE])
-            v_name = list(batch_items.keys())[0]
-            
-            write_log(f"正在處理影片 ({current_item_num}/{total_items}): {v_name}")
-            
-            # 檢查影片實體大小
-            v_path = os.path.join(WORK_DIR, "media", v_name)
-            if os.path.exists(v_path):
-                v_mb = os.path.getsize(v_path)/(1024*1024)
-                write_log(f"影片實體大小: {v_mb:.1f} MB")
-                if v_mb > 30: write_log("⚠️ 此影片較大，記憶體可能飆升")
-
-            update_bar(f"置換中 ({current_item_num}/{total_items}): {v_name}", current_item_num / total_items)
-            
-            temp_output = os.path.join(WORK_DIR, f"temp_step_{current_item_num}.pptx")
-            
-            bot.replace_videos_with_images(
-                temp_working_path,
-                temp_output,
-                batch_items,
-                progress_callback=None
-            )
-            
-            if os.path.exists(temp_working_path): os.remove(temp_working_path)
-            shutil.move(temp_output, temp_working_path)
-            
-            batch_items = None
-            gc.collect()
-            write_log("記憶體釋放完成")
-        
-        if os.path.exists(final_mod_path): os.remove(final_mod_path)
-        shutil.move(temp_working_path, final_mod_path)
-        detail_bar.empty()
-
-        # Step 3
-        status_area.info("3️⃣ 步驟 3/5：進行檔案壓縮與瘦身...")
-        main_progress.progress(45, text="Step 3: 檔案瘦身")
-        slim_path = os.path.join(WORK_DIR, "slim.pptx")
-        write_log("開始壓縮 PPT")
-        bot.shrink_pptx(final_mod_path, slim_path, progress_callback=lambda c, t: update_bar("壓縮中...", c/t if t else 0))
-        gc.collect()
-
-        # Step 4
-        status_area.info("4️⃣ 步驟 4/5：依設定拆分簡報並上傳...")
-        main_progress.progress(65, text="Step 4: 拆分發布")
-        write_log("開始上傳 Slide")
-        results = bot.split_and_upload(
-            slim_path, sorted(jobs, key=lambda x: x['start']), file_prefix,
-            progress_callback=lambda f, c, t: update_bar(f"上傳簡報: {f}", c/t if t else 0),
-            log_callback=lambda msg: write_log(f"[Upload] {msg}")
-        )
-        
-        if any(r.get('error_too_large') for r in results):
-            write_log("錯誤：檔案過大")
-            st.error("⛔️ 流程終止：部分檔案過大無法上傳。")
-            return
-
-        # Step 5
-        status_area.info("5️⃣ 步驟 5/5：優化線上播放器...")
-        main_progress.progress(85, text="Step 5: 內嵌優化")
-        write_log("開始 Embed 優化")
-        final_results = bot.embed_videos_in_slides(results, progress_callback=lambda c, t: update_bar("優化中...", c/t if t else 0), log_callback=print)
-
-        # Final
-        status_area.info("📝 最後步驟：寫入資料庫...")
-        main_progress.progress(95, text="Final: 寫入資料庫")
-        write_log("寫入資料庫")
-        bot.log_to_sheets(final_results, log_callback=print)
-
-        main_progress.progress(100, text="任務完成")
-        status_area.info("**成功：** 所有自動化流程執行完畢。", icon=None)
-        write_log("任務成功結束")
-        
-        if auto_clean: cleanup_workspace()
-        st.session_state.execution_results = {"results": final_results, "prefix": file_prefix}
+    with st.container(border=True):
+        st.subheader("執行進度")
+        for rec in reversed(records):
+            label = f"{rec['file_name']} ({rec['job_id']})"
+            status = rec["status"]
+            if status == "queued":
+                st.info(f"⏳ {label}：{rec.get('status_text') or '排隊中...'}")
+            elif status == "running":
+                st.markdown(f"**{label}**")
+                st.progress(rec.get("progress") or 0, text=rec.get("status_text") or "執行中...")
+                if rec.get("detail_text"):
+                    st.progress(rec.get("detail_pct") or 0.0, text=rec["detail_text"])
+            elif status == "done":
+                st.info(f"**成功：** {label} 所有自動化流程執行完畢。", icon=None)
+            elif status == "too_large":
+                st.error(f"⛔️ {label}：流程終止：部分檔案過大無法上傳。")
+                for r in rec.get("results") or []:
+                    if r.get("error_too_large"):
+                        st.caption(f"{r['filename']}：降至最低圖片畫質後仍有 {r.get('size_mb', 0):.1f} MB，請縮小頁數範圍。")
+            else:
+                st.error(f"❌ {label} 執行錯誤: {rec.get('error')}")
+                if "kill" in str(rec.get("error")).lower() or "memory" in str(rec.get("error")).lower():
+                    st.error("🛑 記憶體不足。請稍後查看 Drive 日誌。")
+                with st.expander("查看錯誤詳情"):
+                    st.code(rec.get("traceback") or "")
+                if st.button("🔁 重試", key=f"retry_{rec['job_id']}"):
+                    runner.retry(rec["job_id"])
+                    st.rerun()
 
-    except Exception as e:
-        err_msg = f"CRITICAL ERROR: {str(e)}\n{traceback.format_exc()}"
-        write_log(err_msg)
-        st.error(f"❌ 執行錯誤: {str(e)}")
-        if "kill" in str(e).lower() or "memory" in str(e).lower():
-             st.error("🛑 記憶體不足。請稍後查看 Drive 日誌。")
-        
-        # 崩潰當下嘗試緊急上傳 Log
-        upload_log_to_drive(bot.creds)
-        with st.expander("查看錯誤詳情"):
-            st.code(traceback.format_exc())
+    # 最新完成的任務顯示於「產出結果」
+    latest = records[-1]
+    if latest["status"] == "done" and st.session_state.shown_job_id != latest["job_id"]:
+        st.session_state.shown_job_id = latest["job_id"]
+        st.session_state.execution_results = {"results": latest["results"], "prefix": latest["file_prefix"]}
+        st.rerun()
+    # 全部結束後整頁重繪一次，停止自動更新
+    if st.session_state.jobs_active and not any(r["status"] in ACTIVE_STATES for r in records):
+        st.rerun()
 
 # ==========================================
 # 6. 主介面邏輯
 # ==========================================
-os.makedirs(WORK_DIR, exist_ok=True)
+if 'session_id' not in st.session_state: st.session_state.session_id = uuid.uuid4().hex[:12]
+os.makedirs(session_dir(), exist_ok=True)
 
 # Header
 components.html(f"""<div style="width:100%;display:flex;flex-direction:column;align-items:center;margin:4px 0 2px 0;"><img src="{LOGO_URL}" style="width:300px;"><div style="margin-top:4px;color:gray;font-size:1rem;letter-spacing:2px;">簡報案例自動化發布平台</div></div>""", height=78)
-st.info("功能說明： 上傳PPT → 線上拆分 → 影片雲端化 → 內嵌優化 → 簡報雲端化 → 寫入和椿資料庫")
+st.info("功能說明： 上傳PPT → 線上拆分 → 影片/音訊雲端化 → 內嵌優化 → 簡報雲端化 → 寫入和椿資料庫")
 
 # Init State
 if 'split_jobs' not in st.session_state: st.session_state.split_jobs = []
 if 'reset_key' not in st.session_state: st.session_state.reset_key = 0
 if 'execution_results' not in st.session_state: st.session_state.execution_results = None
+if 'publish_job_ids' not in st.session_state: st.session_state.publish_job_ids = []
+if 'shown_job_id' not in st.session_state: st.session_state.shown_job_id = None
 if 'bot' not in st.session_state:
     try:
         bot_instance = PPTAutomationBot()
@@ -360,7 +318,7 @@ with st.container(border=True):
     st.subheader("步驟一：選擇檔案來源")
     input_method = st.radio("上傳方式", ["本地檔案", "線上檔案"], horizontal=True)
     uploaded_file = None
-    source_path = os.path.join(WORK_DIR, "source.pptx")
+    source_path = os.path.join(session_dir(), "source.pptx")
     file_name_for_logic = None
     
     if input_method == "本地檔案":
@@ -388,24 +346,17 @@ with st.container(border=True):
             saved_jobs = load_history(file_name_for_logic)
             st.session_state.split_jobs = saved_jobs if saved_jobs else []
             try:
-                prs = Presentation(source_path)
-                total_slides = len(prs.slides)
-                
-                preview_data = []
-                for i, slide in enumerate(prs.slides):
-                    txt = slide.shapes.title.text if (slide.shapes.title and slide.shapes.title.text) else "無標題"
-                    if txt == "無標題":
-                        for s in slide.shapes:
-                            if hasattr(s, "text") and s.text.strip():
-                                txt = s.text.strip()[:20] + "..."
-                                break
-                    preview_data.append({"頁碼": i+1, "內容摘要": txt})
-                
+                # 直接從 zip 逐頁讀取標題，不載入整份簡報與媒體
+                file_hash = file_sha256(source_path)
+                preview_data = scan_preview(file_hash, source_path)
+                total_slides = len(preview_data)
+
                 st.session_state.ppt_meta["total_slides"] = total_slides
                 st.session_state.ppt_meta["preview_data"] = preview_data
+                st.session_state.ppt_meta["file_hash"] = file_hash
                 st.session_state.current_file_name = file_name_for_logic
                 st.session_state.execution_results = None 
-                st.info(f"**已讀取：** {file_name_for_logic} (共 {len(prs.slides)} 頁)", icon=None)
+                st.info(f"**已讀取：** {file_name_for_logic} (共 {total_slides} 頁)", icon=None)
             except Exception as e:
                 st.error(f"檔案處理失敗: {e}")
                 st.session_state.current_file_name = None
@@ -443,6 +394,7 @@ if st.session_state.current_file_name:
                 job["subcategory"] = c_e.text_input("子分類", value=job["subcategory"], key=f"sub_{job['id']}")
                 job["client"] = c_f.text_input("客戶", value=job["client"], key=f"cli_{job['id']}")
                 job["keywords"] = c_g.text_input("關鍵字", value=job["keywords"], key=f"key_{job['id']}")
+                render_size_estimate(job)
         
         save_history(st.session_state.current_file_name, st.session_state.split_jobs)
 
@@ -456,17 +408,30 @@ if st.session_state.current_file_name:
                 if errs:
                     for e in errs: st.error(e)
                 else:
-                    if st.session_state.bot:
-                        execute_automation_logic(
-                            st.session_state.bot,
-                            os.path.join(WORK_DIR, "source.pptx"),
+                    if st.session_state.get('bot'):
+                        source_file = os.path.join(session_dir(), "source.pptx")
+                        if os.path.getsize(source_file) > 50 * 1024 * 1024:
+                            st.warning("⚠️ 檔案過大，若失敗請壓縮 PPT。")
+                        # 送到背景執行，介面只輪詢進度
+                        job_id = get_job_runner().submit(
+                            source_file,
+                            st.session_state.current_file_name,
                             os.path.splitext(st.session_state.current_file_name)[0],
                             st.session_state.split_jobs,
-                            auto_clean
+                            auto_clean=auto_clean,
+                            owner=st.session_state.session_id
                         )
+                        st.session_state.publish_job_ids.append(job_id)
+                        st.session_state.execution_results = None
                         st.rerun()
                     else: st.error("Bot 未初始化")
 
+# 背景任務進度 (執行中時每 2 秒自動更新)
+if st.session_state.publish_job_ids:
+    runner = get_job_runner()
+    st.session_state.jobs_active = any((runner.get(j) or {}).get("status") in ACTIVE_STATES for j in st.session_state.publish_job_ids)
+    st.fragment(render_job_progress, run_every=2 if st.session_state.jobs_active else None)()
+
 # Step 4
 if st.session_state.execution_results:
     st.markdown("<div id='step4-anchor'></div>", unsafe_allow_html=True)
@@ -478,7 +443,8 @@ if st.session_state.execution_results:
         rows = ""
         for r in results:
             if 'final_link' in r:
-                rows += f"""<tr style="border-bottom:1px solid #eee;"><td style="padding:8px;color:#333;">[{pfx}]_{r['filename']}</td><td style="padding:8px;"><a href="{r['final_link']}" target="_blank" style="text-decoration:none;color:#004280;font-weight:500;border:1px solid #004280;padding:4px 8px;border-radius:4px;display:inline-block;">開啟簡報</a></td><td style="padding:8px;">{render_copy_btn(r['final_link'])}</td></tr>"""
+                quality_note = f"<br><span style='font-size:12px;color:#b26a00;'>為符合上傳上限，圖片已降為 {r['image_quality']}</span>" if r.get('image_quality') else ""
+                rows += f"""<tr style="border-bottom:1px solid #eee;"><td style="padding:8px;color:#333;">[{pfx}]_{r['filename']}{quality_note}</td><td style="padding:8px;"><a href="{r['final_link']}" target="_blank" style="text-decoration:none;color:#004280;font-weight:500;border:1px solid #004280;padding:4px 8px;border-radius:4px;display:inline-block;">開啟簡報</a></td><td style="padding:8px;">{render_copy_btn(r['final_link'])}</td></tr>"""
         
         if rows: st.markdown(f"""<table style="width:100%;font-size:14px;border-collapse:collapse;"><tr style="background-color:#f9f9f9;text-align:left;border-bottom:1px solid #ddd;"><th style="padding:8px;">檔案名稱</th><th style="padding:8px;">線上預覽</th><th style="padding:8px;">操作</th></tr>{rows}</table>""", unsafe_allow_html=True)
         else: st.warning("沒有產生任何結果。")
@@ -0,0 +1,687 @@
+"""發布流程效能量測。
+
+以固定亂數種子產生合成簡報 (投影片數、影片數量與大小、圖片數量/尺寸/格式皆可設定)，
+在離線的 Google 服務替身下量測各步驟的執行時間與峰值記憶體 (RSS，含子行程)，
+結果輸出為 JSON，方便跨 commit 比較：
+
+    python benchmark.py --slides 60 --videos 6 --video-mb 5 --images 60 --output before.json
+    python benchmark.py --slides 60 --videos 6 --video-mb 5 --images 60 --compare before.json
+
+每個量測項目都在獨立的子行程中執行，峰值記憶體不受前一項影響。
+
+加上 --stages publish 會對本機 Google API 替身 (fake_google.py) 跑完整發布流程，
+可用 --fake-latency / --fake-bandwidth-mbps / --fake-error-rate 模擬網路狀況。
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import posixpath
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import psutil
+from PIL import Image
+
+import ppt_processor as pp
+from fake_google import FakeGoogle, FakeGoogleConfig
+
+# 合成簡報內所有成員使用固定時間，相同參數產生的檔案逐位元組相同
+_ZIP_DATE = (2024, 1, 1, 0, 0, 0)
+_SLIDE_CX = 9144000
+_SLIDE_CY = 6858000
+
+_NSDECL = (
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"'
+)
+_P14_NSDECL = 'xmlns:p14="http://schemas.microsoft.com/office/powerpoint/2010/main"'
+_REL_BASE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_MEDIA_REL_TYPE = "http://schemas.microsoft.com/office/2007/relationships/media"
+
+
+# =========================
+#  合成簡報產生器
+# =========================
+def _rels(rels) -> str:
+    body = "".join(
+        f'<Relationship Id="{rid}" Type="{rtype}" Target="{target}"/>' for rid, rtype, target in rels
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{body}</Relationships>'
+    )
+
+
+def _noise_image(rng: random.Random, size, fmt: str) -> bytes:
+    # 低解析度亂數雜訊再放大：有一定壓縮難度，產生速度也快
+    w, h = size
+    small = Image.frombytes("RGB", (max(1, w // 8), max(1, h // 8)), rng.randbytes(max(1, w // 8) * max(1, h // 8) * 3))
+    img = small.resize((w, h), Image.BILINEAR)
+    buf = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buf, "JPEG", quality=95)
+    else:
+        img.save(buf, fmt)
+    return buf.getvalue()
+
+
+def _pic_xml(shape_id: int, name: str, embed_rid: str, x: int, y: int, cx: int, cy: int,
+             video_rid: str = None, media_rid: str = None) -> str:
+    nv_pr = "<p:nvPr/>"
+    if video_rid:
+        nv_pr = (
+            f'<p:nvPr><a:videoFile r:link="{video_rid}"/>'
+            f'<p:extLst><p:ext uri="{{DAA4B4D4-6D71-4841-9C94-3DA2E9B8ED7A}}">'
+            f'<p14:media {_P14_NSDECL} r:embed="{media_rid}"/></p:ext></p:extLst></p:nvPr>'
+        )
+    return (
+        f'<p:pic><p:nvPicPr><p:cNvPr id="{shape_id}" name="{name}"/>'
+        f'<p:cNvPicPr><a:picLocks noChangeAspect="1"/></p:cNvPicPr>{nv_pr}</p:nvPicPr>'
+        f'<p:blipFill><a:blip r:embed="{embed_rid}"/><a:stretch><a:fillRect/></a:stretch></p:blipFill>'
+        f'<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr></p:pic>'
+    )
+
+
+def _slide_xml(index: int, shapes: str, timing: str = "") -> str:
+    title = (
+        '<p:sp><p:nvSpPr><p:cNvPr id="2" name="Title 1"/><p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr>'
+        '<p:nvPr><p:ph type="title"/></p:nvPr></p:nvSpPr><p:spPr/>'
+        f'<p:txBody><a:bodyPr/><a:lstStyle/><a:p><a:r><a:t>Benchmark slide {index}</a:t></a:r></a:p></p:txBody></p:sp>'
+    )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><p:sld {_NSDECL}><p:cSld><p:spTree>'
+        '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+        '<p:grpSpPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/>'
+        '<a:chOff x="0" y="0"/><a:chExt cx="0" cy="0"/></a:xfrm></p:grpSpPr>'
+        f'{title}{shapes}</p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr>{timing}</p:sld>'
+    )
+
+
+def _video_timing(shape_id: int) -> str:
+    return (
+        '<p:timing><p:tnLst><p:par><p:cTn id="1" dur="indefinite" restart="never" nodeType="tmRoot">'
+        '<p:childTnLst><p:video><p:cMediaNode vol="80000"><p:cTn id="2" fill="hold" display="0">'
+        '<p:stCondLst><p:cond delay="indefinite"/></p:stCondLst></p:cTn>'
+        f'<p:tgtEl><p:spTgt spid="{shape_id}"/></p:tgtEl></p:cMediaNode></p:video>'
+        '</p:childTnLst></p:cTn></p:par></p:tnLst></p:timing>'
+    )
+
+
+_MASTER_XML = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><p:sldMaster {_NSDECL}><p:cSld><p:spTree>'
+    '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr><p:grpSpPr/>'
+    '</p:spTree></p:cSld>'
+    '<p:clrMap bg1="lt1" tx1="dk1" bg2="lt2" tx2="dk2" accent1="accent1" accent2="accent2" accent3="accent3" '
+    'accent4="accent4" accent5="accent5" accent6="accent6" hlink="hlink" folHlink="folHlink"/>'
+    '<p:sldLayoutIdLst><p:sldLayoutId id="2147483649" r:id="rId1"/></p:sldLayoutIdLst></p:sldMaster>'
+)
+_LAYOUT_XML = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><p:sldLayout {_NSDECL} type="titleOnly" preserve="1">'
+    '<p:cSld name="Title Only"><p:spTree><p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/>'
+    '</p:nvGrpSpPr><p:grpSpPr/></p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sldLayout>'
+)
+
+
+def _theme_xml() -> str:
+    colors = "".join(
+        f"<a:{name}><a:srgbClr val=\"{val}\"/></a:{name}>"
+        for name, val in (
+            ("dk1", "000000"), ("lt1", "FFFFFF"), ("dk2", "44546A"), ("lt2", "E7E6E6"),
+            ("accent1", "4472C4"), ("accent2", "ED7D31"), ("accent3", "A5A5A5"), ("accent4", "FFC000"),
+            ("accent5", "5B9BD5"), ("accent6", "70AD47"), ("hlink", "0563C1"), ("folHlink", "954F72"),
+        )
+    )
+    fill = "<a:solidFill><a:schemeClr val=\"phClr\"/></a:solidFill>"
+    line = "<a:ln w=\"6350\"><a:solidFill><a:schemeClr val=\"phClr\"/></a:solidFill></a:ln>"
+    effect = "<a:effectStyle><a:effectLst/></a:effectStyle>"
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<a:theme xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" name="Benchmark">'
+        f'<a:themeElements><a:clrScheme name="Benchmark">{colors}</a:clrScheme>'
+        '<a:fontScheme name="Benchmark"><a:majorFont><a:latin typeface="Arial"/><a:ea typeface=""/><a:cs typeface=""/>'
+        '</a:majorFont><a:minorFont><a:latin typeface="Arial"/><a:ea typeface=""/><a:cs typeface=""/></a:minorFont>'
+        '</a:fontScheme>'
+        f'<a:fmtScheme name="Benchmark"><a:fillStyleLst>{fill * 3}</a:fillStyleLst>'
+        f'<a:lnStyleLst>{line * 3}</a:lnStyleLst><a:effectStyleLst>{effect * 3}</a:effectStyleLst>'
+        f'<a:bgFillStyleLst>{fill * 3}</a:bgFillStyleLst></a:fmtScheme></a:themeElements></a:theme>'
+    )
+
+
+def make_synthetic_deck(path: str, slides: int = 30, videos: int = 3, video_bytes: int = 2 * 1024 * 1024,
+                        images: int = 30, image_size=(2400, 1600), image_format: str = "JPEG",
+                        seed: int = 0) -> dict:
+    """產生可重現的合成簡報，回傳其組成摘要。
+
+    圖片與影片平均分配到各頁；影片使用與 PowerPoint 相同的 a:videoFile + p14:media 結構
+    (含海報圖與播放時間軸)，影片與圖片以 STORED 存放，XML 以 DEFLATE 壓縮。"""
+    rng = random.Random(seed)
+    image_format = image_format.upper()
+    img_ext = {"JPEG": "jpeg", "PNG": "png", "BMP": "bmp", "TIFF": "tiff"}[image_format]
+    img_ctype = {"JPEG": "image/jpeg", "PNG": "image/png", "BMP": "image/bmp", "TIFF": "image/tiff"}[image_format]
+
+    members = []  # (name, data, compress_type)
+
+    def add(name, data, stored=False):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        members.append((name, data, zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED))
+
+    poster = _noise_image(rng, (640, 360), "PNG") if videos else None
+    if poster:
+        add("ppt/media/poster.png", poster, stored=True)
+
+    slide_shapes = {i: [] for i in range(1, slides + 1)}
+    for n in range(1, images + 1):
+        slide_shapes[(n - 1) % slides + 1].append(("image", n))
+    for n in range(1, videos + 1):
+        slide_shapes[(n - 1) * max(1, slides // max(1, videos)) % slides + 1].append(("video", n))
+
+    for n in range(1, images + 1):
+        add(f"ppt/media/image{n}.{img_ext}", _noise_image(rng, image_size, image_format), stored=True)
+    for n in range(1, videos + 1):
+        add(f"ppt/media/media{n}.mp4", rng.randbytes(video_bytes), stored=True)
+
+    for i in range(1, slides + 1):
+        rels = [("rId1", f"{_REL_BASE}/slideLayout", "../slideLayouts/slideLayout1.xml")]
+        shapes = []
+        timing = ""
+        shape_id = 3
+        for pos, (kind, n) in enumerate(slide_shapes[i]):
+            x = 457200 + (pos % 4) * 2057400
+            y = 1600200 + (pos // 4 % 3) * 1600200
+            if kind == "image":
+                rid = f"rId{len(rels) + 1}"
+                rels.append((rid, pp.IMAGE_REL_TYPE, f"../media/image{n}.{img_ext}"))
+                shapes.append(_pic_xml(shape_id, f"Picture {shape_id}", rid, x, y, 1828800, 1219200))
+            else:
+                video_rid, media_rid, poster_rid = (f"rId{len(rels) + k}" for k in (1, 2, 3))
+                rels.append((video_rid, f"{_REL_BASE}/video", f"../media/media{n}.mp4"))
+                rels.append((media_rid, _MEDIA_REL_TYPE, f"../media/media{n}.mp4"))
+                rels.append((poster_rid, pp.IMAGE_REL_TYPE, "../media/poster.png"))
+                shapes.append(_pic_xml(shape_id, f"media{n}", poster_rid, x, y, 3657600, 2057400,
+                                       video_rid=video_rid, media_rid=media_rid))
+                timing = _video_timing(shape_id)
+            shape_id += 1
+        add(f"ppt/slides/slide{i}.xml", _slide_xml(i, "".join(shapes), timing))
+        add(f"ppt/slides/_rels/slide{i}.xml.rels", _rels(rels))
+
+    pres_rels = [
+        ("rId1", f"{_REL_BASE}/slideMaster", "slideMasters/slideMaster1.xml"),
+        ("rId2", f"{_REL_BASE}/theme", "theme/theme1.xml"),
+    ] + [(f"rId{i + 2}", pp.SLIDE_REL_TYPE, f"slides/slide{i}.xml") for i in range(1, slides + 1)]
+    sld_ids = "".join(f'<p:sldId id="{255 + i}" r:id="rId{i + 2}"/>' for i in range(1, slides + 1))
+    add("ppt/presentation.xml", (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><p:presentation {_NSDECL}>'
+        '<p:sldMasterIdLst><p:sldMasterId id="2147483648" r:id="rId1"/></p:sldMasterIdLst>'
+        f'<p:sldIdLst>{sld_ids}</p:sldIdLst>'
+        f'<p:sldSz cx="{_SLIDE_CX}" cy="{_SLIDE_CY}"/><p:notesSz cx="6858000" cy="9144000"/></p:presentation>'
+    ))
+    add("ppt/_rels/presentation.xml.rels", _rels(pres_rels))
+    add("ppt/slideMasters/slideMaster1.xml", _MASTER_XML)
+    add("ppt/slideMasters/_rels/slideMaster1.xml.rels", _rels([
+        ("rId1", f"{_REL_BASE}/slideLayout", "../slideLayouts/slideLayout1.xml"),
+        ("rId2", f"{_REL_BASE}/theme", "../theme/theme1.xml"),
+    ]))
+    add("ppt/slideLayouts/slideLayout1.xml", _LAYOUT_XML)
+    add("ppt/slideLayouts/_rels/slideLayout1.xml.rels", _rels([
+        ("rId1", f"{_REL_BASE}/slideMaster", "../slideMasters/slideMaster1.xml"),
+    ]))
+    add("ppt/theme/theme1.xml", _theme_xml())
+    add("_rels/.rels", _rels([("rId1", f"{_REL_BASE}/officeDocument", "ppt/presentation.xml")]))
+
+    overrides = [
+        ("/ppt/presentation.xml", "application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml"),
+        ("/ppt/slideMasters/slideMaster1.xml", "application/vnd.openxmlformats-officedocument.presentationml.slideMaster+xml"),
+        ("/ppt/slideLayouts/slideLayout1.xml", "application/vnd.openxmlformats-officedocument.presentationml.slideLayout+xml"),
+        ("/ppt/theme/theme1.xml", "application/vnd.openxmlformats-officedocument.theme+xml"),
+    ] + [
+        (f"/ppt/slides/slide{i}.xml", "application/vnd.openxmlformats-officedocument.presentationml.slide+xml")
+        for i in range(1, slides + 1)
+    ]
+    defaults = [
+        ("rels", "application/vnd.openxmlformats-package.relationships+xml"),
+        ("xml", "application/xml"),
+        ("png", "image/png"),
+        ("mp4", "video/mp4"),
+        (img_ext, img_ctype),
+    ]
+    seen = set()
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        + "".join(
+            f'<Default Extension="{ext}" ContentType="{ctype}"/>'
+            for ext, ctype in defaults if not (ext in seen or seen.add(ext))
+        )
+        + "".join(f'<Override PartName="{name}" ContentType="{ctype}"/>' for name, ctype in overrides)
+        + "</Types>"
+    )
+
+    with zipfile.ZipFile(path, "w") as z:
+        info = zipfile.ZipInfo("[Content_Types].xml", date_time=_ZIP_DATE)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        z.writestr(info, content_types)
+        for name, data, compress_type in members:
+            info = zipfile.ZipInfo(name, date_time=_ZIP_DATE)
+            info.compress_type = compress_type
+            z.writestr(info, data)
+
+    return {
+        "slides": slides,
+        "videos": videos,
+        "video_bytes": video_bytes,
+        "images": images,
+        "image_size": list(image_size),
+        "image_format": image_format,
+        "seed": seed,
+        "deck_bytes": os.path.getsize(path),
+    }
+
+
+# =========================
+#  離線 Google 服務替身
+# =========================
+class _Call:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        return self._result
+
+
+class _UploadCall:
+    """模擬可續傳上傳：不讀檔、不經網路，一次完成。"""
+
+    def __init__(self, file_id: str):
+        self._file_id = file_id
+
+    def next_chunk(self):
+        return None, {"id": self._file_id, "webViewLink": f"https://drive.google.com/file/d/{self._file_id}/view"}
+
+    def execute(self):
+        return self.next_chunk()[1]
+
+
+class StubDriveService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def files(self):
+        return self
+
+    def permissions(self):
+        return self
+
+    def list(self, **kwargs):
+        return _Call({"files": []})
+
+    def create(self, body=None, media_body=None, fields=None, fileId=None, **kwargs):
+        if fileId is not None:
+            # permissions().create
+            return _Call({})
+        with self._lock:
+            self._count += 1
+            file_id = f"bench{self._count}"
+        return _UploadCall(file_id)
+
+
+def make_stub_bot() -> pp.PPTAutomationBot:
+    drive = StubDriveService()
+    return pp.PPTAutomationBot(
+        creds=object(), service_factory=lambda name, version, **kwargs: drive if name == "drive" else None
+    )
+
+
+# =========================
+#  量測
+# =========================
+class _PeakRSS:
+    """背景取樣本行程與所有子行程的 RSS 總和，記錄峰值。"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int:
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._sample())
+
+
+def _stage_replace(paths, params):
+    video_map = {
+        os.path.basename(name): f"https://drive.google.com/file/d/video{i}/view"
+        for i, name in enumerate(sorted(
+            n for n in zipfile.ZipFile(paths["deck"]).namelist() if pp._is_video_part(n)
+        ))
+    }
+    replaced = make_stub_bot().replace_videos_with_images(paths["deck"], paths["modified"], video_map)
+    return {"replaced": replaced, "output_bytes": os.path.getsize(paths["modified"])}
+
+
+def _input(paths, *names):
+    # 只跑部分項目時，前一步的產出可能不存在，改用原始簡報
+    for name in names:
+        if os.path.exists(paths[name]):
+            return paths[name]
+    return paths["deck"]
+
+
+def _stage_shrink(paths, params):
+    make_stub_bot().shrink_pptx(
+        _input(paths, "modified"), paths["slim"], workers=params["workers"], target_dpi=params.get("target_dpi")
+    )
+    return {"workers": params["workers"], "output_bytes": os.path.getsize(paths["slim"])}
+
+
+def _stage_split(paths, params):
+    source = _input(paths, "slim", "modified")
+    total = pp.PackageIndex(source).slide_count
+    parts = max(1, min(params["splits"], total))
+    step = -(-total // parts)
+    jobs = [
+        {"id": f"b{i}", "filename": f"part{i}", "start": start, "end": min(total, start + step - 1)}
+        for i, start in enumerate(range(1, total + 1, step))
+    ]
+    results = make_stub_bot().split_and_upload(source, jobs, "bench", max_workers=params["workers"])
+    return {"jobs": len(jobs), "uploaded": sum(1 for r in results if r.get("final_link"))}
+
+
+def _stage_prune(paths, params):
+    target = paths["prune"]
+    shutil.copyfile(paths["deck"], target)
+    make_stub_bot()._prune_pptx_package_fast(target)
+    return {"output_bytes": os.path.getsize(target)}
+
+
+def _stage_xml_helpers(paths, params):
+    # 各 XML 輔助函式分別計時 (重複 params["loops"] 次取總和)
+    loops = params["loops"]
+    timings = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings[name] = time.perf_counter() - start
+
+    with zipfile.ZipFile(paths["deck"]) as z:
+        rels = {n: z.read(n) for n in z.namelist() if n.endswith(".rels")}
+        slides = {n: z.read(n) for n in z.namelist() if n.startswith("ppt/slides/slide")}
+        presentation_xml = z.read("ppt/presentation.xml")
+        videos = [n for n in z.namelist() if pp._is_video_part(n)]
+    link_map = {n: f"https://drive.google.com/file/d/{i}/view" for i, n in enumerate(videos)}
+    index = pp.PackageIndex(paths["deck"])
+    keep = set(index.slide_rids[: max(1, len(index.slide_rids) // 2)])
+
+    timed("PackageIndex", lambda: pp.PackageIndex(paths["deck"]))
+    timed("scan_slide_titles", lambda: pp.scan_slide_titles(paths["deck"]))
+    timed("_strip_video_relationships", lambda: [pp._strip_video_relationships(x) for x in rels.values()])
+    timed("_filter_presentation_slides", lambda: pp._filter_presentation_slides(presentation_xml, keep))
+    timed("reachable_parts", lambda: index.reachable_parts(keep))
+    timed("_replace_media_shapes_with_links", lambda: [
+        pp._replace_media_shapes_with_links(
+            name, xml, rels[posixpath.join(posixpath.dirname(name), "_rels", posixpath.basename(name) + ".rels")],
+            link_map, pp.LINK_ICON_PART,
+        )
+        for name, xml in slides.items()
+    ])
+    return {"loops": loops, "helpers": timings}
+
+
+def _stage_publish(paths, params):
+    # 完整五步驟 + 試算表，連到本機替身；每次執行使用全新的執行紀錄與索引檔，不會被續跑跳過
+    import pipeline
+
+    run_dir = tempfile.mkdtemp(prefix="publish_", dir=paths["work_dir"])
+    os.chdir(run_dir)
+    config = FakeGoogleConfig(
+        latency=params["latency"],
+        upload_bandwidth=int(params["bandwidth_mbps"] * 1_000_000 / 8),
+        error_rate=params["error_rate"],
+        seed=params["seed"],
+    )
+    with FakeGoogle(config) as fake:
+        bot = pp.PPTAutomationBot(creds=object(), service_factory=fake.service_factory())
+        total = pp.PackageIndex(paths["deck"]).slide_count
+        step = -(-total // max(1, min(params["splits"], total)))
+        jobs = [
+            {"id": f"b{i}", "filename": f"part{i}", "start": start, "end": min(total, start + step - 1)}
+            for i, start in enumerate(range(1, total + 1, step))
+        ]
+        manifest = pp.RunManifest.for_source(paths["deck"], "bench", manifest_dir=os.path.join(run_dir, "manifests"))
+        outcome = pipeline.run_publish_pipeline(bot, paths["deck"], "bench", jobs, run_dir, manifest=manifest)
+        stats = fake.stats()
+    return {
+        "jobs": len(jobs),
+        "published": sum(1 for r in outcome["results"] if r.get("final_link")),
+        "api_calls": stats["total_calls"],
+        "calls": stats["calls"],
+        "injected_errors": sum(stats["injected_errors"].values()),
+        "bytes_uploaded": stats["bytes_uploaded"],
+        "upload_mb_per_second": stats["upload_mb_per_second"],
+    }
+
+
+STAGES = {
+    "replace_videos_with_images": _stage_replace,
+    "shrink_pptx": _stage_shrink,
+    "split_and_upload": _stage_split,
+    "prune_pptx_package_fast": _stage_prune,
+    "xml_helpers": _stage_xml_helpers,
+    "publish": _stage_publish,
+}
+# 預設不跑的項目 (需以 --stages 指定)
+OPTIONAL_STAGES = {"publish"}
+
+
+def _child(stage, paths, params, conn):
+    try:
+        os.chdir(paths["work_dir"])
+        with _PeakRSS() as rss:
+            start = time.perf_counter()
+            extra = STAGES[stage](paths, params)
+            seconds = time.perf_counter() - start
+        conn.send({"seconds": seconds, "peak_rss_bytes": rss.peak, "extra": extra})
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_stage(stage: str, paths: dict, params: dict, repeat: int = 1) -> dict:
+    # 使用平台預設的啟動方式，子行程內 shrink_pptx 的工作行程才與正式環境一致
+    ctx = multiprocessing.get_context()
+    runs = []
+    for _ in range(repeat):
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_child, args=(stage, paths, params, child_conn))
+        proc.start()
+        child_conn.close()
+        result = parent_conn.recv()
+        proc.join()
+        if "error" in result:
+            return {"stage": stage, "params": params, "error": result["error"]}
+        runs.append(result)
+
+    seconds = [r["seconds"] for r in runs]
+    return {
+        "stage": stage,
+        "params": params,
+        "seconds_min": min(seconds),
+        "seconds_median": statistics.median(seconds),
+        "seconds": seconds,
+        "peak_rss_mb": max(r["peak_rss_bytes"] for r in runs) / (1024 * 1024),
+        "extra": runs[-1]["extra"],
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _result_key(result: dict) -> str:
+    workers = result.get("params", {}).get("workers")
+    return f"{result['stage']}[workers={workers}]" if workers is not None else result["stage"]
+
+
+def compare(baseline: dict, current: dict) -> str:
+    old = {_result_key(r): r for r in baseline.get("results", []) if "error" not in r}
+    lines = [f"{'stage':<42}{'seconds':>22}{'peak RSS MB':>26}"]
+    for r in current.get("results", []):
+        key = _result_key(r)
+        if "error" in r or key not in old:
+            continue
+        before = old[key]
+        lines.append(
+            f"{key:<42}{before['seconds_min']:>8.3f} → {r['seconds_min']:<8.3f}({r['seconds_min'] / max(before['seconds_min'], 1e-9):>4.2f}x)"
+            f"{before['peak_rss_mb']:>8.1f} → {r['peak_rss_mb']:<8.1f}({r['peak_rss_mb'] / max(before['peak_rss_mb'], 1e-9):>4.2f}x)"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic deck.")
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--videos", type=int, default=3)
+    parser.add_argument("--video-mb", type=float, default=2.0)
+    parser.add_argument("--images", type=int, default=30)
+    parser.add_argument("--image-size", default="2400x1600", help="WIDTHxHEIGHT")
+    parser.add_argument("--image-format", default="JPEG", choices=["JPEG", "PNG", "BMP", "TIFF"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--splits", type=int, default=4, help="number of split jobs for split_and_upload")
+    parser.add_argument("--shrink-workers", default="1,4", help="comma-separated worker counts for shrink_pptx")
+    parser.add_argument("--shrink-dpi", type=int, default=0,
+                        help="shrink_pptx: downsample to displayed size at this DPI (0 = 1280px cap only)")
+    parser.add_argument("--upload-workers", type=int, default=3)
+    parser.add_argument("--xml-loops", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; min and median are reported")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="publish: seconds added to every API call")
+    parser.add_argument("--fake-bandwidth-mbps", type=float, default=0.0,
+                        help="publish: shared upload cap in megabits/s (0 = unlimited)")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0, help="publish: fraction of calls failing with 429/5xx")
+    parser.add_argument("--stages", default=",".join(s for s in STAGES if s not in OPTIONAL_STAGES),
+                        help=f"comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    work_dir = tempfile.mkdtemp(prefix="pptx_bench_")
+    paths = {
+        "work_dir": work_dir,
+        "deck": os.path.join(work_dir, "deck.pptx"),
+        "modified": os.path.join(work_dir, "modified.pptx"),
+        "slim": os.path.join(work_dir, "slim.pptx"),
+        "prune": os.path.join(work_dir, "prune.pptx"),
+    }
+
+    try:
+        deck = make_synthetic_deck(
+            paths["deck"], slides=args.slides, videos=args.videos,
+            video_bytes=int(args.video_mb * 1024 * 1024), images=args.images,
+            image_size=(width, height), image_format=args.image_format, seed=args.seed,
+        )
+        stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+        results = []
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            if stage == "shrink_pptx":
+                for workers in (int(w) for w in args.shrink_workers.split(",")):
+                    params = {"workers": workers, "target_dpi": args.shrink_dpi or None}
+                    results.append(run_stage(stage, paths, params, args.repeat))
+            elif stage == "split_and_upload":
+                params = {"splits": args.splits, "workers": args.upload_workers}
+                results.append(run_stage(stage, paths, params, args.repeat))
+            elif stage == "xml_helpers":
+                results.append(run_stage(stage, paths, {"loops": args.xml_loops}, args.repeat))
+            elif stage == "publish":
+                params = {
+                    "splits": args.splits, "latency": args.fake_latency, "bandwidth_mbps": args.fake_bandwidth_mbps,
+                    "error_rate": args.fake_error_rate, "seed": args.seed,
+                }
+                results.append(run_stage(stage, paths, params, args.repeat))
+            else:
+                results.append(run_stage(stage, paths, {}, args.repeat))
+        for r in results:
+            if "error" in r:
+                print(f"❌ {_result_key(r)}: {r['error']}", file=sys.stderr)
+            else:
+                print(f"✅ {_result_key(r)}: {r['seconds_min']:.3f}s, {r['peak_rss_mb']:.1f} MB", file=sys.stderr)
+
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "deck": deck,
+            "results": results,
+        }
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            print(text)
+
+        if args.compare:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                print(compare(json.load(f), report), file=sys.stderr)
+        return 1 if any("error" in r for r in results) else 0
+    finally:
+        if args.keep:
+            print(f"工作目錄保留於 {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,837 @@
+"""本機 Google API 替身 (Drive / Slides / Sheets)，供離線壓力測試使用。
+
+以真正的 googleapiclient 連到本機 HTTP 伺服器，因此可續傳上傳、分頁列表與錯誤處理都走
+與正式環境相同的程式路徑。可設定每次呼叫的延遲、上傳頻寬上限、429/5xx 隨機錯誤與
+每個 API 的配額，並統計每個方法的呼叫數：
+
+    with FakeGoogle(FakeGoogleConfig(latency=0.05, upload_bandwidth=20 * 1024 * 1024)) as fake:
+        bot = PPTAutomationBot(creds=object(), service_factory=fake.service_factory())
+        ...
+        print(fake.stats())
+
+也可獨立執行 (python fake_google.py --port 8765)，再以 service_factory(url) 連線。
+"""
+
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import httplib2
+from googleapiclient.discovery import build
+
+PRESENTATION_MIME = "application/vnd.google-apps.presentation"
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+_PML_NS = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# 各服務在替身伺服器上的路徑前綴 (對應 discovery 文件的 servicePath)
+_API_ENDPOINTS = {
+    "drive": "/drive/v3/",
+    "slides": "/slides/",
+    "sheets": "/sheets/",
+}
+
+
+class FakeGoogleConfig:
+    """替身伺服器的行為設定。
+
+    latency：每次呼叫的基本延遲 (秒)；latency_overrides 可依方法 (例如 "drive.files.upload") 覆寫。
+    upload_bandwidth：所有上傳共用的頻寬上限 (bytes/秒，0 為不限)。
+    error_rate / error_codes：隨機注入的錯誤比例與狀態碼；error_methods 限定注入的方法。
+    quotas：{"drive": (次數, 秒數)}，超過時回 429 rateLimitExceeded。
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, latency_overrides: Optional[Dict[str, float]] = None,
+                 upload_bandwidth: int = 0, error_rate: float = 0.0, error_codes: Tuple[int, ...] = (429, 500, 503),
+                 error_methods: Optional[set] = None, quotas: Optional[Dict[str, Tuple[int, float]]] = None,
+                 page_size_limit: int = 1000, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.latency_overrides = latency_overrides or {}
+        self.upload_bandwidth = upload_bandwidth
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.error_methods = set(error_methods) if error_methods else None
+        self.quotas = quotas or {}
+        self.page_size_limit = page_size_limit
+        self.seed = seed
+
+
+class _ApiError(Exception):
+    def __init__(self, code: int, message: str, reason: str = "backendError"):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.reason = reason
+
+    def body(self) -> dict:
+        return {"error": {"code": self.code, "message": self.message,
+                          "errors": [{"reason": self.reason, "message": self.message}]}}
+
+
+# =========================
+#  Drive 查詢語法 (q)
+# =========================
+_TOKEN_RE = re.compile(r"\s*(?:(?P<str>'(?:[^'\\]|\\.)*')|(?P<op>!=|=|<=|>=|<|>|\(|\)|\{|\})|(?P<word>[A-Za-z_][\w.]*))")
+
+
+def _tokenize(q: str) -> List[Tuple[str, str]]:
+    tokens, pos = [], 0
+    while pos < len(q):
+        if q[pos:].strip() == "":
+            break
+        m = _TOKEN_RE.match(q, pos)
+        if not m:
+            raise _ApiError(400, f"Invalid Value: q ({q[pos:pos + 20]})", "invalid")
+        pos = m.end()
+        if m.group("str") is not None:
+            tokens.append(("str", re.sub(r"\\(.)", r"\1", m.group("str")[1:-1])))
+        elif m.group("op") is not None:
+            tokens.append(("op", m.group("op")))
+        else:
+            tokens.append(("word", m.group("word")))
+    return tokens
+
+
+_NAME_TERM_RE = re.compile(r"\w+")
+
+
+def _name_contains(name: str, value: str) -> bool:
+    """Drive 的 name contains：檔名與查詢值都先斷成詞 (標點與空白為分隔)，
+    查詢的詞須在檔名中連續出現，最後一個詞只需為檔名詞的前綴。
+    因此 'World' 不會命中 "HelloWorld"，'[deck]_' 也只比對 deck 這個詞。"""
+    terms = [t.lower() for t in _NAME_TERM_RE.findall(name)]
+    wanted = [t.lower() for t in _NAME_TERM_RE.findall(value)]
+    if not wanted:
+        return False
+    *head, last = wanted
+    for i in range(len(terms) - len(wanted) + 1):
+        if terms[i:i + len(head)] == head and terms[i + len(head)].startswith(last):
+            return True
+    return False
+
+
+class _QueryParser:
+    """支援 and / or / not、括號，以及 name、mimeType、trashed、owners、parents、appProperties 條件。"""
+
+    def __init__(self, q: str):
+        self.tokens = _tokenize(q)
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            return lambda f: True
+        pred = self._expr()
+        if self.pos != len(self.tokens):
+            raise _ApiError(400, "Invalid Value: q", "invalid")
+        return pred
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _take(self):
+        tok = self._peek()
+        self.pos += 1
+        return tok
+
+    def _expr(self):
+        preds = [self._term()]
+        while self._peek() == ("word", "or"):
+            self._take()
+            preds.append(self._term())
+        return lambda f: any(p(f) for p in preds)
+
+    def _term(self):
+        preds = [self._factor()]
+        while self._peek() == ("word", "and"):
+            self._take()
+            preds.append(self._factor())
+        return lambda f: all(p(f) for p in preds)
+
+    def _factor(self):
+        tok = self._peek()
+        if tok == ("word", "not"):
+            self._take()
+            inner = self._factor()
+            return lambda f: not inner(f)
+        if tok == ("op", "("):
+            self._take()
+            inner = self._expr()
+            if self._take() != ("op", ")"):
+                raise _ApiError(400, "Invalid Value: q", "invalid")
+            return inner
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._take()
+        if left[0] == "str":
+            # 'value' in owners / parents
+            if self._take() != ("word", "in"):
+                raise _ApiError(400, "Invalid Value: q", "invalid")
+            field = self._take()[1]
+            value = left[1]
+            if field == "owners":
+                return lambda f: value in ("me",) + tuple(f.get("owners", []))
+            return lambda f: value in f.get(field, [])
+
+        field = left[1]
+        op = self._take()[1]
+        if op == "has":
+            # appProperties has { key='k' and value='v' }
+            key, val = self._property_pair()
+            return lambda f: f.get(field, {}).get(key) == val
+        kind, raw = self._take()
+        value = raw if kind == "str" else {"true": True, "false": False}.get(raw, raw)
+
+        if op == "contains":
+            if field == "name":
+                return lambda f: _name_contains(str(f.get(field, "")), value)
+            return lambda f: value in str(f.get(field, ""))
+        if op == "=":
+            return lambda f: f.get(field) == value
+        if op == "!=":
+            return lambda f: f.get(field) != value
+        raise _ApiError(400, f"Invalid Value: q (operator {op})", "invalid")
+
+    def _property_pair(self) -> Tuple[str, str]:
+        expected = [("op", "{"), ("word", "key"), ("op", "="), None, ("word", "and"),
+                    ("word", "value"), ("op", "="), None, ("op", "}")]
+        values = []
+        for want in expected:
+            tok = self._take()
+            if want is None and tok[0] == "str":
+                values.append(tok[1])
+            elif tok != want:
+                raise _ApiError(400, "Invalid Value: q", "invalid")
+        return values[0], values[1]
+
+
+# =========================
+#  PPTX → 簡報 JSON (簡化版轉檔)
+# =========================
+def _convert_pptx(data: bytes) -> dict:
+    """只保留 embed_videos_in_slides 需要的資訊：投影片順序與圖片的超連結、位置。"""
+    slides = []
+    try:
+        z = zipfile.ZipFile(io.BytesIO(data))
+        pres = ET.fromstring(z.read("ppt/presentation.xml"))
+        rels = ET.fromstring(z.read("ppt/_rels/presentation.xml.rels"))
+    except Exception:
+        return {"slides": slides}
+
+    targets = {r.get("Id"): r.get("Target") for r in rels.findall(f"{{{_PKG_REL_NS}}}Relationship")}
+    for n, sld_id in enumerate(pres.iterfind(f".//{{{_PML_NS}}}sldIdLst/{{{_PML_NS}}}sldId"), start=1):
+        target = targets.get(sld_id.get(f"{{{_R_NS}}}id"), "")
+        part = "ppt/" + target.lstrip("/").replace("ppt/", "", 1) if not target.startswith("/") else target.lstrip("/")
+        page_id = f"p{n}"
+        elements = []
+        try:
+            root = ET.fromstring(z.read(part))
+            folder, name = part.rsplit("/", 1)
+            slide_rels = ET.fromstring(z.read(f"{folder}/_rels/{name}.rels"))
+            links = {
+                r.get("Id"): r.get("Target") for r in slide_rels.findall(f"{{{_PKG_REL_NS}}}Relationship")
+                if r.get("TargetMode") == "External"
+            }
+        except Exception:
+            slides.append({"objectId": page_id, "pageElements": elements})
+            continue
+
+        sp_tree = root.find(f"{{{_PML_NS}}}cSld/{{{_PML_NS}}}spTree")
+        for shape in list(sp_tree) if sp_tree is not None else []:
+            tag = shape.tag.split("}")[-1]
+            if tag not in ("pic", "sp"):
+                continue
+            c_nv_pr = shape.find(f".//{{{_PML_NS}}}cNvPr")
+            off = shape.find(f".//{{{_A_NS}}}xfrm/{{{_A_NS}}}off")
+            ext = shape.find(f".//{{{_A_NS}}}xfrm/{{{_A_NS}}}ext")
+            element = {
+                "objectId": f"{page_id}_{c_nv_pr.get('id') if c_nv_pr is not None else len(elements)}",
+                "size": {
+                    "width": {"magnitude": int(ext.get("cx", 0)) if ext is not None else 0, "unit": "EMU"},
+                    "height": {"magnitude": int(ext.get("cy", 0)) if ext is not None else 0, "unit": "EMU"},
+                },
+                "transform": {
+                    "scaleX": 1, "scaleY": 1,
+                    "translateX": int(off.get("x", 0)) if off is not None else 0,
+                    "translateY": int(off.get("y", 0)) if off is not None else 0,
+                    "unit": "EMU",
+                },
+            }
+            if tag == "pic":
+                image = {"contentUrl": f"https://lh3.googleusercontent.com/fake/{uuid.uuid4().hex}"}
+                hlink = c_nv_pr.find(f"{{{_A_NS}}}hlinkClick") if c_nv_pr is not None else None
+                if hlink is not None and hlink.get(f"{{{_R_NS}}}id") in links:
+                    image["imageProperties"] = {"link": {"url": links[hlink.get(f"{{{_R_NS}}}id")]}}
+                element["image"] = image
+            else:
+                element["shape"] = {"shapeType": "TEXT_BOX"}
+            elements.append(element)
+        slides.append({"objectId": page_id, "pageElements": elements})
+    return {"slides": slides}
+
+
+# =========================
+#  試算表範圍
+# =========================
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - 64)
+    return n - 1
+
+
+def _parse_range(a1: str) -> Tuple[str, int, int, Optional[int], Optional[int]]:
+    """'Sheet!A5:J' → (sheet, 起始欄, 結束欄, 起始列(0-based) 或 None, 結束列 或 None)。"""
+    sheet, _, cells = a1.rpartition("!")
+    sheet = sheet.strip("'") or "Sheet1"
+    start, _, end = cells.partition(":")
+    end = end or start
+    m1 = re.fullmatch(r"([A-Za-z]+)(\d*)", start)
+    m2 = re.fullmatch(r"([A-Za-z]+)(\d*)", end)
+    if not m1 or not m2:
+        raise _ApiError(400, f"Unable to parse range: {a1}", "badRequest")
+    row_start = int(m1.group(2)) - 1 if m1.group(2) else None
+    row_end = int(m2.group(2)) - 1 if m2.group(2) else None
+    return sheet, _col_index(m1.group(1)), _col_index(m2.group(1)), row_start, row_end
+
+
+# =========================
+#  狀態與統計
+# =========================
+class _State:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.files: Dict[str, dict] = {}
+        self.file_order: List[str] = []
+        self.uploads: Dict[str, dict] = {}
+        self.presentations: Dict[str, dict] = {}
+        self.sheets: Dict[str, Dict[str, List[List[str]]]] = defaultdict(lambda: defaultdict(list))
+        self._counter = 0
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock:
+            self._counter += 1
+            return f"{prefix}{self._counter:06d}{uuid.uuid4().hex[:6]}"
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.throttled = defaultdict(int)
+        self.bytes_uploaded = 0
+        self.files_created = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "elapsed_seconds": elapsed,
+                "calls": dict(self.calls),
+                "total_calls": sum(self.calls.values()),
+                "injected_errors": dict(self.errors),
+                "throttled": dict(self.throttled),
+                "bytes_uploaded": self.bytes_uploaded,
+                "files_created": self.files_created,
+                "upload_mb_per_second": self.bytes_uploaded / (1024 * 1024) / elapsed if elapsed else 0.0,
+            }
+
+
+class _Link:
+    """所有上傳共用的頻寬：每個分段依序佔用上行時間。"""
+
+    def __init__(self, bandwidth: int):
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.free_at = 0.0
+
+    def transfer(self, nbytes: int) -> None:
+        if not self.bandwidth or not nbytes:
+            return
+        with self.lock:
+            start = max(time.monotonic(), self.free_at)
+            self.free_at = start + nbytes / self.bandwidth
+            done_at = self.free_at
+        delay = done_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# =========================
+#  HTTP 伺服器
+# =========================
+class FakeGoogle:
+    def __init__(self, config: Optional[FakeGoogleConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeGoogleConfig()
+        self.state = _State()
+        self._stats = _Stats()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._quota_lock = threading.Lock()
+        self._quota_calls = defaultdict(deque)
+        self._link = _Link(self.config.upload_bandwidth)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # --- 生命週期 ---
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGoogle":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def service_factory(self):
+        return service_factory(self.url)
+
+    # --- 統計與預置資料 ---
+    def stats(self) -> dict:
+        return self._stats.snapshot()
+
+    def reset_stats(self) -> None:
+        self._stats = _Stats()
+
+    def seed_drive_file(self, name: str, mime_type: str = "video/mp4", content: bytes = b"",
+                        app_properties: Optional[Dict[str, str]] = None) -> dict:
+        return self._create_file({"name": name, "mimeType": mime_type, "appProperties": app_properties}, content, mime_type)
+
+    def seed_sheet(self, spreadsheet_id: str, sheet: str, rows: List[List[str]]) -> None:
+        with self.state.lock:
+            self.state.sheets[spreadsheet_id][sheet].extend([list(map(str, r)) for r in rows])
+
+    def sheet_rows(self, spreadsheet_id: str, sheet: str) -> List[List[str]]:
+        with self.state.lock:
+            return [list(r) for r in self.state.sheets[spreadsheet_id][sheet]]
+
+    # --- 錯誤與延遲注入 ---
+    def _admit(self, method_id: str) -> None:
+        cfg = self.config
+        api = method_id.split(".", 1)[0]
+        with self._stats.lock:
+            self._stats.calls[method_id] += 1
+
+        if api in cfg.quotas:
+            limit, window = cfg.quotas[api]
+            now = time.monotonic()
+            with self._quota_lock:
+                calls = self._quota_calls[api]
+                while calls and now - calls[0] > window:
+                    calls.popleft()
+                if len(calls) >= limit:
+                    with self._stats.lock:
+                        self._stats.throttled[method_id] += 1
+                    raise _ApiError(429, "Quota exceeded for quota metric 'Queries'.", "rateLimitExceeded")
+                calls.append(now)
+
+        if cfg.error_rate and (cfg.error_methods is None or method_id in cfg.error_methods):
+            with self._rng_lock:
+                hit = self._rng.random() < cfg.error_rate
+                code = self._rng.choice(cfg.error_codes) if hit else None
+            if hit:
+                with self._stats.lock:
+                    self._stats.errors[f"{method_id}:{code}"] += 1
+                if code == 429:
+                    raise _ApiError(429, "User rate limit exceeded.", "userRateLimitExceeded")
+                raise _ApiError(code, "Backend Error", "backendError")
+
+        delay = cfg.latency_overrides.get(method_id, cfg.latency)
+        if cfg.jitter:
+            with self._rng_lock:
+                delay += self._rng.uniform(0, cfg.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    # --- Drive ---
+    def _file_resource(self, f: dict) -> dict:
+        return {k: v for k, v in f.items() if not k.startswith("_")}
+
+    def _create_file(self, metadata: dict, content: Optional[bytes], content_type: str) -> dict:
+        file_id = self.state.new_id("f")
+        mime_type = metadata.get("mimeType") or content_type or "application/octet-stream"
+        record = {
+            "kind": "drive#file",
+            "id": file_id,
+            "name": metadata.get("name", "Untitled"),
+            "mimeType": mime_type,
+            "trashed": False,
+            "parents": metadata.get("parents", []),
+        }
+        if metadata.get("appProperties"):
+            record["appProperties"] = dict(metadata["appProperties"])
+        if mime_type == PRESENTATION_MIME:
+            record["webViewLink"] = f"https://docs.google.com/presentation/d/{file_id}/edit?usp=drivesdk"
+            with self.state.lock:
+                self.state.presentations[file_id] = dict(_convert_pptx(content or b""), presentationId=file_id)
+        else:
+            record["webViewLink"] = f"https://drive.google.com/file/d/{file_id}/view?usp=drivesdk"
+            if content is not None:
+                record["md5Checksum"] = hashlib.md5(content).hexdigest()
+                record["size"] = str(len(content))
+        with self.state.lock:
+            self.state.files[file_id] = record
+            self.state.file_order.append(file_id)
+        with self._stats.lock:
+            self._stats.files_created += 1
+        return record
+
+    def _drive_list(self, query: dict) -> dict:
+        pred = _QueryParser(query.get("q", [""])[0]).parse()
+        page_size = min(int(query.get("pageSize", ["100"])[0]), self.config.page_size_limit)
+        offset = int(query.get("pageToken", ["0"])[0] or 0)
+        with self.state.lock:
+            matched = [self.state.files[i] for i in self.state.file_order if pred(self.state.files[i])]
+        page = matched[offset:offset + page_size]
+        body = {"kind": "drive#fileList", "files": [self._file_resource(f) for f in page]}
+        if offset + page_size < len(matched):
+            body["nextPageToken"] = str(offset + page_size)
+        return body
+
+    def _start_upload(self, handler, query: dict, body: bytes) -> None:
+        upload_type = query.get("uploadType", [""])[0]
+        if upload_type == "resumable":
+            upload_id = self.state.new_id("u")
+            with self.state.lock:
+                self.state.uploads[upload_id] = {
+                    "metadata": json.loads(body or b"{}"),
+                    "content_type": handler.headers.get("X-Upload-Content-Type", ""),
+                    "buffer": bytearray(),
+                }
+            location = f"{self.url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            handler.send_json(200, {}, headers={"Location": location})
+            return
+
+        if upload_type == "multipart":
+            msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {handler.headers.get('Content-Type')}\r\n\r\n".encode() + body
+            )
+            parts = list(msg.iter_parts())
+            metadata = json.loads(parts[0].get_payload(decode=True) or b"{}")
+            content = parts[1].get_payload(decode=True) if len(parts) > 1 else b""
+            self._link.transfer(len(content))
+            with self._stats.lock:
+                self._stats.bytes_uploaded += len(content)
+            ctype = parts[1].get_content_type() if len(parts) > 1 else ""
+            handler.send_json(200, self._file_resource(self._create_file(metadata, content, ctype)))
+            return
+
+        # uploadType=media
+        self._link.transfer(len(body))
+        with self._stats.lock:
+            self._stats.bytes_uploaded += len(body)
+        handler.send_json(200, self._file_resource(self._create_file({}, body, handler.headers.get("Content-Type", ""))))
+
+    def _upload_chunk(self, handler, query: dict, body: bytes) -> None:
+        upload_id = query.get("upload_id", [""])[0]
+        with self.state.lock:
+            session = self.state.uploads.get(upload_id)
+        if session is None:
+            raise _ApiError(404, "Upload session not found.", "notFound")
+
+        content_range = handler.headers.get("Content-Range", "")
+        m = re.fullmatch(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", content_range.strip()) if content_range else None
+        total = int(m.group(3)) if m and m.group(3) != "*" else None
+
+        if body:
+            start = int(m.group(1)) if m and m.group(1) else len(session["buffer"])
+            if start != len(session["buffer"]):
+                # 客戶端重送：以伺服器目前收到的位置為準
+                del session["buffer"][start:]
+            self._link.transfer(len(body))
+            session["buffer"].extend(body)
+            with self._stats.lock:
+                self._stats.bytes_uploaded += len(body)
+
+        received = len(session["buffer"])
+        if total is None or received < total:
+            headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+            handler.send_json(308, None, headers=headers)
+            return
+
+        with self.state.lock:
+            self.state.uploads.pop(upload_id, None)
+        record = self._create_file(session["metadata"], bytes(session["buffer"]), session["content_type"])
+        handler.send_json(200, self._file_resource(record))
+
+    # --- Slides ---
+    def _batch_update(self, presentation_id: str, body: dict) -> dict:
+        with self.state.lock:
+            pres = self.state.presentations.get(presentation_id)
+            if pres is None:
+                raise _ApiError(404, f"Requested entity was not found.", "notFound")
+            replies = []
+            for req in body.get("requests", []):
+                if "createVideo" in req:
+                    spec = req["createVideo"]
+                    page_id = spec.get("elementProperties", {}).get("pageObjectId")
+                    page = next((s for s in pres["slides"] if s["objectId"] == page_id), None)
+                    if page is None:
+                        raise _ApiError(400, f"Invalid requests: page {page_id} not found", "badRequest")
+                    object_id = spec.get("objectId") or self.state.new_id("v")
+                    page["pageElements"].append({
+                        "objectId": object_id,
+                        "size": spec.get("elementProperties", {}).get("size"),
+                        "transform": spec.get("elementProperties", {}).get("transform"),
+                        "video": {"id": spec.get("id"), "source": spec.get("source", "DRIVE")},
+                    })
+                    replies.append({"createVideo": {"objectId": object_id}})
+                elif "deleteObject" in req:
+                    object_id = req["deleteObject"].get("objectId")
+                    for page in pres["slides"]:
+                        before = len(page["pageElements"])
+                        page["pageElements"] = [e for e in page["pageElements"] if e.get("objectId") != object_id]
+                        if len(page["pageElements"]) != before:
+                            break
+                    else:
+                        raise _ApiError(400, f"Invalid requests: object {object_id} not found", "badRequest")
+                    replies.append({})
+                else:
+                    replies.append({})
+            return {"presentationId": presentation_id, "replies": replies}
+
+    # --- Sheets ---
+    def _values_get(self, spreadsheet_id: str, a1: str) -> dict:
+        sheet, c0, c1, r0, r1 = _parse_range(a1)
+        with self.state.lock:
+            rows = self.state.sheets[spreadsheet_id][sheet]
+            end = len(rows) if r1 is None else min(len(rows), r1 + 1)
+            picked = [list(r[c0:c1 + 1]) for r in rows[(r0 or 0):end]]
+        while picked and not any(picked[-1]):
+            picked.pop()
+        picked = [r if any(r) else [] for r in picked]
+        result = {"range": a1, "majorDimension": "ROWS"}
+        if picked:
+            result["values"] = picked
+        return result
+
+    def _values_append(self, spreadsheet_id: str, a1: str, body: dict) -> dict:
+        sheet = _parse_range(a1)[0]
+        values = body.get("values", [])
+        with self.state.lock:
+            rows = self.state.sheets[spreadsheet_id][sheet]
+            start = len(rows) + 1
+            rows.extend([[str(v) for v in r] for r in values])
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "updates": {
+                "updatedRange": f"{sheet}!A{start}:J{start + len(values) - 1}",
+                "updatedRows": len(values),
+            },
+        }
+
+    # --- 路由 ---
+    def _route(self, handler, verb: str, path: str, query: dict, body: bytes) -> None:
+        if verb == "POST" and path == "/upload/drive/v3/files":
+            self._admit("drive.files.create")
+            return self._start_upload(handler, query, body)
+        if verb == "PUT" and path == "/upload/drive/v3/files":
+            self._admit("drive.files.upload")
+            return self._upload_chunk(handler, query, body)
+        if verb == "GET" and path == "/drive/v3/files":
+            self._admit("drive.files.list")
+            return handler.send_json(200, self._drive_list(query))
+        if verb == "POST" and path == "/drive/v3/files":
+            self._admit("drive.files.create")
+            return handler.send_json(200, self._file_resource(self._create_file(json.loads(body or b"{}"), None, "")))
+        m = re.fullmatch(r"/drive/v3/files/([^/]+)/permissions", path)
+        if verb == "POST" and m:
+            self._admit("drive.permissions.create")
+            if m.group(1) not in self.state.files:
+                raise _ApiError(404, f"File not found: {m.group(1)}.", "notFound")
+            perm = json.loads(body or b"{}")
+            return handler.send_json(200, dict(perm, kind="drive#permission", id=self.state.new_id("perm")))
+        if verb == "GET" and path == "/drive/v3/about":
+            self._admit("drive.about.get")
+            return handler.send_json(200, {"user": {"emailAddress": "fake-robot@example.com", "displayName": "Fake"}})
+
+        m = re.fullmatch(r"/slides/v1/presentations/([^/:]+):batchUpdate", path)
+        if verb == "POST" and m:
+            self._admit("slides.presentations.batchUpdate")
+            return handler.send_json(200, self._batch_update(m.group(1), json.loads(body or b"{}")))
+        m = re.fullmatch(r"/slides/v1/presentations/([^/:]+)", path)
+        if verb == "GET" and m:
+            self._admit("slides.presentations.get")
+            with self.state.lock:
+                pres = self.state.presentations.get(m.group(1))
+                payload = json.loads(json.dumps(pres)) if pres else None
+            if payload is None:
+                raise _ApiError(404, "Requested entity was not found.", "notFound")
+            return handler.send_json(200, payload)
+
+        m = re.fullmatch(r"/sheets/v4/spreadsheets/([^/]+)/values:batchGet", path)
+        if verb == "GET" and m:
+            self._admit("sheets.values.batchGet")
+            ranges = query.get("ranges", [])
+            return handler.send_json(200, {
+                "spreadsheetId": m.group(1),
+                "valueRanges": [self._values_get(m.group(1), r) for r in ranges],
+            })
+        m = re.fullmatch(r"/sheets/v4/spreadsheets/([^/]+)/values/(.+):append", path)
+        if verb == "POST" and m:
+            self._admit("sheets.values.append")
+            return handler.send_json(200, self._values_append(m.group(1), m.group(2), json.loads(body or b"{}")))
+        m = re.fullmatch(r"/sheets/v4/spreadsheets/([^/]+)/values/(.+)", path)
+        if verb == "GET" and m:
+            self._admit("sheets.values.get")
+            return handler.send_json(200, self._values_get(m.group(1), m.group(2)))
+
+        raise _ApiError(404, f"Not found: {verb} {path}", "notFound")
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, payload, headers: Optional[dict] = None):
+                data = b"" if payload is None else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                if payload is not None:
+                    self.send_header("Content-Type", "application/json; charset=UTF-8")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, verb: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parsed = urllib.parse.urlsplit(self.path)
+                path = urllib.parse.unquote(parsed.path)
+                query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+                try:
+                    fake._route(self, verb, path, query, body)
+                except _ApiError as e:
+                    self.send_json(e.code, e.body())
+                except Exception as e:
+                    self.send_json(500, _ApiError(500, f"Fake server error: {e}").body())
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+        return Handler
+
+
+class _LocalHttp(httplib2.Http):
+    """discovery 文件的上傳網址固定為 https；連到替身伺服器時改回 http。"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        # 與 googleapiclient.http.build_http 相同：308 代表續傳未完成，不可當作轉址
+        self.redirect_codes = self.redirect_codes - {308}
+        parsed = urllib.parse.urlsplit(base_url)
+        self._https_prefix = f"https://{parsed.netloc}"
+        self._http_prefix = f"http://{parsed.netloc}"
+
+    def request(self, uri, *args, **kwargs):
+        if uri.startswith(self._https_prefix):
+            uri = self._http_prefix + uri[len(self._https_prefix):]
+        return super().request(uri, *args, **kwargs)
+
+
+def service_factory(url: str):
+    """回傳 service_factory(name, version, **build_kwargs)，以 googleapiclient 連到指定的替身伺服器。"""
+    url = url.rstrip("/")
+
+    def factory(name: str, version: str, **build_kwargs):
+        return build(
+            name, version,
+            http=_LocalHttp(url),
+            client_options={"api_endpoint": url + _API_ENDPOINTS[name]},
+            static_discovery=True,
+            cache_discovery=False,
+            **build_kwargs,
+        )
+
+    return factory
+
+
+def _parse_quota(values: List[str]) -> Dict[str, Tuple[int, float]]:
+    quotas = {}
+    for item in values or []:
+        api, _, spec = item.partition("=")
+        limit, _, window = spec.partition("/")
+        quotas[api] = (int(limit), float(window or 60))
+    return quotas
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a local Drive/Slides/Sheets stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, seconds")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="shared upload cap in megabits/s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="429,500,503")
+    parser.add_argument("--quota", action="append", help="API=LIMIT/SECONDS, e.g. drive=1000/100 (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = FakeGoogleConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        upload_bandwidth=int(args.bandwidth_mbps * 1_000_000 / 8),
+        error_rate=args.error_rate,
+        error_codes=tuple(int(c) for c in args.error_codes.split(",") if c),
+        quotas=_parse_quota(args.quota),
+        seed=args.seed,
+    )
+    fake = FakeGoogle(config, host=args.host, port=args.port).start()
+    print(f"Fake Google APIs listening on {fake.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(fake.stats(), indent=2))
+        fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
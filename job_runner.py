@@ -0,0 +1,244 @@
+import json
+import os
+import shutil
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+from metrics import MetricsRecorder, merge_summaries, write_prometheus_textfile
+from pipeline import METRICS_JSON, METRICS_TEXTFILE, run_publish_pipeline
+from ppt_processor import DriveChecksumIndex, DriveNameIndex, PPTAutomationBot, _write_json_atomic
+
+# 背景任務佇列 (伺服器重啟後由此續跑)
+JOB_QUEUE_FILE = "job_queue.json"
+# 每個任務各自的暫存目錄
+JOB_WORKSPACE_ROOT = "job_workspaces"
+# 同時執行的簡報數；每份簡報內部仍會平行上傳與壓縮，預設保守以免記憶體不足
+JOB_CONCURRENCY = 2
+# 佇列檔保留的已結束任務數
+JOB_HISTORY_LIMIT = 50
+# 所有任務累計的效能指標 (Prometheus textfile；可指向 node_exporter 的 textfile 目錄)
+METRICS_TOTALS_FILE = "publish_metrics.prom"
+
+ACTIVE_STATES = ("queued", "running")
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class JobRunner:
+    """在背景執行緒執行發布流程，與 Streamlit 腳本執行緒分離。
+
+    介面只負責送出任務與輪詢進度；瀏覽器斷線或重新整理不會中斷任務。任務狀態寫在
+    job_queue.json，伺服器重啟後未完成的任務會重新排入，並透過執行紀錄 (RunManifest)
+    從中斷的步驟繼續。"""
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, queue_file: str = JOB_QUEUE_FILE,
+                 workspace_root: str = JOB_WORKSPACE_ROOT, bot_factory=PPTAutomationBot, on_error=None,
+                 metrics_file: Optional[str] = METRICS_TOTALS_FILE):
+        self.queue_file = queue_file
+        self.metrics_file = metrics_file
+        self._metric_totals = {}
+        self.workspace_root = workspace_root
+        self.bot_factory = bot_factory
+        # on_error(bot, log_path)：任務失敗時呼叫 (例如上傳日誌)
+        self.on_error = on_error
+        self._lock = threading.RLock()
+        self._records = {}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(concurrency or 1)), thread_name_prefix="publish")
+        # 所有任務共用 Drive 索引 (內部有鎖)，同時發布時不必各自重新列出雲端檔案
+        self.drive_index = DriveNameIndex()
+        self.checksum_index = DriveChecksumIndex()
+        os.makedirs(workspace_root, exist_ok=True)
+        self._load()
+
+    # --- 佇列檔 ---
+    def _load(self) -> None:
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, "r", encoding="utf-8") as f:
+                records = json.load(f).get("jobs", [])
+        except Exception as e:
+            print(f"任務佇列讀取失敗: {e}")
+            return
+
+        resumed = []
+        for record in records:
+            self._records[record["job_id"]] = record
+            if record.get("status") in ACTIVE_STATES:
+                record["status"] = "queued"
+                record["status_text"] = "伺服器重啟，重新排入佇列..."
+                resumed.append(record["job_id"])
+        self._save()
+        for job_id in resumed:
+            self._pool.submit(self._run, job_id)
+
+    def _save(self) -> None:
+        with self._lock:
+            finished = [r for r in self._records.values() if r.get("status") not in ACTIVE_STATES]
+            finished.sort(key=lambda r: r.get("updated", ""))
+            for record in finished[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+                del self._records[record["job_id"]]
+            _write_json_atomic(self.queue_file, {"jobs": list(self._records.values())})
+
+    def _update(self, job_id: str, persist: bool = True, **fields) -> None:
+        with self._lock:
+            record = self._records[job_id]
+            record.update(fields)
+            if persist:
+                record["updated"] = _now()
+                self._save()
+
+    # --- 對外介面 ---
+    def submit(self, source_path: str, file_name: str, file_prefix: str, split_jobs: List[dict],
+               auto_clean: bool = True, owner: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        work_dir = os.path.join(self.workspace_root, job_id)
+        os.makedirs(work_dir, exist_ok=True)
+        # 複製來源檔到任務目錄，介面端之後清除或換檔都不影響執行中的任務
+        shutil.copyfile(source_path, os.path.join(work_dir, "source.pptx"))
+
+        with self._lock:
+            self._records[job_id] = {
+                "job_id": job_id,
+                "owner": owner,
+                "file_name": file_name,
+                "file_prefix": file_prefix,
+                "work_dir": work_dir,
+                "auto_clean": auto_clean,
+                "split_jobs": json.loads(json.dumps(split_jobs)),
+                "status": "queued",
+                "progress": 0,
+                "status_text": "排隊中...",
+                "detail_text": None,
+                "detail_pct": None,
+                "results": None,
+                "error": None,
+                "traceback": None,
+                "created": _now(),
+                "updated": _now(),
+            }
+            self._save()
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def retry(self, job_id: str) -> bool:
+        with self._lock:
+            record = self._records.get(job_id)
+            if not record or record.get("status") in ACTIVE_STATES:
+                return False
+            if not os.path.exists(os.path.join(record["work_dir"], "source.pptx")):
+                return False
+            self._update(job_id, status="queued", status_text="重新排入佇列...", error=None, traceback=None)
+        self._pool.submit(self._run, job_id)
+        return True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            record = self._records.get(job_id)
+            # 回傳副本，避免介面端讀到執行中被修改的物件
+            return json.loads(json.dumps(record)) if record else None
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            records = [r for r in self._records.values() if owner is None or r.get("owner") == owner]
+            records = json.loads(json.dumps(records))
+        return sorted(records, key=lambda r: r.get("created", ""))
+
+    # --- 背景執行 ---
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            record = self._records[job_id]
+            work_dir = record["work_dir"]
+            split_jobs = record["split_jobs"]
+        log_path = os.path.join(work_dir, "job.log")
+
+        def log(message):
+            line = f"[{datetime.now().strftime('%H:%M:%S')}] {message}"
+            print(f"[{job_id}] {line}")
+            try:
+                with open(log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+        def report(pct, text, detail_text=None, detail_pct=None):
+            if pct is not None:
+                # 步驟切換才寫入佇列檔；單檔進度只保留在記憶體
+                self._update(job_id, progress=pct, status_text=text, detail_text=None, detail_pct=None)
+            else:
+                self._update(job_id, persist=False, detail_text=detail_text, detail_pct=detail_pct)
+
+        self._update(job_id, status="running", status_text="準備開始...")
+        log(f"=== 任務 {job_id} 啟動：{record['file_name']} ===")
+
+        bot = None
+        metrics = MetricsRecorder()
+        try:
+            bot = self.bot_factory()
+            if not bot.creds:
+                raise RuntimeError("Bot 未初始化")
+            bot.drive_index = self.drive_index
+            bot.checksum_index = self.checksum_index
+
+            outcome = run_publish_pipeline(
+                bot,
+                os.path.join(work_dir, "source.pptx"),
+                record["file_prefix"],
+                split_jobs,
+                work_dir,
+                report=report,
+                log_callback=log,
+                metrics=metrics,
+            )
+            if outcome["too_large"]:
+                self._update(job_id, status="too_large", results=outcome["results"],
+                             status_text="流程終止：部分檔案過大無法上傳。")
+                return
+
+            self._update(job_id, status="done", results=outcome["results"], status_text="任務完成",
+                         detail_text=None, detail_pct=None)
+            if record.get("auto_clean"):
+                self._clean_workspace(work_dir)
+
+        except Exception as e:
+            log(f"CRITICAL ERROR: {str(e)}\n{traceback.format_exc()}")
+            self._update(job_id, status="failed", error=str(e), traceback=traceback.format_exc(),
+                         status_text="執行錯誤")
+            if self.on_error and bot is not None:
+                try:
+                    self.on_error(bot, log_path)
+                except Exception as err:
+                    print(f"錯誤回報失敗: {err}")
+        finally:
+            self._export_metrics(metrics)
+
+    def _export_metrics(self, metrics: MetricsRecorder) -> None:
+        if not self.metrics_file:
+            return
+        with self._lock:
+            merge_summaries(self._metric_totals, metrics.summary())
+            try:
+                write_prometheus_textfile(self.metrics_file, self._metric_totals)
+            except OSError as e:
+                print(f"效能指標輸出失敗: {e}")
+
+    @staticmethod
+    def _clean_workspace(work_dir: str) -> None:
+        # 保留 job.log 與效能量測供事後查閱，其餘暫存檔刪除
+        for name in os.listdir(work_dir):
+            if name in ("job.log", METRICS_JSON, METRICS_TEXTFILE):
+                continue
+            path = os.path.join(work_dir, name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,288 @@
+"""發布流程的效能量測：以 span 記錄每個步驟與每個工作單位。
+
+每個 span 記錄牆鐘時間、CPU 時間、處理位元組數與期間內的峰值記憶體 (RSS，含子行程)。
+記憶體由單一背景執行緒定期取樣，有 span 進行中才取樣，不會每筆紀錄都呼叫 psutil。
+
+    metrics = MetricsRecorder()
+    with metrics.span("stage", cpu="process", step="shrink"):
+        with metrics.span("image.recompress", part=name) as s:
+            s.add_bytes(len(data))
+    metrics.write_json("metrics.json")
+    metrics.write_prometheus("metrics.prom")
+
+labels 會成為 Prometheus 標籤 (只放低基數的值，例如步驟、API 方法)；attrs 只出現在 JSON。
+
+cpu="process" 以 os.times() 量測整個行程：JobRunner 同時執行多份簡報時，其他任務
+在同一期間用掉的 CPU 也會算進這個步驟。各任務確切的 CPU 用量請看工作單位的 span
+(預設 cpu="thread"，只計目前執行緒)。
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import psutil
+
+# 預設記憶體取樣間隔 (秒)
+METRICS_SAMPLE_INTERVAL = 0.1
+# Prometheus 指標名稱前綴
+METRICS_PREFIX = "pptbot"
+
+
+def _rss_bytes(process: psutil.Process) -> int:
+    # 主行程加上所有子行程 (Step 3 的壓縮工作行程)
+    total = 0
+    try:
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+    except psutil.Error:
+        pass
+    return total
+
+
+def _process_cpu_seconds() -> float:
+    # 含已結束子行程的 CPU 時間 (行程池關閉後才會計入)
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class Span:
+    """進行中的 span；可在區塊內累加位元組數或補上屬性。"""
+
+    __slots__ = ("name", "labels", "attrs", "bytes", "peak_rss")
+
+    def __init__(self, name: str, labels: dict, attrs: dict):
+        self.name = name
+        self.labels = labels
+        self.attrs = attrs
+        self.bytes = 0
+        self.peak_rss = 0
+
+    def add_bytes(self, n: int) -> None:
+        self.bytes += int(n or 0)
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+class MetricsRecorder:
+    def __init__(self, sample_interval: float = METRICS_SAMPLE_INTERVAL, enabled: bool = True):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        # 執行層級的資訊 (簡報大小、投影片數等)，數值欄位會輸出為 Prometheus gauge
+        self.meta: Dict[str, object] = {}
+        self._records: List[dict] = []
+        self._lock = threading.Lock()
+        self._open = set()
+        self._started = time.perf_counter()
+        self._process = psutil.Process(os.getpid()) if enabled else None
+        self._rss = 0
+        self._sampler: Optional[threading.Thread] = None
+
+    # --- 記憶體取樣 ---
+    def _sample_loop(self) -> None:
+        while True:
+            rss = _rss_bytes(self._process)
+            with self._lock:
+                self._rss = rss
+                if not self._open:
+                    self._sampler = None
+                    return
+                for span in self._open:
+                    if rss > span.peak_rss:
+                        span.peak_rss = rss
+            time.sleep(self.sample_interval)
+
+    def _open_span(self, span: Span) -> None:
+        if self._sampler is None:
+            # 取樣執行緒閒置時先取一次，極短的 span 也有記憶體數值
+            rss = _rss_bytes(self._process)
+            with self._lock:
+                self._rss = rss
+        with self._lock:
+            span.peak_rss = self._rss
+            self._open.add(span)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="metrics-rss", daemon=True)
+                self._sampler.start()
+
+    # --- 記錄 ---
+    @contextmanager
+    def span(self, name: str, cpu: str = "thread", attrs: Optional[dict] = None, **labels):
+        """cpu="thread" 量測目前執行緒的 CPU；"process" 量測整個行程 (含子行程)，用於整個步驟，
+        同時執行的其他任務也會計入。"""
+        if not self.enabled:
+            yield Span(name, labels, dict(attrs or {}))
+            return
+
+        span = Span(name, {k: str(v) for k, v in labels.items()}, dict(attrs or {}))
+        cpu_clock = _process_cpu_seconds if cpu == "process" else time.thread_time
+        self._open_span(span)
+        start = time.perf_counter()
+        cpu_start = cpu_clock()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            cpu_used = cpu_clock() - cpu_start
+            with self._lock:
+                self._open.discard(span)
+                peak = max(span.peak_rss, self._rss)
+            if error:
+                span.attrs["error"] = error
+            self._append(span.name, start - self._started, wall, cpu_used, span.bytes, peak, span.labels, span.attrs)
+
+    def record(self, name: str, wall_seconds: float, cpu_seconds: float, nbytes: int = 0,
+               peak_rss: Optional[int] = None, attrs: Optional[dict] = None, **labels) -> None:
+        """記錄在別處量好的工作單位 (例如在子行程執行的圖片壓縮)。"""
+        if not self.enabled:
+            return
+        with self._lock:
+            rss = self._rss if peak_rss is None else peak_rss
+        start = time.perf_counter() - self._started - wall_seconds
+        self._append(name, start, wall_seconds, cpu_seconds, nbytes, rss,
+                     {k: str(v) for k, v in labels.items()}, dict(attrs or {}))
+
+    def _append(self, name, start, wall, cpu_used, nbytes, peak_rss, labels, attrs) -> None:
+        with self._lock:
+            self._records.append({
+                "name": name,
+                "labels": labels,
+                "start": round(start, 6),
+                "wall_seconds": wall,
+                "cpu_seconds": cpu_used,
+                "bytes": nbytes,
+                "peak_rss_bytes": peak_rss,
+                "attrs": attrs,
+            })
+
+    # --- 匯出 ---
+    def spans(self) -> List[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> Dict[tuple, dict]:
+        """依 (名稱, 標籤) 彙總：次數、總時間、CPU、位元組、最長單次與峰值記憶體。"""
+        totals: Dict[tuple, dict] = {}
+        for rec in self.spans():
+            merge_summaries(totals, {_summary_key(rec["name"], rec["labels"]): {
+                "count": 1,
+                "wall_seconds": rec["wall_seconds"],
+                "cpu_seconds": rec["cpu_seconds"],
+                "bytes": rec["bytes"],
+                "wall_seconds_max": rec["wall_seconds"],
+                "peak_rss_bytes": rec["peak_rss_bytes"],
+            }})
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "meta": dict(self.meta),
+            "summary": [
+                dict(name=key[0], labels=dict(key[1]), **agg) for key, agg in sorted(self.summary().items())
+            ],
+            "spans": self.spans(),
+        }
+
+    def write_json(self, path: str) -> None:
+        _write_text_atomic(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        write_prometheus_textfile(path, self.summary(), self.meta)
+
+
+NULL_METRICS = MetricsRecorder(enabled=False)
+
+
+def _summary_key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def merge_summaries(total: Dict[tuple, dict], summary: Dict[tuple, dict]) -> Dict[tuple, dict]:
+    """把 summary 累加進 total (跨任務彙總用)，回傳 total。"""
+    for key, agg in summary.items():
+        cur = total.get(key)
+        if cur is None:
+            total[key] = dict(agg)
+            continue
+        cur["count"] += agg["count"]
+        cur["wall_seconds"] += agg["wall_seconds"]
+        cur["cpu_seconds"] += agg["cpu_seconds"]
+        cur["bytes"] += agg["bytes"]
+        cur["wall_seconds_max"] = max(cur["wall_seconds_max"], agg["wall_seconds_max"])
+        cur["peak_rss_bytes"] = max(cur["peak_rss_bytes"], agg["peak_rss_bytes"])
+    return total
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _metric_name(key: str) -> str:
+    return "".join(ch if ch.isalnum() or ch == "_" else "_" for ch in key)
+
+
+_SPAN_METRICS = (
+    ("span_count_total", "counter", "count", "Completed spans."),
+    ("span_wall_seconds_total", "counter", "wall_seconds", "Wall-clock time spent in spans."),
+    ("span_cpu_seconds_total", "counter", "cpu_seconds",
+     "CPU time spent in spans (process-wide for stage spans, so it includes concurrent jobs)."),
+    ("span_bytes_total", "counter", "bytes", "Bytes processed in spans."),
+    ("span_wall_seconds_max", "gauge", "wall_seconds_max", "Longest single span."),
+    ("span_peak_rss_bytes", "gauge", "peak_rss_bytes", "Peak resident memory (including child processes) seen during spans."),
+)
+
+
+def prometheus_text(summary: Dict[tuple, dict], meta: Optional[dict] = None, prefix: str = METRICS_PREFIX) -> str:
+    """輸出 Prometheus textfile collector 格式 (node_exporter --collector.textfile.directory)。"""
+    lines = []
+    for suffix, kind, field, help_text in _SPAN_METRICS:
+        name = f"{prefix}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (span_name, labels), agg in sorted(summary.items()):
+            label_text = ",".join(
+                f'{_metric_name(k)}="{_escape_label(v)}"' for k, v in (("span", span_name),) + labels
+            )
+            lines.append(f"{name}{{{label_text}}} {agg[field]}")
+
+    for key, value in sorted((meta or {}).items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_run_{_metric_name(key)}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path: str, summary: Dict[tuple, dict], meta: Optional[dict] = None) -> None:
+    _write_text_atomic(path, prometheus_text(summary, meta))
+
+
+def _write_text_atomic(path: str, text: str) -> None:
+    # 先寫暫存檔再取代，textfile collector 不會讀到寫一半的檔案；
+    # 暫存檔名不固定，多個任務同時寫同一個檔案也不會互相覆蓋暫存檔
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        # mkstemp 建立的檔案只有擁有者可讀，node_exporter 可能以其他使用者執行
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
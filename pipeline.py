@@ -0,0 +1,198 @@
+import gc
+import os
+import threading
+import zipfile
+from typing import Optional
+
+from metrics import MetricsRecorder
+from ppt_processor import (
+    AUDIO_EXTS, SHRINK_TARGET_DPI, ImageCache, RunManifest, _is_audio_part, _is_image_part, _is_video_part,
+)
+
+# Step 1 / 4 / 5 同時處理的檔案數 (上傳與線上優化)
+UPLOAD_WORKERS = 3
+# Step 3 圖片壓縮的工作行程數 (1 = 單核心循序處理)
+SHRINK_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# 每次執行的效能量測輸出 (放在任務工作目錄)
+METRICS_JSON = "metrics.json"
+METRICS_TEXTFILE = "metrics.prom"
+
+# 同時執行多份簡報時，試算表索引檔一次只讓一個任務寫入
+_SHEETS_LOCK = threading.Lock()
+# 播放圖示放在共用目錄，建立時避免兩個任務同時寫檔
+_ICON_LOCK = threading.Lock()
+
+
+def _noop_report(pct, text, detail_text=None, detail_pct=None):
+    pass
+
+
+def _deck_meta(source_path) -> dict:
+    # 記錄簡報規模，方便比較耗時與簡報大小的關係
+    with zipfile.ZipFile(source_path) as z:
+        names = z.namelist()
+    return {
+        "source_bytes": os.path.getsize(source_path),
+        "slides": sum(1 for n in names if n.startswith("ppt/slides/slide") and n.endswith(".xml")),
+        "videos": sum(1 for n in names if _is_video_part(n)),
+        "audio": sum(1 for n in names if _is_audio_part(n)),
+        "images": sum(1 for n in names if _is_image_part(n)),
+    }
+
+
+def run_publish_pipeline(bot, source_path, file_prefix, jobs, work_dir,
+                         report=None, log_callback=None,
+                         manifest: Optional[RunManifest] = None,
+                         metrics: Optional[MetricsRecorder] = None):
+    """執行五個發布步驟 (影片雲端化 → 連結置換 → 瘦身 → 拆分上傳 → 內嵌優化) 並寫入試算表。
+
+    report(pct, text, detail_text, detail_pct) 回報整體與單步進度；所有暫存檔都放在
+    work_dir。每個步驟與工作單位的耗時記錄在 metrics，結束時 (含失敗) 輸出為
+    work_dir/metrics.json 與 metrics.prom。
+    回傳 {"results": 任務列表, "too_large": 是否有檔案過大, "metrics": MetricsRecorder}。
+
+    步驟內容沿用原本 app.py 的 execute_automation_logic：呼叫相同的 bot 方法、參數與順序。
+    為了在背景執行緒執行而改動的只有：暫存檔由共用的 temp_workspace 改放 work_dir；
+    Streamlit 元件改由 report / log_callback 回報；Step 5 與寫入試算表的日誌由 print
+    改寫入任務日誌；檔案過大時回傳 too_large 由介面顯示，不在此呼叫 st.error。
+
+    同一行程內的任務共用下列磁碟狀態 (相對於目前工作目錄)：
+    - run_manifests/：RunManifest；同一檔案共用一個實例，上傳步驟依序執行
+    - image_cache/：ImageCache；以內容雜湊為檔名、先寫暫存檔再取代，重複寫入結果相同
+    - sheet_id_index.json：log_to_sheets 的試算表索引；以 _SHEETS_LOCK 依序寫入
+    - play_icon.png：以 _ICON_LOCK 建立
+    以上的鎖只在單一行程內有效，不可讓多個伺服器行程共用同一個工作目錄。"""
+    metrics = metrics or MetricsRecorder()
+    metrics.meta.update(_deck_meta(source_path), splits=len(jobs))
+    bot.metrics = metrics
+    try:
+        with metrics.span("publish", cpu="process"):
+            outcome = _run_steps(bot, source_path, file_prefix, jobs, work_dir, report, log_callback, manifest, metrics)
+    finally:
+        try:
+            metrics.write_json(os.path.join(work_dir, METRICS_JSON))
+            metrics.write_prometheus(os.path.join(work_dir, METRICS_TEXTFILE))
+        except OSError as e:
+            print(f"效能量測輸出失敗: {e}")
+    outcome["metrics"] = metrics
+    return outcome
+
+
+def _run_steps(bot, source_path, file_prefix, jobs, work_dir, report, log_callback, manifest, metrics):
+    report = report or _noop_report
+
+    def log(msg):
+        if log_callback:
+            log_callback(msg)
+
+    def detail(text, pct):
+        report(None, None, text, pct)
+
+    # 以來源簡報內容的雜湊找出執行紀錄，中斷後從未完成的步驟繼續
+    manifest = manifest or RunManifest.for_source(source_path, file_prefix)
+    if manifest.resumed:
+        log(f"續跑執行紀錄: {manifest.path}")
+    else:
+        log(f"新執行紀錄: {manifest.path}")
+
+    # Step 1
+    report(5, "1️⃣ 步驟 1/5：提取 PPT 內影片與音訊並上傳至雲端...")
+
+    file_size_mb = os.path.getsize(source_path) / (1024 * 1024)
+    log(f"PPT 檔案大小: {file_size_mb:.2f} MB")
+    if file_size_mb > 50:
+        log("⚠️ 警告：檔案 > 50MB，高風險")
+
+    # 同一份簡報的其他任務可能正在上傳：依序執行，後到的任務沿用已記錄的連結
+    with manifest.exclusive("videos"), metrics.span("stage", cpu="process", step="videos"):
+        video_map = bot.extract_and_upload_videos(
+            source_path,
+            os.path.join(work_dir, "media"),
+            file_prefix=file_prefix,
+            progress_callback=lambda f, c, t: detail(f"上傳中: {f}", c/t if t else 0),
+            log_callback=lambda msg: log(f"[Bot] {msg}"),
+            max_workers=UPLOAD_WORKERS,
+            manifest=manifest
+        )
+    log(f"影片/音訊上傳完成，共 {len(video_map)} 個")
+    gc.collect()
+
+    # Step 2
+    report(25, "2️⃣ 步驟 2/5：置換影片連結...")
+    final_mod_path = os.path.join(work_dir, "modified.pptx")
+
+    # 單次串流改寫：只處理含影片的投影片，不再逐支影片重新載入整份簡報
+    log(f"開始置換影片連結，共 {len(video_map)} 個影片")
+    with _ICON_LOCK:
+        bot._create_play_icon("play_icon.png")
+    with metrics.span("stage", cpu="process", step="replace"):
+        replaced = bot.replace_videos_with_images(
+            source_path,
+            final_mod_path,
+            video_map,
+            progress_callback=lambda c, t: detail(f"置換中 ({c}/{t} 頁)", c/t if t else 0),
+            manifest=manifest
+        )
+    log(f"連結置換完成，共置換 {replaced} 個影片/音訊物件")
+    gc.collect()
+
+    # Step 3
+    report(45, "3️⃣ 步驟 3/5：進行檔案壓縮與瘦身...")
+    slim_path = os.path.join(work_dir, "slim.pptx")
+    log("開始壓縮 PPT")
+    with metrics.span("stage", cpu="process", step="shrink"):
+        bot.shrink_pptx(
+            final_mod_path, slim_path,
+            progress_callback=lambda c, t: detail("壓縮中...", c/t if t else 0),
+            workers=SHRINK_WORKERS,
+            cache=ImageCache(),
+            log_callback=lambda msg: log(f"[Bot] {msg}"),
+            manifest=manifest,
+            target_dpi=SHRINK_TARGET_DPI
+        )
+    gc.collect()
+
+    # Step 4
+    report(65, "4️⃣ 步驟 4/5：依設定拆分簡報並上傳...")
+    log("開始上傳 Slide")
+    with manifest.exclusive("split_upload"), metrics.span("stage", cpu="process", step="split_upload"):
+        results = bot.split_and_upload(
+            slim_path, sorted(jobs, key=lambda x: x['start']), file_prefix,
+            progress_callback=lambda f, c, t: detail(f"上傳簡報: {f}", c/t if t else 0),
+            log_callback=lambda msg: log(f"[Upload] {msg}"),
+            max_workers=UPLOAD_WORKERS,
+            manifest=manifest,
+            image_workers=SHRINK_WORKERS
+        )
+
+    if any(r.get('error_too_large') for r in results):
+        log("錯誤：檔案過大")
+        return {"results": results, "too_large": True}
+
+    # Step 5
+    report(85, "5️⃣ 步驟 5/5：優化線上播放器...")
+    log("開始 Embed 優化")
+    with metrics.span("stage", cpu="process", step="embed"):
+        final_results = bot.embed_videos_in_slides(
+            results,
+            progress_callback=lambda c, t: detail("優化中...", c/t if t else 0),
+            log_callback=log,
+            max_workers=UPLOAD_WORKERS,
+            manifest=manifest,
+            audio_links={link for name, link in video_map.items() if name.lower().endswith(AUDIO_EXTS)}
+        )
+
+    # Final
+    report(95, "📝 最後步驟：寫入資料庫...")
+    log("寫入資料庫")
+    with _SHEETS_LOCK, metrics.span("stage", cpu="process", step="sheets"):
+        bot.log_to_sheets(final_results, log_callback=log, manifest=manifest)
+
+    report(100, "任務完成")
+    log("⏱️ 各步驟耗時：" + ", ".join(
+        f"{dict(key[1])['step']} {agg['wall_seconds']:.1f}s"
+        for key, agg in metrics.summary().items() if key[0] == "stage"
+    ))
+    log("任務成功結束")
+    return {"results": final_results, "too_large": False}
@@ -2,24 +2,40 @@ import streamlit as st
 import os
 import zipfile
 import json
+import queue
 import re
 import uuid
 import socket
+import struct
+import sys
+import time
 import io
+import mimetypes
+import hashlib
+import math
+import multiprocessing
+import threading
+import weakref
 import posixpath
+import zlib
 import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
 from typing import Optional, List, Tuple, Set
 
-from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE
+from lxml import etree
 from PIL import Image
 
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import HttpRequest, MediaFileUpload, MediaIoBaseUpload
 from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
 
+from metrics import NULL_METRICS
+
 # --- 設定全域超時 (100分鐘) ---
 socket.setdefaulttimeout(6000)
 
@@ -35,16 +51,88 @@ SPREADSHEET_ID = "1tkLPKqFQld2bCythqNY0CX83w4y1cWZJvW6qErE8vek"
 PERMITTED_ADMINS_STRING = "admin,william,robot,fm,sunny,jason,eq,com,mona"
 
 VIDEO_EXTS = (".mp4", ".mov", ".avi", ".m4v", ".wmv")
-IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".tiff", ".bmp")
+AUDIO_EXTS = (".mp3", ".m4a", ".wav", ".wma", ".aac", ".ogg")
+# Step 1 上傳到雲端、Step 3 自簡報移除的媒體 (影片與音訊)
+OFFLOAD_MEDIA_EXTS = VIDEO_EXTS + AUDIO_EXTS
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".tiff", ".tif", ".bmp")
 
 # Namespaces / rel types
 PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
 OFFICE_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
 PML_NS = "http://schemas.openxmlformats.org/presentationml/2006/main"
 CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+P14_NS = "http://schemas.microsoft.com/office/powerpoint/2010/main"
 
 OFFICE_DOC_REL = f"{OFFICE_NS}/officeDocument"
 SLIDE_REL_TYPE = f"{OFFICE_NS}/slide"
+IMAGE_REL_TYPE = f"{OFFICE_NS}/image"
+HYPERLINK_REL_TYPE = f"{OFFICE_NS}/hyperlink"
+
+# [規格] Step 3 圖片壓縮：長邊 1280px、JPEG Quality 50、小於 50KB 不壓縮
+SHRINK_MAX_EDGE = 1280
+SHRINK_JPEG_QUALITY = 50
+SHRINK_MIN_BYTES = 50 * 1024
+# 依顯示尺寸縮圖時的目標解析度 (每英吋像素)；shrink_pptx(target_dpi=None) 則只套用長邊上限
+SHRINK_TARGET_DPI = 150
+# 尺寸已在上限內、且每像素位元組數低於此值的圖片視為已充分壓縮，不解碼直接保留
+SHRINK_WELL_COMPRESSED_BPP = {"JPEG": 0.25, "PNG": 1.5}
+# 大張 JPEG 先以 draft 模式在解碼時縮小 (至少保留目標尺寸的這個倍數)，再做 LANCZOS
+SHRINK_DRAFT_REDUCING_GAP = 2.0
+EMU_PER_INCH = 914400
+# 平行壓縮時，尚未寫出的原圖總量上限，避免上百張照片同時佔用記憶體
+SHRINK_MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+# Step 3 轉檔：BMP/TIFF 改存成 PNG (含透明或色數少的圖形、截圖) 或 JPEG (照片)，並更名 part
+TRANSCODE_IMAGE_EXTS = (".bmp", ".tiff", ".tif")
+TRANSCODE_FORMATS = {"PNG": (".png", "image/png"), "JPEG": (".jpg", "image/jpeg")}
+# 取樣 (最近鄰，不產生混色) 後相異顏色不超過此數視為圖形，否則視為照片
+TRANSCODE_GRAPHIC_MAX_COLORS = 256
+TRANSCODE_SAMPLE_EDGE = 128
+
+# Step 4 拆分檔上限 (Drive 轉為 Google 簡報的上限為 100MB)
+SPLIT_SIZE_BUDGET_MB = 99
+# 拆分檔超過上限時依序嘗試的圖片等級 (長邊 px, JPEG 品質)；等級 0 為 Step 3 的輸出
+SIZE_BUDGET_LADDER = ((1280, 40), (1024, 35), (800, 30), (640, 25), (480, 20))
+
+# 寫出 zip 時的壓縮策略：已壓縮的媒體存 STORED，其餘 (XML) 以 ZIP_DEFLATE_LEVEL deflate
+ZIP_STORED_EXTS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".wdp", ".jxr",
+    ".mp4", ".m4v", ".mov", ".wmv", ".avi", ".m4a", ".mp3", ".wma",
+    ".zip", ".xlsx", ".docx", ".pptx",
+)
+ZIP_DEFLATE_LEVEL = 6
+# 平行 deflate 的執行緒數，與尚未寫出的資料量上限
+ZIP_WRITE_WORKERS = max(1, min(4, os.cpu_count() or 1))
+ZIP_MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+# 壓縮後圖片的磁碟快取 (跨簡報重複使用)
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 壓縮演算法版本，納入快取鍵；改變解碼/編碼方式或保留原圖的規則時遞增，舊項目自然失效
+# (2: draft 解碼 + 不比原圖小則保留原圖)
+IMAGE_CACHE_VERSION = 2
+
+# Drive 檔名索引的有效時間 (秒)
+DRIVE_INDEX_TTL = 300
+# 內容查重時列出的雲端檔案類型
+OFFLOAD_MIME_QUERY = "mimeType contains 'video/' or mimeType contains 'audio/'"
+# 本工具上傳的檔案 (影片/音訊與拆分簡報) 都帶上這個 appProperties 標記：
+# 檔名索引一次列出所有有標記的檔案，內容查重也只比對有標記的檔案
+DRIVE_APP_PROPERTY = ("pptbot", "upload")
+
+# 已寫入試算表的任務 ID 本地索引 (增量同步，避免每次下載整欄)
+SHEET_INDEX_FILE = "sheet_id_index.json"
+SHEET_NAME = "Presentations"
+
+# 每份來源簡報 (以 SHA-256 識別) 一份執行紀錄，記錄各步驟的產出與完成狀態
+RUN_MANIFEST_DIR = "run_manifests"
+
+# 影片置換後的圖示在封裝內的預設位置
+LINK_ICON_PART = "ppt/media/video_link_icon.png"
+
+# 改寫 part XML 時需保留原本的 namespace prefix (mc:Ignorable 依 prefix 名稱比對)，
+# 因此改寫用 lxml；純讀取的 helper 仍沿用 ElementTree。
+_XML_PARSER = etree.XMLParser(resolve_entities=False, huge_tree=True)
 
 
 def natural_sort_key(s: str):
@@ -57,6 +145,34 @@ def _log(log_callback, msg: str):
         log_callback(msg)
 
 
+def _write_json_atomic(path: str, data) -> None:
+    # 先寫暫存檔再取代，避免中斷或多執行緒時留下寫到一半的 JSON
+    tmp_path = f"{path}.tmp_{uuid.uuid4().hex[:6]}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+class _UploadProgress:
+    """彙整背景執行緒的單檔上傳進度，再由呼叫端執行緒轉交 progress_callback
+    (Streamlit 元件只能在腳本執行緒更新)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = {}
+
+    def update(self, name: str, current: int, total: int) -> None:
+        with self._lock:
+            self._latest[name] = (current, total)
+
+    def flush(self, progress_callback) -> None:
+        with self._lock:
+            latest, self._latest = self._latest, {}
+        if progress_callback:
+            for name, (current, total) in latest.items():
+                progress_callback(name, current, total)
+
+
 def _normalize_part_path(path: str) -> str:
     path = path.replace("\\", "/").lstrip("/")
     return posixpath.normpath(path)
@@ -84,6 +200,328 @@ def _read_from_zip(z: zipfile.ZipFile, name: str) -> Optional[bytes]:
         return None
 
 
+_RAW_COPY_CHUNK = 1024 * 1024
+
+
+def _zip_member_data_offset(src, info: zipfile.ZipInfo) -> int:
+    # 略過 local header (其檔名/extra 長度可能與 central directory 不同)
+    src.seek(info.header_offset)
+    fheader = struct.unpack(zipfile.structFileHeader, src.read(zipfile.sizeFileHeader))
+    if fheader[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"{info.filename} 的 local header 損毀")
+    return (info.header_offset + zipfile.sizeFileHeader
+            + fheader[zipfile._FH_FILENAME_LENGTH] + fheader[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+
+def _copy_zip_member_raw(src, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """把未變更成員的壓縮位元組與 CRC 原樣搬到輸出檔，不經過解壓縮/再壓縮。
+
+    src 為來源 zip 的獨立檔案控制代碼。zipfile 沒有公開的 raw 寫入 API，
+    這裡比照 ZipFile.writestr 的內部流程寫入 local header 與 central directory 資訊。
+    """
+    if info.flag_bits & 0x1:
+        raise ValueError(f"{info.filename} 為加密成員，無法直接搬移")
+
+    src.seek(_zip_member_data_offset(src, info))
+
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.file_size = info.file_size
+    zinfo.compress_size = info.compress_size
+    zinfo.external_attr = info.external_attr
+    zinfo.create_system = info.create_system
+    # 大小與 CRC 已寫在 local header，不再使用 data descriptor
+    zinfo.flag_bits = info.flag_bits & ~0x08
+
+    def chunks():
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = src.read(min(_RAW_COPY_CHUNK, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"{info.filename} 的資料長度不足")
+            yield chunk
+            remaining -= len(chunk)
+
+    _append_raw_member(zout, zinfo, chunks())
+
+
+def _append_raw_member(zout: zipfile.ZipFile, zinfo: zipfile.ZipInfo, chunks) -> None:
+    """寫入已壓縮好的成員 (zinfo 需已設定 compress_type、CRC 與大小)。"""
+    with zout._lock:
+        if zout._writing:
+            raise ValueError("zip 正在寫入其他成員")
+        zout._writecheck(zinfo)
+        zout._didModify = True
+        zinfo.header_offset = zout.fp.tell()
+        zout.fp.write(zinfo.FileHeader())
+        for chunk in chunks:
+            zout.fp.write(chunk)
+        zout.filelist.append(zinfo)
+        zout.NameToInfo[zinfo.filename] = zinfo
+        zout.start_dir = zout.fp.tell()
+
+
+# raw 寫入依賴 zipfile 的內部狀態 (_lock、_writing、_writecheck、start_dir…)，
+# 只在核對過原始碼的 Python 版本啟用，其他版本一律走公開 API
+ZIP_RAW_WRITE_PY_VERSIONS = ((3, 8), (3, 13))
+
+
+def _zip_raw_write_supported() -> bool:
+    """版本在核對範圍內，且實際以 raw 寫入一個成員後 testzip 通過才啟用。"""
+    low, high = ZIP_RAW_WRITE_PY_VERSIONS
+    if not low <= sys.version_info[:2] <= high:
+        return False
+    if not all(hasattr(zipfile, n) for n in (
+        "structFileHeader", "sizeFileHeader", "stringFileHeader",
+        "_FH_SIGNATURE", "_FH_FILENAME_LENGTH", "_FH_EXTRA_FIELD_LENGTH",
+    )):
+        return False
+    data = b"pptbot"
+    buf = io.BytesIO()
+    try:
+        with zipfile.ZipFile(buf, "w") as z:
+            if not all(hasattr(z, n) for n in (
+                "_lock", "_writing", "_writecheck", "_didModify", "start_dir", "filelist", "NameToInfo",
+            )):
+                return False
+            zinfo = zipfile.ZipInfo("probe.txt", (1980, 1, 1, 0, 0, 0))
+            zinfo.compress_type = zipfile.ZIP_STORED
+            zinfo.CRC = zlib.crc32(data)
+            zinfo.file_size = zinfo.compress_size = len(data)
+            _append_raw_member(z, zinfo, (data,))
+        with zipfile.ZipFile(buf) as z:
+            return z.testzip() is None and z.read("probe.txt") == data
+    except Exception as e:
+        print(f"zip raw 寫入自我檢查失敗，改用一般寫入: {e}")
+        return False
+
+
+ZIP_RAW_WRITE = _zip_raw_write_supported()
+
+
+def _writestr_copy(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    # writestr 會就地改寫 ZipInfo (大小、CRC、header_offset)；info 可能來自跨任務共用的
+    # PackageIndex，改以新的 ZipInfo 寫入，不動到來源的 central directory 資訊
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    zout.writestr(zinfo, zin.read(info.filename))
+
+
+def _copy_zip_member(zin: zipfile.ZipFile, src, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    if not ZIP_RAW_WRITE:
+        _writestr_copy(zin, zout, info)
+        return
+    start = zout.fp.tell()
+    try:
+        _copy_zip_member_raw(src, zout, info)
+    except (ValueError, zipfile.BadZipFile, struct.error):
+        # 檢查失敗時尚未寫入任何位元組，退回一般的解壓縮/再壓縮
+        if zout.fp.tell() != start:
+            raise
+        _writestr_copy(zin, zout, info)
+
+
+def _zip_store_policy(name: str, level: int) -> Optional[int]:
+    """回傳 deflate 等級；None 表示 STORED (已壓縮的媒體格式不再重複 deflate)。"""
+    if name.lower().endswith(ZIP_STORED_EXTS):
+        return None
+    return level
+
+
+def _compress_member(data: bytes, level: Optional[int]) -> Tuple[int, int, bytes]:
+    """在工作執行緒執行：zlib 的 crc32 與 deflate 都會釋放 GIL。回傳 (壓縮方式, CRC, 資料)。"""
+    crc = zlib.crc32(data)
+    if level is not None:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        packed = compressor.compress(data) + compressor.flush()
+        # 壓不小的內容 (極短的 XML) 改存 STORED
+        if len(packed) < len(data):
+            return zipfile.ZIP_DEFLATED, crc, packed
+    return zipfile.ZIP_STORED, crc, data
+
+
+class ParallelZipWriter:
+    """依加入順序寫出的 zip；writestr 的成員在執行緒池中壓縮。
+
+    壓縮方式依副檔名決定：jpg/png/mp4/m4a 等已壓縮格式存 STORED，其餘 (XML、rels) 以
+    level 等級 deflate。copy 會原樣搬移來源成員的壓縮位元組，兩者可交錯使用。
+    尚未寫出的資料量超過 max_inflight_bytes 時，加入新成員前會先等待前面的成員寫完。
+    """
+
+    def __init__(self, path: str, workers: int = ZIP_WRITE_WORKERS, level: int = ZIP_DEFLATE_LEVEL,
+                 max_inflight_bytes: int = ZIP_MAX_INFLIGHT_BYTES):
+        self.zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        self.level = level
+        self.max_inflight_bytes = max_inflight_bytes
+        workers = max(1, int(workers or 1))
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip") if workers > 1 else None
+        # (名稱, future 或 None, 原始大小, copy 參數)
+        self._pending = deque()
+        self._inflight = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self._pending.clear()
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+            self.zip.close()
+
+    def writestr(self, name: str, data: bytes) -> None:
+        level = _zip_store_policy(name, self.level)
+        if not ZIP_RAW_WRITE:
+            # 無法寫入預先壓縮的位元組：依序寫完前面的成員後改用 zipfile 自行壓縮
+            self.flush()
+            if level is None:
+                self.zip.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+            else:
+                self.zip.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED, compresslevel=level)
+            return
+        if self._pool is not None:
+            future = self._pool.submit(_compress_member, data, level)
+        else:
+            future = Future()
+            future.set_result(_compress_member(data, level))
+        self._pending.append((name, future, len(data), None))
+        self._inflight += len(data)
+        self._drain()
+
+    def copy(self, zin: zipfile.ZipFile, src, info: zipfile.ZipInfo) -> None:
+        self._pending.append((info.filename, None, 0, (zin, src, info)))
+        self._drain()
+
+    def flush(self) -> None:
+        while self._pending:
+            self._write_next()
+
+    def _drain(self) -> None:
+        while self._pending and (
+            self._inflight > self.max_inflight_bytes
+            or self._pending[0][1] is None
+            or self._pending[0][1].done()
+        ):
+            self._write_next()
+
+    def _write_next(self) -> None:
+        name, future, size, copy_args = self._pending.popleft()
+        if copy_args is not None:
+            _copy_zip_member(copy_args[0], copy_args[1], self.zip, copy_args[2])
+            return
+
+        compress_type, crc, payload = future.result()
+        self._inflight -= size
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zinfo.external_attr = 0o600 << 16
+        zinfo.compress_type = compress_type
+        zinfo.CRC = crc
+        zinfo.file_size = size
+        zinfo.compress_size = len(payload)
+        _append_raw_member(self.zip, zinfo, (payload,))
+
+
+class ZipMemberStream(io.RawIOBase):
+    """zip 成員的唯讀、可 seek 串流，供 MediaIoBaseUpload 分段上傳而不必先解壓到磁碟。
+
+    STORED 成員直接對應來源檔中的位元組範圍；DEFLATED 成員在往回 seek
+    (例如重送失敗的分段) 時重新開啟解壓縮串流再往前略過。
+    """
+
+    def __init__(self, zip_path: str, info: zipfile.ZipInfo):
+        super().__init__()
+        self._zip_path = zip_path
+        self._info = info
+        self._size = info.file_size
+        self._pos = 0
+
+        self._raw = None
+        self._data_offset = 0
+        self._zip = None
+        self._inflate = None
+        self._inflate_pos = 0
+
+        if ZIP_RAW_WRITE and info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            self._raw = open(zip_path, "rb")
+            self._data_offset = _zip_member_data_offset(self._raw, info)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"不支援的 whence: {whence}")
+        if pos < 0:
+            raise ValueError("seek 位置不可為負")
+        self._pos = pos
+        return pos
+
+    def _reopen_inflate(self) -> None:
+        if self._inflate is not None:
+            self._inflate.close()
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self._zip_path, "r")
+        self._inflate = self._zip.open(self._info)
+        self._inflate_pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._size - self._pos
+        size = max(0, min(size, self._size - self._pos))
+        if size == 0:
+            return b""
+
+        if self._raw is not None:
+            self._raw.seek(self._data_offset + self._pos)
+            data = self._raw.read(size)
+        else:
+            if self._inflate is None or self._inflate_pos > self._pos:
+                self._reopen_inflate()
+            while self._inflate_pos < self._pos:
+                skipped = self._inflate.read(min(_RAW_COPY_CHUNK, self._pos - self._inflate_pos))
+                if not skipped:
+                    break
+                self._inflate_pos += len(skipped)
+            data = self._inflate.read(size)
+            self._inflate_pos += len(data)
+
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        for handle in (self._raw, self._inflate, self._zip):
+            if handle is not None:
+                handle.close()
+        self._raw = self._inflate = self._zip = None
+        super().close()
+
+
 def _is_external_rel(rel_el: ET.Element) -> bool:
     return rel_el.attrib.get("TargetMode", "").lower() == "external"
 
@@ -107,7 +545,7 @@ def _strip_video_relationships(rels_xml: bytes) -> bytes:
             if _is_external_rel(rel):
                 continue
             target = (rel.attrib.get("Target", "") or "").lower().replace("\\", "/")
-            if target.endswith(VIDEO_EXTS) and (
+            if target.endswith(OFFLOAD_MEDIA_EXTS) and (
                 "/media/" in target or target.startswith("../media/") or target.startswith("media/")
             ):
                 root.remove(rel)
@@ -154,19 +592,6 @@ def _ensure_officedocument_in_root_rels(root_rels_xml: Optional[bytes]) -> bytes
         return ET.tostring(root, encoding="utf-8", xml_declaration=True)
 
 
-def _used_slide_rids_from_presentation_xml(presentation_xml: bytes) -> Set[str]:
-    ns = {"p": PML_NS, "r": OFFICE_NS}
-    root = ET.fromstring(presentation_xml)
-    used: Set[str] = set()
-
-    for sldId in root.findall(".//p:sldIdLst/p:sldId", ns):
-        rid = sldId.attrib.get(f"{{{OFFICE_NS}}}id")
-        if rid:
-            used.add(rid)
-
-    return used
-
-
 def _rebuild_presentation_rels(pres_rels_xml: bytes, used_slide_rids: Set[str]) -> bytes:
     ns = {"r": PKG_REL_NS}
     root = ET.fromstring(pres_rels_xml)
@@ -204,14 +629,1556 @@ def _prune_content_types_overrides(ct_xml: bytes, keep_parts: Set[str]) -> bytes
         return ct_xml
 
 
+def _part_for_rels_path(rels_path: str) -> str:
+    rels_path = _normalize_part_path(rels_path)
+    base_dir = posixpath.dirname(posixpath.dirname(rels_path))
+    filename = posixpath.basename(rels_path)[: -len(".rels")]
+    return posixpath.join(base_dir, filename) if base_dir else filename
+
+
+def _next_rel_id(used_ids: Set[str]) -> str:
+    n = len(used_ids) + 1
+    while f"rId{n}" in used_ids:
+        n += 1
+    rid = f"rId{n}"
+    used_ids.add(rid)
+    return rid
+
+
+def _unique_part_name(names: Set[str], part_name: str) -> str:
+    if part_name not in names:
+        return part_name
+    stem, ext = posixpath.splitext(part_name)
+    n = 2
+    while f"{stem}{n}{ext}" in names:
+        n += 1
+    return f"{stem}{n}{ext}"
+
+
+def _lxml_bytes(root) -> bytes:
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _ensure_content_type_default(ct_xml: bytes, extension: str, content_type: str) -> bytes:
+    try:
+        root = etree.fromstring(ct_xml, _XML_PARSER)
+        for default in root.findall(f"{{{CT_NS}}}Default"):
+            if default.get("Extension", "").lower() == extension:
+                return ct_xml
+
+        default = etree.SubElement(root, f"{{{CT_NS}}}Default", {
+            "Extension": extension,
+            "ContentType": content_type,
+        })
+        root.insert(0, default)
+        return _lxml_bytes(root)
+    except Exception:
+        return ct_xml
+
+
+def _qn(ns: str, tag: str) -> str:
+    return f"{{{ns}}}{tag}"
+
+
+_R_ID = _qn(OFFICE_NS, "id")
+_R_EMBED = _qn(OFFICE_NS, "embed")
+_R_LINK = _qn(OFFICE_NS, "link")
+_MEDIA_FILE_TAGS = {_qn(A_NS, t) for t in ("videoFile", "audioFile", "quickTimeFile", "wavAudioFile")}
+
+
+def _remove_timing_node(node) -> None:
+    parent = node.getparent()
+    parent.remove(node)
+
+    # 子節點清空後，連同外層的 par/seq 一併移除，避免留下空的 childTnLst
+    while parent is not None and parent.tag == _qn(PML_NS, "childTnLst") and len(parent) == 0:
+        ctn = parent.getparent()
+        container = ctn.getparent() if ctn is not None else None
+        if container is None or container.getparent() is None:
+            return
+        if container.getparent().tag == _qn(PML_NS, "tnLst"):
+            timing = container.getparent().getparent()
+            if timing is not None and timing.getparent() is not None:
+                timing.getparent().remove(timing)
+            return
+        parent = container.getparent()
+        parent.remove(container)
+
+
+def _drop_media_timing(root, spids: Set[str]) -> None:
+    timing = root.find(_qn(PML_NS, "timing"))
+    if timing is None or not spids:
+        return
+
+    stop_tags = {_qn(PML_NS, "video"), _qn(PML_NS, "audio"), _qn(PML_NS, "par")}
+    for sp_tgt in list(timing.iter(_qn(PML_NS, "spTgt"))):
+        if sp_tgt.get("spid") not in spids:
+            continue
+        node = sp_tgt.getparent()
+        while node is not None and node.tag not in stop_tags:
+            node = node.getparent()
+        # 已隨上層節點一起被移除者略過
+        if node is None or node.getparent() is None or timing.getparent() is None:
+            continue
+        _remove_timing_node(node)
+
+
+def _replace_media_shapes_with_links(part_name: str, part_xml: bytes, rels_xml: bytes,
+                                     link_map: dict, icon_part: str) -> Optional[Tuple[bytes, bytes, int]]:
+    """將單一投影片 (或版面) 中的影片/音訊物件改為帶超連結的圖示，回傳 (part_xml, rels_xml, 置換數)。
+
+    已上傳音訊的轉場音效 (p:snd) 與動畫音效 (p:sndTgt) 無法以圖示呈現，直接移除。"""
+    rels_root = etree.fromstring(rels_xml, _XML_PARSER)
+    rel_els = rels_root.findall(f"{{{PKG_REL_NS}}}Relationship")
+    used_ids = {rel.attrib.get("Id", "") for rel in rel_els}
+
+    media_rids = {}
+    for rel in rel_els:
+        if _is_external_rel(rel):
+            continue
+        target = _resolve_target(part_name, rel.attrib.get("Target", ""))
+        if target in link_map:
+            media_rids[rel.attrib.get("Id", "")] = link_map[target]
+    if not media_rids:
+        return None
+
+    root = etree.fromstring(part_xml, _XML_PARSER)
+    new_rels: List[dict] = []
+    link_rids = {}
+    icon_rid = None
+    candidate_rids = set(media_rids)
+    replaced_spids: Set[str] = set()
+    replaced = 0
+
+    for pic in list(root.iter(_qn(PML_NS, "pic"))):
+        c_nv_pr = pic.find(f"{_qn(PML_NS, 'nvPicPr')}/{_qn(PML_NS, 'cNvPr')}")
+        nv_pr = pic.find(f"{_qn(PML_NS, 'nvPicPr')}/{_qn(PML_NS, 'nvPr')}")
+        blip_fill = pic.find(_qn(PML_NS, "blipFill"))
+        if c_nv_pr is None or nv_pr is None or blip_fill is None:
+            continue
+
+        link = None
+        for el in nv_pr.iter():
+            rid = el.get(_R_LINK) or el.get(_R_EMBED)
+            if rid in media_rids:
+                link = media_rids[rid]
+                break
+        if not link:
+            continue
+
+        if icon_rid is None:
+            icon_rid = _next_rel_id(used_ids)
+            new_rels.append({
+                "Id": icon_rid,
+                "Type": IMAGE_REL_TYPE,
+                "Target": posixpath.relpath(icon_part, posixpath.dirname(part_name)),
+            })
+        if link not in link_rids:
+            link_rids[link] = _next_rel_id(used_ids)
+            new_rels.append({
+                "Id": link_rids[link],
+                "Type": HYPERLINK_REL_TYPE,
+                "Target": link,
+                "TargetMode": "External",
+            })
+
+        # 點擊動作：移除原本的 ppaction://media，改為外部超連結
+        for hlink in c_nv_pr.findall(_qn(A_NS, "hlinkClick")):
+            c_nv_pr.remove(hlink)
+        hlink = etree.SubElement(c_nv_pr, _qn(A_NS, "hlinkClick"), {_R_ID: link_rids[link]})
+        c_nv_pr.insert(0, hlink)
+
+        # 移除影片/音訊參照 (a:videoFile 與 p14:media 擴充)
+        for child in list(nv_pr):
+            if child.tag in _MEDIA_FILE_TAGS:
+                nv_pr.remove(child)
+            elif child.tag == _qn(PML_NS, "extLst"):
+                for ext in list(child):
+                    if ext.find(_qn(P14_NS, "media")) is not None:
+                        child.remove(ext)
+                if len(child) == 0:
+                    nv_pr.remove(child)
+
+        # 預覽圖換成播放圖示，位置與大小 (spPr) 保持不變
+        for el in blip_fill.iter():
+            if el.get(_R_EMBED):
+                candidate_rids.add(el.get(_R_EMBED))
+        for child in list(blip_fill):
+            blip_fill.remove(child)
+        etree.SubElement(blip_fill, _qn(A_NS, "blip"), {_R_EMBED: icon_rid})
+        stretch = etree.SubElement(blip_fill, _qn(A_NS, "stretch"))
+        etree.SubElement(stretch, _qn(A_NS, "fillRect"))
+
+        if c_nv_pr.get("id"):
+            replaced_spids.add(c_nv_pr.get("id"))
+        replaced += 1
+
+    # 轉場音效 (p:sndAc/p:stSnd/p:snd)、點擊音效 (a:hlinkClick/a:snd) 與動畫音效 (p:audio 內的 p:sndTgt)
+    for snd in list(root.iter(_qn(PML_NS, "snd"), _qn(A_NS, "snd"), _qn(PML_NS, "sndTgt"))):
+        rid = snd.get(_R_EMBED)
+        if rid not in media_rids or not any(a is root for a in snd.iterancestors()):
+            continue
+        if snd.tag == _qn(PML_NS, "sndTgt"):
+            node = next(snd.iterancestors(_qn(PML_NS, "audio")), None)
+            if node is not None:
+                _remove_timing_node(node)
+        else:
+            # 轉場音效連同 p:sndAc 整個移除；點擊音效只移除 a:snd
+            node = next(snd.iterancestors(_qn(PML_NS, "sndAc")), snd)
+            node.getparent().remove(node)
+        candidate_rids.add(rid)
+        replaced += 1
+
+    if not replaced:
+        return None
+
+    _drop_media_timing(root, replaced_spids)
+
+    referenced = set()
+    for el in root.iter():
+        if not isinstance(el.tag, str):
+            continue
+        for key, value in el.attrib.items():
+            if key.startswith(f"{{{OFFICE_NS}}}"):
+                referenced.add(value)
+
+    for rel in rel_els:
+        rid = rel.attrib.get("Id", "")
+        if rid in candidate_rids and rid not in referenced:
+            rels_root.remove(rel)
+    for attrs in new_rels:
+        etree.SubElement(rels_root, f"{{{PKG_REL_NS}}}Relationship", attrs)
+
+    return _lxml_bytes(root), _lxml_bytes(rels_root), replaced
+
+
+def _rewrite_media_as_links(input_pptx: str, output_pptx: str, video_map: dict,
+                            icon_bytes: bytes, progress_callback=None) -> int:
+    """單次串流改寫：只重寫含影片的投影片與其 rels，其餘成員原樣複製。"""
+    tmp_out = f"{output_pptx}.tmp_{uuid.uuid4().hex[:6]}"
+    replaced_total = 0
+
+    try:
+        with zipfile.ZipFile(input_pptx, "r") as zin:
+            infos = zin.infolist()
+            names = {info.filename for info in infos}
+
+            link_map = {
+                name: video_map[posixpath.basename(name)]
+                for name in names
+                if name.startswith("ppt/media/") and posixpath.basename(name) in video_map
+            }
+            icon_part = _unique_part_name(names, LINK_ICON_PART)
+
+            # 只讀 rels 找出實際引用影片的 part
+            touched: List[Tuple[str, str, bytes]] = []
+            for name in sorted(names, key=natural_sort_key):
+                if not link_map or not name.endswith(".rels") or name == "_rels/.rels":
+                    continue
+                rels_xml = zin.read(name)
+                part = _part_for_rels_path(name)
+                try:
+                    targets = _parse_relationship_targets(rels_xml)
+                except Exception:
+                    continue
+                if part in names and any(
+                    not is_ext and _resolve_target(part, target) in link_map
+                    for target, is_ext in targets
+                ):
+                    touched.append((part, name, rels_xml))
+
+            replacements = {}
+            for i, (part, rels_name, rels_xml) in enumerate(touched):
+                if progress_callback:
+                    progress_callback(i + 1, len(touched))
+                try:
+                    out = _replace_media_shapes_with_links(part, zin.read(part), rels_xml, link_map, icon_part)
+                except Exception as e:
+                    print(f"   ⚠️ 置換 {part} 失敗: {e}，保留原內容。")
+                    continue
+                if out:
+                    replacements[part], replacements[rels_name], count = out
+                    replaced_total += count
+
+            if replacements and "[Content_Types].xml" in names:
+                replacements["[Content_Types].xml"] = _ensure_content_type_default(
+                    zin.read("[Content_Types].xml"), "png", "image/png"
+                )
+
+            with open(input_pptx, "rb") as src, ParallelZipWriter(tmp_out) as zout:
+                for item in infos:
+                    if item.filename in replacements:
+                        zout.writestr(item.filename, replacements[item.filename])
+                    else:
+                        zout.copy(zin, src, item)
+                if replacements:
+                    zout.writestr(icon_part, icon_bytes)
+
+        os.replace(tmp_out, output_pptx)
+    finally:
+        if os.path.exists(tmp_out):
+            os.remove(tmp_out)
+
+    return replaced_total
+
+
+def _is_video_part(part: str) -> bool:
+    return part.startswith("ppt/media/") and part.lower().endswith(VIDEO_EXTS)
+
+
+def _is_audio_part(part: str) -> bool:
+    return part.startswith("ppt/media/") and part.lower().endswith(AUDIO_EXTS)
+
+
+def _is_offload_media_part(part: str) -> bool:
+    return part.startswith("ppt/media/") and part.lower().endswith(OFFLOAD_MEDIA_EXTS)
+
+
+def _is_image_part(part: str) -> bool:
+    return part.startswith("ppt/media/") and part.lower().endswith(IMAGE_EXTS)
+
+
+def _filter_presentation_slides(presentation_xml: bytes, keep_rids: Set[str]) -> bytes:
+    root = etree.fromstring(presentation_xml, _XML_PARSER)
+    kept_slide_ids: Set[str] = set()
+
+    sld_id_lst = root.find(_qn(PML_NS, "sldIdLst"))
+    if sld_id_lst is not None:
+        for sld_id in list(sld_id_lst):
+            if sld_id.get(_R_ID) in keep_rids:
+                kept_slide_ids.add(sld_id.get("id"))
+            else:
+                sld_id_lst.remove(sld_id)
+
+    # 自訂放映與章節 (p14:sectionLst) 也會引用投影片，一併移除已拆掉的頁面
+    for sld in list(root.iter(_qn(PML_NS, "sld"))):
+        if sld.getparent().tag == _qn(PML_NS, "sldLst") and sld.get(_R_ID) not in keep_rids:
+            sld.getparent().remove(sld)
+    for section_sld_id in list(root.iter(_qn(P14_NS, "sldId"))):
+        if section_sld_id.get("id") not in kept_slide_ids:
+            section_sld_id.getparent().remove(section_sld_id)
+
+    return _lxml_bytes(root)
+
+
+def _shrink_format(name: str) -> Optional[str]:
+    ext = os.path.splitext(name)[1].lower()
+    if ext in (".jpg", ".jpeg"):
+        return "JPEG"
+    if ext == ".png":
+        return "PNG"
+    return None
+
+
+def _recompress_image(name: str, data: bytes, max_edge: int = SHRINK_MAX_EDGE,
+                      quality: int = SHRINK_JPEG_QUALITY,
+                      display_px: Optional[Tuple[int, int]] = None) -> Optional[bytes]:
+    """Step 3 單張圖片壓縮；可在子行程執行。回傳 None 代表保留原圖。
+
+    display_px 為圖片在投影片上實際顯示所需的像素 (寬, 高)，有值時縮到剛好足夠的大小。"""
+    fmt = _shrink_format(name)
+    if fmt is None:
+        return None
+
+    out = _resize_and_encode(Image.open(io.BytesIO(data)), fmt, max_edge, quality, display_px)
+    # 重新編碼沒有變小就保留原圖
+    return out if len(out) < len(data) else None
+
+
+def _resize_and_encode(img, fmt: str, max_edge: int, quality: int,
+                       display_px: Optional[Tuple[int, int]] = None) -> bytes:
+    # [規格] 1280px
+    target = _shrink_target_size(img.size, max_edge, display_px)
+    if target is not None:
+        if img.format == "JPEG":
+            # 解碼時直接以 1/2、1/4、1/8 縮小，省下大部分解碼與縮放的 CPU
+            img.draft("RGB" if fmt == "JPEG" else None,
+                      (int(target[0] * SHRINK_DRAFT_REDUCING_GAP), int(target[1] * SHRINK_DRAFT_REDUCING_GAP)))
+        img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=SHRINK_DRAFT_REDUCING_GAP)
+
+    output_buffer = io.BytesIO()
+
+    # [規格] Quality 50
+    if fmt == "JPEG":
+        img = img.convert("RGB")
+        img.save(output_buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA", "I;16"):
+            # TIFF 的 CMYK、浮點等模式 PNG 無法直接儲存
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        img.save(output_buffer, format="PNG", optimize=True)
+    return output_buffer.getvalue()
+
+
+def _is_transcode_part(part: str) -> bool:
+    return part.startswith("ppt/media/") and part.lower().endswith(TRANSCODE_IMAGE_EXTS)
+
+
+def _transcode_format(img) -> str:
+    """含透明或色數少 (圖表、截圖、線稿) 存 PNG，其餘視為照片存 JPEG。"""
+    if "A" in img.getbands() or "transparency" in img.info or img.mode in ("1", "P"):
+        return "PNG"
+    sample = img.resize((min(img.width, TRANSCODE_SAMPLE_EDGE), min(img.height, TRANSCODE_SAMPLE_EDGE)),
+                        Image.Resampling.NEAREST)
+    if sample.convert("RGB").getcolors(TRANSCODE_GRAPHIC_MAX_COLORS) is not None:
+        return "PNG"
+    return "JPEG"
+
+
+def _transcode_image(name: str, data: bytes, max_edge: int = SHRINK_MAX_EDGE,
+                     quality: int = SHRINK_JPEG_QUALITY,
+                     display_px: Optional[Tuple[int, int]] = None) -> Optional[Tuple[str, bytes]]:
+    """Step 3 將 BMP/TIFF 轉成 PNG 或 JPEG (同時套用縮圖)；可在子行程執行。
+
+    回傳 (格式, 內容)；轉檔後沒有變小則回傳 None，保留原檔與原檔名。"""
+    img = Image.open(io.BytesIO(data))
+    fmt = _transcode_format(img)
+    out = _resize_and_encode(img, fmt, max_edge, quality, display_px)
+    return (fmt, out) if len(out) < len(data) else None
+
+
+def _rename_relationship_targets(part: str, rels_xml: bytes, renames: dict) -> Optional[bytes]:
+    """把 rels 中指向已更名 part 的 Target 改成新檔名 (保留原本的相對路徑寫法)；沒有變更回傳 None。"""
+    if not any(posixpath.basename(old).encode() in rels_xml for old in renames):
+        return None
+    root = etree.fromstring(rels_xml, _XML_PARSER)
+    changed = False
+    for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+        if _is_external_rel(rel):
+            continue
+        target = rel.get("Target", "")
+        new_part = renames.get(_resolve_target(part, target))
+        if new_part:
+            rel.set("Target", f"{target.rsplit('/', 1)[0]}/{posixpath.basename(new_part)}" if "/" in target
+                    else posixpath.basename(new_part))
+            changed = True
+    return _lxml_bytes(root) if changed else None
+
+
+def _rename_content_types(ct_xml: bytes, renames: dict) -> bytes:
+    """[Content_Types].xml：更名的 part 改寫 Override，並補上新副檔名的 Default。"""
+    root = etree.fromstring(ct_xml, _XML_PARSER)
+    content_types = {ext: ct for ext, ct in TRANSCODE_FORMATS.values()}
+    by_part = {"/" + old: "/" + new for old, new in renames.items()}
+    for override in root.findall(f"{{{CT_NS}}}Override"):
+        new_part = by_part.get(override.get("PartName", ""))
+        if new_part:
+            override.set("PartName", new_part)
+            override.set("ContentType", content_types[posixpath.splitext(new_part)[1]])
+    ct_xml = _lxml_bytes(root)
+    for ext in sorted({posixpath.splitext(new)[1] for new in renames.values()}):
+        ct_xml = _ensure_content_type_default(ct_xml, ext[1:], content_types[ext])
+    return ct_xml
+
+
+def _shrink_target_size(size: Tuple[int, int], max_edge: int,
+                        display_px: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int]]:
+    """依長邊上限與顯示尺寸計算縮圖後的大小 (保持比例)；不需縮小時回傳 None。"""
+    w, h = size
+    scale = min(1.0, max_edge / w, max_edge / h)
+    if display_px:
+        # 兩個方向都要有足夠像素 (畫框比例可能與原圖不同)，取較大的縮放比例
+        scale = min(scale, max(display_px[0] / w, display_px[1] / h))
+    if scale >= 1:
+        return None
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _probe_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    # Image.open 只讀檔頭，不會解碼像素
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def _is_well_compressed(name: str, data: bytes, display_px: Optional[Tuple[int, int]] = None) -> bool:
+    """尺寸已在上限內且壓縮率夠好的圖片，重新編碼只會浪費 CPU (甚至變大)。"""
+    fmt = _shrink_format(name)
+    size = _probe_image_size(data) if fmt else None
+    if size is None or _shrink_target_size(size, SHRINK_MAX_EDGE, display_px) is not None:
+        return False
+    return len(data) / max(1, size[0] * size[1]) <= SHRINK_WELL_COMPRESSED_BPP[fmt]
+
+
+_DISPLAY_SCAN_PART_RE = re.compile(r"^ppt/(slides|slideLayouts|slideMasters)/[^/]+\.xml$")
+_DISPLAY_SHAPE_TAGS = {"sp", "pic", "graphicFrame", "cxnSp"}
+
+
+def _local_name(tag) -> str:
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _shape_extent(shape) -> Optional[Tuple[float, float]]:
+    # p:spPr/a:xfrm (一般圖形、圖片) 或 p:xfrm (graphicFrame)；placeholder 可能沒有，沿用版面配置
+    for xfrm in (shape.find(f"{{{PML_NS}}}spPr/{{{A_NS}}}xfrm"), shape.find(f"{{{PML_NS}}}xfrm")):
+        ext = xfrm.find(f"{{{A_NS}}}ext") if xfrm is not None else None
+        if ext is not None:
+            return float(ext.get("cx", 0)), float(ext.get("cy", 0))
+    return None
+
+
+def _collect_blip_extents(el, sx: float, sy: float, slide_size, extents: dict, unknown: set) -> None:
+    """走訪 spTree，記錄每個 r:embed 圖片的最大顯示範圍 (EMU，已換算群組縮放與裁切)。"""
+    for child in el:
+        tag = _local_name(child.tag)
+        if tag == "grpSp":
+            nsx, nsy = sx, sy
+            xfrm = child.find(f"{{{PML_NS}}}grpSpPr/{{{A_NS}}}xfrm")
+            if xfrm is not None:
+                ext, ch_ext = xfrm.find(f"{{{A_NS}}}ext"), xfrm.find(f"{{{A_NS}}}chExt")
+                if ext is not None and ch_ext is not None:
+                    if int(ch_ext.get("cx", 0)) > 0:
+                        nsx = sx * int(ext.get("cx", 0)) / int(ch_ext.get("cx"))
+                    if int(ch_ext.get("cy", 0)) > 0:
+                        nsy = sy * int(ext.get("cy", 0)) / int(ch_ext.get("cy"))
+            _collect_blip_extents(child, nsx, nsy, slide_size, extents, unknown)
+        elif tag in _DISPLAY_SHAPE_TAGS or tag == "bg":
+            ext = _shape_extent(child) if tag != "bg" else None
+            # 背景或沒有 xfrm 的 placeholder：以整張投影片為上限
+            ext = (ext[0] * sx, ext[1] * sy) if ext is not None else slide_size
+            for fill in child.iter():
+                if _local_name(fill.tag) != "blipFill":
+                    continue
+                blip = fill.find(f"{{{A_NS}}}blip")
+                rid = blip.get(_R_EMBED) if blip is not None else None
+                if not rid:
+                    continue
+                if fill.find(f"{{{A_NS}}}tile") is not None:
+                    # 並排填滿以原尺寸繪製，無法由外框推算
+                    unknown.add(rid)
+                    continue
+                fx = fy = 1.0
+                src_rect = fill.find(f"{{{A_NS}}}srcRect")
+                if src_rect is not None:
+                    # 裁切比例以 1/100000 表示；顯示的只是原圖的一部分
+                    fx = 1 - (int(src_rect.get("l", 0)) + int(src_rect.get("r", 0))) / 100000
+                    fy = 1 - (int(src_rect.get("t", 0)) + int(src_rect.get("b", 0))) / 100000
+                need = (ext[0] / max(fx, 0.01), ext[1] / max(fy, 0.01))
+                cur = extents.get(rid, (0.0, 0.0))
+                extents[rid] = (max(cur[0], need[0]), max(cur[1], need[1]))
+        else:
+            _collect_blip_extents(child, sx, sy, slide_size, extents, unknown)
+
+
+def _display_pixel_sizes(zin: zipfile.ZipFile, dpi: int) -> dict:
+    """掃描投影片、版面配置與母片，回傳 {圖片 part: (寬, 高) 像素 或 None}。
+
+    同一張圖片取所有使用處的最大顯示範圍；只要有一處無法判斷 (其他 part 引用、並排填滿等)
+    即為 None，改用一般的長邊上限。"""
+    names = set(zin.namelist())
+    slide_size = (12192000.0, 6858000.0)
+    pres_xml = _read_from_zip(zin, "ppt/presentation.xml")
+    if pres_xml:
+        sld_sz = ET.fromstring(pres_xml).find(f"{{{PML_NS}}}sldSz")
+        if sld_sz is not None:
+            slide_size = (float(sld_sz.get("cx", slide_size[0])), float(sld_sz.get("cy", slide_size[1])))
+
+    emu: dict = {}
+    for rels_name in names:
+        if not rels_name.endswith(".rels"):
+            continue
+        part = _part_for_rels_path(rels_name)
+        try:
+            rels = ET.fromstring(zin.read(rels_name))
+        except Exception:
+            continue
+        images = {}
+        for rel in rels.findall(f"{{{PKG_REL_NS}}}Relationship"):
+            if _is_external_rel(rel):
+                continue
+            target = _resolve_target(part, rel.attrib.get("Target", ""))
+            if _is_image_part(target):
+                images[rel.attrib.get("Id")] = target
+        if not images:
+            continue
+
+        extents, unknown = {}, set()
+        if _DISPLAY_SCAN_PART_RE.match(part) and part in names:
+            try:
+                _collect_blip_extents(ET.fromstring(zin.read(part)), 1.0, 1.0, slide_size, extents, unknown)
+            except Exception:
+                unknown.update(images)
+
+        for rid, target in images.items():
+            if rid in unknown or rid not in extents or target in emu and emu[target] is None:
+                emu[target] = None
+                continue
+            cur = emu.get(target, (0.0, 0.0))
+            emu[target] = (max(cur[0], extents[rid][0]), max(cur[1], extents[rid][1]))
+
+    return {
+        target: None if ext is None else (
+            max(1, math.ceil(ext[0] / EMU_PER_INCH * dpi)), max(1, math.ceil(ext[1] / EMU_PER_INCH * dpi))
+        )
+        for target, ext in emu.items()
+    }
+
+
+def _ladder_label(level: int) -> Optional[str]:
+    if not level:
+        return None
+    max_edge, quality = SIZE_BUDGET_LADDER[level - 1]
+    return f"{max_edge}px/Q{quality}"
+
+
+def _image_process_pool(workers: int) -> ProcessPoolExecutor:
+    # 呼叫端是 JobRunner 的背景執行緒 (Streamlit 伺服器本身也是多執行緒)；
+    # Linux 預設的 fork 會把其他執行緒持有中的鎖一併複製到子行程而可能卡死。
+    # 改用 forkserver：工作行程由單執行緒的 server 行程 fork，並預先載入本模組，
+    # 不必像 spawn 一樣每個工作行程都重新 import (含 streamlit)；不支援的平台退回 spawn
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["__main__", __name__])
+    else:
+        ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+
+
+def _reencode_split_images(index, keep: Set[str], max_edge: int, quality: int,
+                           executor: Optional[ProcessPoolExecutor] = None, workers: int = 1) -> dict:
+    """拆分檔降低畫質的一個等級：JPEG 一律以該等級的品質重新壓縮，PNG 只處理像素超過
+    該等級長邊 (或顯示所需尺寸) 的圖片 (品質對 PNG 無效)。一律由拆分來源的圖片編碼，
+    不會疊加前一等級的失真；沒有變小的圖片為 None。回傳 {part: 內容 或 None}。"""
+    sizes = index._probe_image_sizes()
+    display = index.display_pixel_sizes(SHRINK_TARGET_DPI)
+    names = [
+        n for n in sorted(keep)
+        if n in sizes and _shrink_format(n) and (
+            _shrink_format(n) == "JPEG" or _shrink_target_size(sizes[n], max_edge, display.get(n)) is not None
+        )
+    ]
+    results = {}
+    if not names:
+        return results
+
+    def finish(name, future):
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"   ⚠️ 圖片 {name} 重新壓縮失敗: {e}，保留原圖。")
+
+    with zipfile.ZipFile(index.pptx_path, "r") as z:
+        pending = {}
+        for name in names:
+            args = (name, z.read(name), max_edge, quality, display.get(name))
+            if executor is None:
+                future = Future()
+                try:
+                    future.set_result(_recompress_image(*args))
+                except Exception as e:
+                    future.set_exception(e)
+                finish(name, future)
+                continue
+            # 送出的圖片數有上限，不會一次把所有原圖讀進記憶體
+            while len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(pending.pop(future), future)
+            pending[executor.submit(_recompress_image, *args)] = name
+        for future in pending:
+            finish(pending[future], future)
+    return results
+
+
+def _timed_recompress(name: str, data: bytes, display_px: Optional[Tuple[int, int]] = None,
+                      transcode: bool = False) -> Tuple[object, float, float]:
+    """_recompress_image (transcode=True 時為 _transcode_image) 加上耗時 (牆鐘、CPU 秒)；
+    在工作行程內量測後隨結果傳回主行程記錄。"""
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    result = (_transcode_image if transcode else _recompress_image)(name, data, display_px=display_px)
+    return result, time.perf_counter() - start, time.thread_time() - cpu_start
+
+
+class ImageCache:
+    """壓縮後圖片的磁碟快取。
+
+    以「演算法版本 + 原圖內容 + 壓縮參數 (長邊、品質、格式)」的 SHA-256 為鍵，
+    總容量超過上限時依最近使用時間 (mtime) 淘汰最舊的項目。
+    """
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(data: bytes, max_edge: int, quality: int, fmt: str,
+                 display_px: Optional[Tuple[int, int]] = None) -> str:
+        h = hashlib.sha256()
+        h.update(f"v{IMAGE_CACHE_VERSION}:{max_edge}:{quality}:{fmt}:".encode("ascii"))
+        if display_px:
+            h.update(f"{display_px[0]}x{display_px[1]}:".encode("ascii"))
+        h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.bin")
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(".bin"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st_ = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st_.st_size, st_.st_mtime
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新 mtime 作為 LRU 的使用時間
+            os.utime(path, None)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.tmp_{uuid.uuid4().hex[:6]}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"寫入圖片快取失敗: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # 重新掃描以納入其他行程寫入的項目，淘汰到上限的 90%
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+
+class PackageIndex:
+    """一次解析 [Content_Types].xml、presentation.xml 與所有 .rels，
+    之後每個拆分任務都直接從這份依賴圖輸出，不再重新載入簡報。"""
+
+    ROOT_RELS = "_rels/.rels"
+    CONTENT_TYPES = "[Content_Types].xml"
+    PRESENTATION = "ppt/presentation.xml"
+    PRESENTATION_RELS = "ppt/_rels/presentation.xml.rels"
+
+    def __init__(self, pptx_path: str, probe_images: bool = False):
+        # probe_images=True 時建立索引就讀好圖片尺寸，之後預估大小不必再開啟原檔
+        # (索引被多個工作階段共用、原檔可能已被清除時使用)
+        self.pptx_path = pptx_path
+
+        with zipfile.ZipFile(pptx_path, "r") as z:
+            self.infos = z.infolist()
+            self.names = {info.filename for info in self.infos}
+
+            self.content_types = _read_from_zip(z, self.CONTENT_TYPES)
+            self.root_rels = _ensure_officedocument_in_root_rels(_read_from_zip(z, self.ROOT_RELS))
+            self.presentation_xml = _read_from_zip(z, self.PRESENTATION)
+
+            # rels 預先去除影片關聯；presentation.xml.rels 另外依任務重建
+            self.rels_xml = {}
+            raw_rels = {}
+            for name in self.names:
+                if name.endswith(".rels") and name != self.ROOT_RELS:
+                    raw_rels[name] = z.read(name)
+                    self.rels_xml[name] = _strip_video_relationships(raw_rels[name])
+
+        # part -> 內部引用的 part (已排除影片)
+        self.edges = {}
+        # part -> 引用的影片/音訊 (Step 1 上傳後自拆分檔移除，只用於預估原始大小)
+        self.media_edges = {}
+        # part -> 外部連結 (超連結等)
+        self.external_targets = {}
+        self.slide_rel_ids = {}
+        for rels_name, rels_xml in list(raw_rels.items()) + [(self.ROOT_RELS, self.root_rels)]:
+            part = _part_for_rels_path(rels_name)
+            targets: List[str] = []
+            try:
+                root = ET.fromstring(rels_xml)
+            except Exception:
+                continue
+            for rel in root.findall(f"{{{PKG_REL_NS}}}Relationship"):
+                if _is_external_rel(rel):
+                    self.external_targets.setdefault(part, []).append(rel.attrib.get("Target", ""))
+                    continue
+                resolved = _resolve_target(part, rel.attrib.get("Target", ""))
+                if resolved not in self.names:
+                    continue
+                if _is_offload_media_part(resolved):
+                    self.media_edges.setdefault(part, []).append(resolved)
+                    continue
+                targets.append(resolved)
+                if part == self.PRESENTATION and rel.attrib.get("Type") == SLIDE_REL_TYPE:
+                    self.slide_rel_ids[resolved] = rel.attrib.get("Id", "")
+            self.edges[part] = targets
+
+        # 依 sldIdLst 順序排列的投影片 rId
+        self.slide_rids: List[str] = []
+        if self.presentation_xml:
+            ns = {"p": PML_NS}
+            root = ET.fromstring(self.presentation_xml)
+            for sld_id in root.findall(".//p:sldIdLst/p:sldId", ns):
+                rid = sld_id.attrib.get(f"{{{OFFICE_NS}}}id")
+                if rid:
+                    self.slide_rids.append(rid)
+
+        # 大小預估用，首次呼叫時才計算
+        self._closures = None
+        self._image_sizes = None
+        self._display_px = {}
+        if probe_images:
+            self._probe_image_sizes()
+
+    @property
+    def slide_count(self) -> int:
+        return len(self.slide_rids)
+
+    def slide_rids_for_range(self, start: int, end: int) -> Set[str]:
+        # start / end 為 1-based 且包含兩端，與拆分任務設定一致
+        return set(self.slide_rids[max(start - 1, 0):end])
+
+    def reachable_parts(self, keep_rids: Set[str]) -> Set[str]:
+        skipped_slides = {
+            part for part, rid in self.slide_rel_ids.items() if rid not in keep_rids
+        }
+
+        keep: Set[str] = {self.CONTENT_TYPES, self.ROOT_RELS}
+        queue: List[str] = list(self.edges.get("", []))
+        while queue:
+            part = queue.pop()
+            if part in keep or part not in self.names:
+                continue
+            keep.add(part)
+
+            rels_name = _rels_path_for_part(part)
+            if rels_name in self.names:
+                keep.add(rels_name)
+            for target in self.edges.get(part, []):
+                # 未保留的投影片只在 presentation.xml 這一層排除；
+                # 若被其他保留頁面以超連結引用，仍會經由該頁面納入
+                if part == self.PRESENTATION and target in skipped_slides:
+                    continue
+                queue.append(target)
+
+        for maybe in ("docProps/app.xml", "docProps/core.xml"):
+            if maybe in self.names:
+                keep.add(maybe)
+                rels_name = _rels_path_for_part(maybe)
+                if rels_name in self.names:
+                    keep.add(rels_name)
+
+        return keep
+
+    def count_external_links(self, parts: Set[str], needle: str) -> int:
+        return sum(
+            1
+            for part in parts
+            for target in self.external_targets.get(part, [])
+            if needle in target
+        )
+
+    def estimate_split_size(self, keep: Set[str]) -> int:
+        """以可達 part 的壓縮後大小加上 zip 標頭估算拆分檔大小 (不需實際寫出)。"""
+        total = 22  # end of central directory
+        for info in self.infos:
+            if info.filename in keep:
+                total += _zip_member_cost(info)
+        return total
+
+    # --- 拆分大小預估 (Step 2 設定任務時使用，不需寫出任何檔案) ---
+    def _slide_closures(self):
+        """回傳 (共用 part, 共用媒體, {rId: 該頁額外帶入的 part}, {rId: 該頁額外帶入的媒體})。
+
+        共用 part 為每個拆分檔都會有的母片、版面配置、佈景主題等 (= 不保留任何投影片時的可達集合)；
+        每頁只記錄共用部分以外的 part，任意範圍的大小即為共用 part 加上各頁集合的聯集，
+        多頁共用的圖片只計算一次。"""
+        if self._closures is not None:
+            return self._closures
+
+        base = self.reachable_parts(set())
+        base_media = {m for part in base for m in self.media_edges.get(part, [])}
+        slide_parts = {rid: part for part, rid in self.slide_rel_ids.items()}
+
+        per_slide, per_slide_media = {}, {}
+        for rid in self.slide_rids:
+            seen: Set[str] = set()
+            queue = [slide_parts[rid]] if rid in slide_parts else []
+            while queue:
+                part = queue.pop()
+                if part in seen or part in base or part not in self.names:
+                    continue
+                seen.add(part)
+                rels_name = _rels_path_for_part(part)
+                if rels_name in self.names:
+                    seen.add(rels_name)
+                # 與 reachable_parts 相同：頁面間的超連結會帶入被連結的投影片
+                queue.extend(self.edges.get(part, []))
+            per_slide[rid] = seen
+            per_slide_media[rid] = {m for part in seen for m in self.media_edges.get(part, [])} - base_media
+
+        self._closures = (base, base_media, per_slide, per_slide_media)
+        return self._closures
+
+    def _probe_image_sizes(self) -> dict:
+        # 只讀檔頭取得圖片像素尺寸 (不解碼)，供壓縮後大小的預估
+        if self._image_sizes is None:
+            sizes = {}
+            with zipfile.ZipFile(self.pptx_path, "r") as z:
+                for info in self.infos:
+                    if _is_image_part(info.filename) and info.file_size >= SHRINK_MIN_BYTES:
+                        try:
+                            with z.open(info) as f, Image.open(f) as img:
+                                sizes[info.filename] = img.size
+                        except Exception:
+                            pass
+            self._image_sizes = sizes
+        return self._image_sizes
+
+    def display_pixel_sizes(self, dpi: int = SHRINK_TARGET_DPI) -> dict:
+        """{圖片 part: 顯示所需像素 或 None}，同一個 dpi 只掃描一次。"""
+        if dpi not in self._display_px:
+            with zipfile.ZipFile(self.pptx_path, "r") as z:
+                self._display_px[dpi] = _display_pixel_sizes(z, dpi)
+        return self._display_px[dpi]
+
+    def _predicted_cost(self, info: zipfile.ZipInfo, shrink: bool, max_edge: int) -> int:
+        cost = _zip_member_cost(info)
+        size = self._probe_image_sizes().get(info.filename) if shrink else None
+        target = _shrink_target_size(size, max_edge) if size else None
+        if target is None:
+            return cost
+        # 依像素比例縮小；JPEG (及轉檔) 另以充分壓縮的每像素位元組數為上限。
+        # 未計入依顯示尺寸縮圖，因此是偏大的估計
+        pixels = target[0] * target[1]
+        estimate = info.compress_size * pixels / (size[0] * size[1])
+        fmt = _shrink_format(info.filename) or ("PNG" if _is_transcode_part(info.filename) else None)
+        if fmt:
+            estimate = min(estimate, pixels * SHRINK_WELL_COMPRESSED_BPP[fmt])
+        return min(cost, cost - info.compress_size + int(estimate))
+
+    def predict_split_size(self, keep_rids: Set[str], offload_media: bool = True, shrink: bool = False,
+                           max_edge: int = SHRINK_MAX_EDGE) -> int:
+        """預估保留 keep_rids 的拆分檔大小。
+
+        offload_media=False 為影片/音訊仍留在簡報內的大小；shrink=True 另外預估 Step 3
+        (長邊 max_edge) 壓縮圖片後的大小。"""
+        base, base_media, per_slide, per_slide_media = self._slide_closures()
+        parts, media = set(base), set(base_media)
+        for rid in keep_rids:
+            parts |= per_slide.get(rid, set())
+            media |= per_slide_media.get(rid, set())
+        if not offload_media:
+            parts |= media
+
+        total = 22
+        for info in self.infos:
+            if info.filename in parts:
+                total += self._predicted_cost(info, shrink, max_edge)
+        return total
+
+    def predict_range_sizes(self, start: int, end: int) -> dict:
+        """拆分任務 (start~end 頁) 各階段的預估大小 (位元組)：
+        original 原始、offloaded 影片/音訊雲端化後、shrunk 圖片壓縮後、
+        lowest 降到最低畫質 (SIZE_BUDGET_LADDER 最後一級) 後。"""
+        keep = self.slide_rids_for_range(start, end)
+        return {
+            "original": self.predict_split_size(keep, offload_media=False),
+            "offloaded": self.predict_split_size(keep),
+            "shrunk": self.predict_split_size(keep, shrink=True),
+            "lowest": self.predict_split_size(keep, shrink=True, max_edge=SIZE_BUDGET_LADDER[-1][0]),
+        }
+
+    def slide_size_profile(self) -> List[dict]:
+        """每頁投影片的大小分析 (依 sldIdLst 順序)。
+
+        bytes 為只拆出這一頁時額外帶入的大小 (不含影片/音訊)，其中 shared_bytes 也被其他頁引用；
+        attributed_bytes 將多頁共用的 part 平均分攤 (含影片/音訊)，各頁加總再加上母片等共用 part
+        即為整份簡報；media_bytes 為可雲端化的影片/音訊。"""
+        base, base_media, per_slide, per_slide_media = self._slide_closures()
+        costs = {info.filename: _zip_member_cost(info) for info in self.infos}
+
+        reached_by = {}
+        for rid in self.slide_rids:
+            for part in per_slide[rid] | per_slide_media[rid]:
+                reached_by[part] = reached_by.get(part, 0) + 1
+
+        profile = []
+        for n, rid in enumerate(self.slide_rids, start=1):
+            parts, media = per_slide[rid], per_slide_media[rid]
+            profile.append({
+                "slide": n,
+                "bytes": sum(costs[p] for p in parts),
+                "attributed_bytes": int(sum(costs[p] / reached_by[p] for p in parts | media)),
+                "media_bytes": sum(costs[m] for m in media),
+                "image_bytes": sum(costs[p] for p in parts if _is_image_part(p)),
+                "shared_bytes": sum(costs[p] for p in parts if reached_by[p] > 1),
+            })
+        return profile
+
+    def write_split(self, out_path: str, keep_rids: Set[str], workers: int = ZIP_WRITE_WORKERS,
+                    image_overrides: Optional[dict] = None) -> Set[str]:
+        """image_overrides 為 {圖片 part: 重新壓縮後的內容}；不比原本小的保留原圖。"""
+        keep = self.reachable_parts(keep_rids)
+
+        pres_rels_fixed = None
+        if self.presentation_xml and self.PRESENTATION_RELS in self.rels_xml:
+            pres_rels_fixed = _rebuild_presentation_rels(self.rels_xml[self.PRESENTATION_RELS], keep_rids)
+
+        with zipfile.ZipFile(self.pptx_path, "r") as zin, open(self.pptx_path, "rb") as src, \
+                ParallelZipWriter(out_path, workers=workers) as zout:
+            if self.content_types:
+                zout.writestr(self.CONTENT_TYPES, _prune_content_types_overrides(self.content_types, keep))
+            zout.writestr(self.ROOT_RELS, self.root_rels)
+
+            for item in self.infos:
+                name = item.filename
+                if name not in keep or name in (self.CONTENT_TYPES, self.ROOT_RELS):
+                    continue
+
+                if name == self.PRESENTATION:
+                    zout.writestr(name, _filter_presentation_slides(self.presentation_xml, keep_rids))
+                elif name == self.PRESENTATION_RELS and pres_rels_fixed is not None:
+                    zout.writestr(name, pres_rels_fixed)
+                elif name in self.rels_xml:
+                    zout.writestr(name, self.rels_xml[name])
+                elif image_overrides and image_overrides.get(name) is not None \
+                        and len(image_overrides[name]) < item.compress_size:
+                    zout.writestr(name, image_overrides[name])
+                else:
+                    zout.copy(zin, src, item)
+
+        return keep
+
+
+def _zip_member_cost(info: zipfile.ZipInfo) -> int:
+    # 壓縮後大小加上 local header 30 + central directory 46 位元組，檔名各存一次
+    return 76 + 2 * len(info.filename.encode("utf-8")) + info.compress_size
+
+
+def _shape_text(sp) -> str:
+    # 與 python-pptx 的 TextFrame.text 相同：段落以換行連接，a:br 為 \v
+    paragraphs = []
+    for para in sp.iter(f"{{{A_NS}}}p"):
+        parts = []
+        for child in para:
+            if child.tag in (f"{{{A_NS}}}r", f"{{{A_NS}}}fld"):
+                parts.append("".join(t.text or "" for t in child.iter(f"{{{A_NS}}}t")))
+            elif child.tag == f"{{{A_NS}}}br":
+                parts.append("\v")
+        paragraphs.append("".join(parts))
+    return "\n".join(paragraphs)
+
+
+def _is_title_placeholder(sp) -> bool:
+    ph = sp.find(f"{{{PML_NS}}}nvSpPr/{{{PML_NS}}}nvPr/{{{PML_NS}}}ph")
+    return ph is not None and ph.attrib.get("idx", "0") == "0"
+
+
+def _scan_slide_summary(stream) -> str:
+    """逐段解析單頁 XML，只看 spTree 第一層的文字方塊：標題找到即停止，
+    否則取第一個有文字的方塊 (前 20 字)。"""
+    sp_tree = f"{{{PML_NS}}}spTree"
+    sp_tag = f"{{{PML_NS}}}sp"
+    stack = []
+    first_text = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            stack.append(elem.tag)
+            continue
+        stack.pop()
+        if not stack or stack[-1] != sp_tree:
+            continue
+        # spTree 的直接子元素已完整，判斷後即釋放
+        if elem.tag == sp_tag:
+            text = _shape_text(elem)
+            if _is_title_placeholder(elem) and text:
+                return text
+            if first_text is None and text.strip():
+                first_text = text.strip()[:20] + "..."
+        elem.clear()
+    return first_text or "無標題"
+
+
+def scan_slide_titles(pptx_path: str) -> List[str]:
+    """依投影片順序回傳每頁的標題或第一段文字摘要。
+
+    只讀取 presentation.xml、其 rels 與各頁 XML，不載入媒體，也不建立 python-pptx 物件。"""
+    with zipfile.ZipFile(pptx_path, "r") as z:
+        presentation_xml = _read_from_zip(z, PackageIndex.PRESENTATION)
+        rels_xml = _read_from_zip(z, PackageIndex.PRESENTATION_RELS)
+        if not presentation_xml or not rels_xml:
+            return []
+
+        targets = {}
+        for rel in ET.fromstring(rels_xml).findall(f"{{{PKG_REL_NS}}}Relationship"):
+            if rel.attrib.get("Type") == SLIDE_REL_TYPE:
+                targets[rel.attrib.get("Id", "")] = _resolve_target(PackageIndex.PRESENTATION, rel.attrib.get("Target", ""))
+
+        summaries = []
+        for sld_id in ET.fromstring(presentation_xml).iterfind(f".//{{{PML_NS}}}sldIdLst/{{{PML_NS}}}sldId"):
+            part = targets.get(sld_id.attrib.get(f"{{{OFFICE_NS}}}id", ""))
+            if part is None:
+                continue
+            try:
+                with z.open(part) as stream:
+                    summaries.append(_scan_slide_summary(stream))
+            except KeyError:
+                summaries.append("無標題")
+        return summaries
+
+
+def _drive_query_literal(value: str) -> str:
+    # Drive 查詢字串以單引號包住，內容中的反斜線與單引號需跳脫
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _list_drive_files(drive_service, query: str, fields: str = "id, name, webViewLink") -> List[dict]:
+    files: List[dict] = []
+    page_token = None
+    while True:
+        results = drive_service.files().list(
+            q=query,
+            spaces="drive",
+            fields=f"nextPageToken, files({fields})",
+            pageSize=1000,
+            pageToken=page_token,
+        ).execute()
+        files.extend(results.get("files", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return files
+
+
+def _drive_app_property_query() -> str:
+    key, value = DRIVE_APP_PROPERTY
+    return f"appProperties has {{ key={_drive_query_literal(key)} and value={_drive_query_literal(value)} }}"
+
+
+class DriveNameIndex:
+    """依檔名前綴 (例如 "[deck]_") 一次分頁列出 Drive 檔案並快取，
+    之後的「是否已存在」查詢都在本機回答；本程式新建的檔案會即時加入索引。
+
+    列出條件為「帶有 DRIVE_APP_PROPERTY 標記」或「name contains 前綴」，再於本機以前綴篩選：
+    本工具上傳的檔案不受 Drive 斷詞影響一定會列出，因此索引查不到即視為不存在；
+    contains 只用來涵蓋加上標記之前上傳的舊檔 (盡力而為)。"""
+
+    def __init__(self, ttl: float = DRIVE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # prefix -> (載入時間, {name: (file_id, web_link)})
+        self._entries = {}
+
+    def _load(self, drive_service, prefix: str) -> dict:
+        query = f"({_drive_app_property_query()} or name contains {_drive_query_literal(prefix)}) and trashed = false"
+        by_name = {}
+        for f in _list_drive_files(drive_service, query):
+            name = f.get("name", "")
+            # 標記會列出所有前綴的檔案、contains 為斷詞比對，都以前綴在本機篩選；同名取第一筆
+            if name.startswith(prefix) and name not in by_name:
+                by_name[name] = (f.get("id"), f.get("webViewLink"))
+        self._entries[prefix] = (time.monotonic(), by_name)
+        return by_name
+
+    def names(self, drive_service, prefix: str) -> dict:
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return self._load(drive_service, prefix)
+            return entry[1]
+
+    def lookup(self, drive_service, name: str, prefix: str) -> Optional[Tuple[str, str]]:
+        return self.names(drive_service, prefix).get(name)
+
+    def add(self, name: str, file_id: str, web_link: str) -> None:
+        with self._lock:
+            for prefix, (_, by_name) in self._entries.items():
+                if name.startswith(prefix):
+                    by_name.setdefault(name, (file_id, web_link))
+
+
+class DriveChecksumIndex:
+    """本工具上傳過的雲端影片與音訊的 md5Checksum 索引：內容相同的檔案 (不論來自哪份簡報或前綴)
+    直接沿用既有檔案的連結，不再重複上傳。
+
+    只收錄帶有 DRIVE_APP_PROPERTY 標記的檔案 (上傳時已設為知道連結者可檢視)，
+    使用者自己放在雲端的私人檔案即使內容相同也不會被拿來分享。"""
+
+    def __init__(self, ttl: float = DRIVE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        # md5 -> (file_id, web_link)
+        self._by_md5 = {}
+
+    def _load(self, drive_service) -> dict:
+        query = f"'me' in owners and trashed = false and ({OFFLOAD_MIME_QUERY}) and {_drive_app_property_query()}"
+        by_md5 = {}
+        for f in _list_drive_files(drive_service, query, fields="id, name, webViewLink, md5Checksum"):
+            md5 = f.get("md5Checksum")
+            if md5 and md5 not in by_md5:
+                by_md5[md5] = (f.get("id"), f.get("webViewLink"))
+        self._by_md5 = by_md5
+        self._loaded_at = time.monotonic()
+        return by_md5
+
+    def checksums(self, drive_service) -> dict:
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                return self._load(drive_service)
+            return self._by_md5
+
+    def lookup(self, drive_service, md5: str) -> Optional[Tuple[str, str]]:
+        return self.checksums(drive_service).get(md5)
+
+    def add(self, md5: str, file_id: str, web_link: str) -> None:
+        with self._lock:
+            self._by_md5.setdefault(md5, (file_id, web_link))
+
+
+def _zip_member_md5(pptx_path: str, info: zipfile.ZipInfo) -> str:
+    h = hashlib.md5()
+    with ZipMemberStream(pptx_path, info) as stream:
+        while True:
+            chunk = stream.read(_RAW_COPY_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_RAW_COPY_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _json_digest(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+_RUN_MANIFESTS = weakref.WeakValueDictionary()
+_RUN_MANIFESTS_LOCK = threading.Lock()
+
+
+class RunManifest:
+    """單一來源簡報的執行紀錄 (run_manifests/<sha256>.json)。
+
+    各步驟完成時記錄產出檔的雜湊與輸入條件；續跑時只沿用雜湊與條件都相符的產出，
+    其他簡報留下的同名暫存檔一律重新產生。影片連結與拆分上傳結果逐筆寫入，
+    中斷後不會重複上傳。
+
+    同一份簡報可能有多個背景任務同時執行：for_source 對同一個檔案回傳同一個實例
+    (共用鎖與內容)，不會各自覆寫對方的紀錄；exclusive(步驟) 讓同一步驟依序執行，
+    後到的任務會直接沿用先完成的結果。"""
+
+    def __init__(self, path: str, source_sha256: str, file_prefix: str = ""):
+        self.path = path
+        self.source_sha256 = source_sha256
+        self.file_prefix = file_prefix
+        # 背景上傳執行緒也會寫入，以鎖保護
+        self._lock = threading.RLock()
+        self._stage_locks = {}
+        self.stages = {}
+        self.resumed = False
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                # 前綴不同時雲端檔名也不同，不沿用先前的紀錄
+                if data.get("source_sha256") == source_sha256 and data.get("file_prefix", "") == file_prefix:
+                    self.stages = data.get("stages", {})
+                    self.resumed = bool(self.stages)
+            except Exception as e:
+                print(f"執行紀錄讀取失敗，將重新執行: {e}")
+
+    @classmethod
+    def for_source(cls, source_path: str, file_prefix: str = "", manifest_dir: str = RUN_MANIFEST_DIR) -> "RunManifest":
+        os.makedirs(manifest_dir, exist_ok=True)
+        digest = _sha256_file(source_path)
+        # 前綴不同的任務各自一份紀錄 (雲端檔名不同，不能共用)
+        name = digest if not file_prefix else f"{digest}_{hashlib.sha256(file_prefix.encode('utf-8')).hexdigest()[:8]}"
+        path = os.path.abspath(os.path.join(manifest_dir, f"{name}.json"))
+        with _RUN_MANIFESTS_LOCK:
+            manifest = _RUN_MANIFESTS.get(path)
+            if manifest is None:
+                manifest = _RUN_MANIFESTS[path] = cls(path, digest, file_prefix)
+            return manifest
+
+    def exclusive(self, name: str) -> threading.Lock:
+        """同一步驟的鎖；共用此紀錄的任務依序執行該步驟。"""
+        with self._lock:
+            return self._stage_locks.setdefault(name, threading.Lock())
+
+    def save(self) -> None:
+        with self._lock:
+            _write_json_atomic(self.path, {
+                "source_sha256": self.source_sha256,
+                "file_prefix": self.file_prefix,
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "stages": self.stages,
+            })
+
+    def stage(self, name: str) -> dict:
+        with self._lock:
+            return self.stages.setdefault(name, {})
+
+    def is_done(self, name: str) -> bool:
+        return bool(self.stages.get(name, {}).get("done"))
+
+    def mark_done(self, name: str, **data) -> None:
+        with self._lock:
+            self.stage(name).update(data, done=True)
+            self.save()
+
+    # --- 產出檔 (Step 2 / Step 3) ---
+    def artifact_valid(self, name: str, path: str, inputs: dict) -> bool:
+        st = self.stages.get(name, {})
+        if not st.get("done") or st.get("inputs") != inputs or not os.path.exists(path):
+            return False
+        return _sha256_file(path) == st.get("sha256")
+
+    def record_artifact(self, name: str, path: str, inputs: dict, **data) -> None:
+        with self._lock:
+            self.stages[name] = dict(data, inputs=inputs, artifact=path, sha256=_sha256_file(path), done=True)
+            self.save()
+
+    # --- 影片連結 (Step 1) ---
+    def video_map(self) -> dict:
+        with self._lock:
+            return dict(self.stage("videos").get("video_map", {}))
+
+    def record_video(self, original_filename: str, web_link: str) -> None:
+        with self._lock:
+            self.stage("videos").setdefault("video_map", {})[original_filename] = web_link
+            self.save()
+
+    # --- 拆分上傳與內嵌優化 (Step 4 / Step 5) ---
+    @staticmethod
+    def job_key(job: dict) -> str:
+        # 頁碼或檔名改過的任務視為新任務
+        return f"{job.get('id')}:{job.get('start')}-{job.get('end')}:{job.get('filename')}"
+
+    def restore_job(self, job: dict) -> bool:
+        with self._lock:
+            record = self.stage("split").get("jobs", {}).get(self.job_key(job))
+        if not record:
+            return False
+        job.update(record)
+        return True
+
+    def record_job(self, job: dict) -> None:
+        with self._lock:
+            self.stage("split").setdefault("jobs", {})[self.job_key(job)] = {
+                k: job[k] for k in ("final_link", "presentation_id", "video_links", "image_level", "image_quality") if k in job
+            }
+            self.save()
+
+    def is_embedded(self, job: dict) -> bool:
+        return job.get("presentation_id") in self.stages.get("embed", {}).get("presentations", [])
+
+    def record_embedded(self, job: dict) -> None:
+        with self._lock:
+            done = self.stage("embed").setdefault("presentations", [])
+            if job.get("presentation_id") not in done:
+                done.append(job.get("presentation_id"))
+            self.save()
+
+
+class SheetIdIndex:
+    """試算表 A 欄 (任務 ID) 的本地索引。報表只會往下增加，所以每次只讀取上次
+    列數之後的新列；抽查的錨點列對不上 (列被刪除或重新排序) 時才整欄重新同步。
+    尚未成功寫入的列也存在這裡，下次執行時一併補寫。"""
+
+    def __init__(self, path: str = SHEET_INDEX_FILE, spreadsheet_id: str = SPREADSHEET_ID, sheet: str = SHEET_NAME):
+        self.path = path
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet = sheet
+        self.row_count = 0
+        # 列號 (字串) -> 該列的 ID，用來偵測工作表是否被改動
+        self.anchors = {}
+        self.ids = set()
+        # 已排入但尚未確認寫入的列
+        self.pending = []
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"試算表索引讀取失敗，將重新同步: {e}")
+            return
+        if data.get("spreadsheet_id") != self.spreadsheet_id or data.get("sheet") != self.sheet:
+            return
+        self.row_count = data.get("row_count", 0)
+        self.anchors = data.get("anchors", {})
+        self.ids = set(data.get("ids", []))
+        self.pending = data.get("pending", [])
+
+    def save(self) -> None:
+        _write_json_atomic(self.path, {
+            "spreadsheet_id": self.spreadsheet_id,
+            "sheet": self.sheet,
+            "row_count": self.row_count,
+            "anchors": self.anchors,
+            "ids": sorted(self.ids),
+            "pending": self.pending,
+        })
+
+    @staticmethod
+    def _cell(values) -> str:
+        return values[0][0] if values and values[0] else ""
+
+    def _set_rows(self, rows, start_row: int) -> None:
+        for r in rows:
+            if r:
+                self.ids.add(r[0])
+        self.row_count = start_row - 1 + len(rows)
+        if not self.row_count:
+            self.anchors = {}
+            return
+        known = {str(start_row + i): (r[0] if r else "") for i, r in enumerate(rows)}
+        if start_row == 1:
+            # 整欄同步：抽查首列、中間列與最後一列
+            sample = sorted({1, max(1, self.row_count // 2), self.row_count})
+        else:
+            # 增量同步：保留首列與上次最後一列，再加上新的最後一列
+            known.update(self.anchors)
+            keys = sorted(known.keys() & (self.anchors.keys() | {str(self.row_count)}), key=int)
+            sample = sorted({int(keys[0]), int(keys[-2]) if len(keys) > 1 else int(keys[0]), self.row_count})
+        self.anchors = {str(n): known[str(n)] for n in sample}
+
+    def _full_sync(self, sheets_service) -> None:
+        result = sheets_service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"{self.sheet}!A:A",
+        ).execute()
+        self.ids = set()
+        self.anchors = {}
+        self._set_rows(result.get("values", []), 1)
+
+    def sync(self, sheets_service, log_callback=None) -> Set[str]:
+        if not self.row_count or not self.anchors:
+            self._full_sync(sheets_service)
+            self.save()
+            return self.ids
+
+        anchor_rows = sorted(self.anchors, key=int)
+        ranges = [f"{self.sheet}!A{n}:A{n}" for n in anchor_rows]
+        ranges.append(f"{self.sheet}!A{self.row_count + 1}:A")
+        result = sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=ranges,
+        ).execute()
+        value_ranges = result.get("valueRanges", [])
+
+        unchanged = len(value_ranges) == len(ranges) and all(
+            self._cell(vr.get("values")) == self.anchors[n]
+            for n, vr in zip(anchor_rows, value_ranges)
+        )
+        if not unchanged:
+            _log(log_callback, "🔄 試算表內容有異動 (刪除或重新排序)，重新讀取整欄 ID...")
+            self._full_sync(sheets_service)
+        else:
+            new_rows = value_ranges[-1].get("values", [])
+            if new_rows:
+                self._set_rows(new_rows, self.row_count + 1)
+        self.save()
+        return self.ids
+
+    def queue(self, rows) -> None:
+        known = {r[0] for r in self.pending}
+        self.pending.extend(r for r in rows if r[0] not in known)
+        self.save()
+
+    def take_pending(self):
+        # 上次寫入其實已成功 (只是沒收到回應) 的列不再重送
+        self.pending = [r for r in self.pending if r[0] not in self.ids]
+        return list(self.pending)
+
+    def mark_appended(self, rows) -> None:
+        # 不更新 row_count：下次同步會以增量讀回這些列並核對錨點
+        appended = {r[0] for r in rows}
+        self.ids.update(appended)
+        self.pending = [r for r in self.pending if r[0] not in appended]
+        self.save()
+
+
+class _TimedHttpRequest(HttpRequest):
+    """每次 API 呼叫 (含可續傳上傳的每個分段) 記錄一個 span，寫入 bot 目前的 metrics。"""
+
+    def __init__(self, bot, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._bot = bot
+
+    def execute(self, http=None, num_retries=0):
+        if self.resumable is not None:
+            # 可續傳上傳由 next_chunk 逐段記錄，避免重複計算
+            return super().execute(http=http, num_retries=num_retries)
+        with self._bot.metrics.span("api.call", method=self.methodId or self.method) as span:
+            span.add_bytes(len(self.body or b""))
+            return super().execute(http=http, num_retries=num_retries)
+
+    def next_chunk(self, http=None, num_retries=0):
+        with self._bot.metrics.span("api.call", method=f"{self.methodId}.chunk") as span:
+            before = self.resumable_progress
+            status, response = super().next_chunk(http=http, num_retries=num_retries)
+            after = self.resumable_progress
+            if response is not None and self.resumable.size():
+                # 最後一段完成時 resumable_progress 不會更新
+                after = self.resumable.size()
+            span.add_bytes(max(0, after - before))
+            return status, response
+
+
 class PPTAutomationBot:
-    def __init__(self):
-        self.creds = self._get_credentials()
+    def __init__(self, creds=None, service_factory=None):
+        # service_factory(name, version, requestBuilder=...) 可替換 Google 服務 (離線測試與效能量測用)
+        self._service_factory = service_factory
+        # 效能量測 (metrics.MetricsRecorder)；預設不記錄，由發布流程在執行期間指定
+        self.metrics = NULL_METRICS
+        self.creds = creds if creds is not None else self._get_credentials()
+        # googleapiclient 的 http 物件非執行緒安全，平行上傳時每條執行緒各自建立服務
+        self._thread_local = threading.local()
+        self.drive_index = DriveNameIndex()
+        self.checksum_index = DriveChecksumIndex()
         
         if self.creds:
-            self.drive_service = build("drive", "v3", credentials=self.creds)
-            self.slides_service = build("slides", "v1", credentials=self.creds)
-            self.sheets_service = build("sheets", "v4", credentials=self.creds)
+            self.drive_service = self._build_service("drive", "v3")
+            self.slides_service = self._build_service("slides", "v1")
+            self.sheets_service = self._build_service("sheets", "v4")
         else:
             self.drive_service = None
             self.slides_service = None
@@ -245,6 +2212,23 @@ class PPTAutomationBot:
         
         return creds
 
+    def _request_builder(self, *args, **kwargs):
+        return _TimedHttpRequest(self, *args, **kwargs)
+
+    def _build_service(self, name, version):
+        if self._service_factory is not None:
+            return self._service_factory(name, version, requestBuilder=self._request_builder)
+        return build(name, version, credentials=self.creds, requestBuilder=self._request_builder)
+
+    def _thread_service(self, name, version):
+        services = getattr(self._thread_local, "services", None)
+        if services is None:
+            services = self._thread_local.services = {}
+        key = (name, version)
+        if key not in services:
+            services[key] = self._build_service(name, version)
+        return services[key]
+
     def get_user_email(self):
         if not self.drive_service:
             return "服務未初始化"
@@ -254,10 +2238,16 @@ class PPTAutomationBot:
         except Exception:
             return "未知"
 
-    def _check_drive_file_exists(self, filename):
+    def _check_drive_file_exists(self, filename, drive_service=None, prefix=None):
+        drive_service = drive_service or self.drive_service
         try:
-            query = f"name = '{filename}' and trashed = false"
-            results = self.drive_service.files().list(
+            # 有前綴時只查本機索引 (本工具上傳的檔案都帶標記，一定在索引內)，不必各打一次 files.list
+            if prefix and filename.startswith(prefix):
+                return self.drive_index.lookup(drive_service, filename, prefix)
+
+            # 沒有前綴的檔名無法以索引涵蓋，逐一以完整檔名查詢
+            query = f"name = {_drive_query_literal(filename)} and trashed = false"
+            results = drive_service.files().list(
                 q=query, spaces="drive", fields="files(id, name, webViewLink)"
             ).execute()
             files = results.get("files", [])
@@ -267,6 +2257,10 @@ class PPTAutomationBot:
             print(f"查詢 Drive 失敗: {e}")
         return None
 
+    @staticmethod
+    def _drive_name_prefix(file_prefix):
+        return f"[{file_prefix}]_" if file_prefix else None
+
     def _create_play_icon(self, filename):
         if os.path.exists(filename):
             return
@@ -283,322 +2277,484 @@ class PPTAutomationBot:
 
         tmp_out = f"{pptx_path}.pruned_{uuid.uuid4().hex[:6]}.pptx"
 
-        with zipfile.ZipFile(pptx_path, "r") as zin:
-            names = set(zin.namelist())
-
-            root_rels_name = "_rels/.rels"
-            root_rels_xml = _read_from_zip(zin, root_rels_name)
-            fixed_root_rels = _ensure_officedocument_in_root_rels(root_rels_xml)
-
-            pres_xml_name = "ppt/presentation.xml"
-            pres_rels_name = "ppt/_rels/presentation.xml.rels"
-
-            pres_xml = _read_from_zip(zin, pres_xml_name)
-            pres_rels_xml = _read_from_zip(zin, pres_rels_name)
-
-            pres_rels_fixed: Optional[bytes] = None
-            if pres_xml and pres_rels_xml:
-                used_slide_rids = _used_slide_rids_from_presentation_xml(pres_xml)
-                pres_rels_clean = _strip_video_relationships(pres_rels_xml)
-                pres_rels_fixed = _rebuild_presentation_rels(pres_rels_clean, used_slide_rids)
-
-            def get_rels_xml(rels_name: str) -> Optional[bytes]:
-                b = _read_from_zip(zin, rels_name)
-                if b is None:
-                    return None
-                if rels_name == pres_rels_name and pres_rels_fixed is not None:
-                    return pres_rels_fixed
-                return _strip_video_relationships(b)
-
-            keep: Set[str] = set()
-            keep.add("[Content_Types].xml")
-            keep.add(root_rels_name)
-
-            queue: List[str] = []
-
-            try:
-                for target, is_ext in _parse_relationship_targets(fixed_root_rels):
-                    if is_ext:
-                        continue
-                    resolved = _resolve_target("", target)
-                    if resolved in names:
-                        if resolved.startswith("ppt/media/") and resolved.lower().endswith(VIDEO_EXTS):
-                            continue
-                        queue.append(resolved)
-            except Exception:
-                pass
-
-            while queue:
-                part = _normalize_part_path(queue.pop())
-                if part in keep:
-                    continue
-                if part.startswith("ppt/media/") and part.lower().endswith(VIDEO_EXTS):
-                    continue
-                if part not in names:
-                    continue
-
-                keep.add(part)
-
-                rels_name = _rels_path_for_part(part)
-                if rels_name in names:
-                    keep.add(rels_name)
-                    rels_xml = get_rels_xml(rels_name)
-                    if rels_xml:
-                        try:
-                            for target, is_ext in _parse_relationship_targets(rels_xml):
-                                if is_ext:
-                                    continue
-                                resolved = _resolve_target(part, target)
-                                if resolved in names:
-                                    if resolved.startswith("ppt/media/") and resolved.lower().endswith(VIDEO_EXTS):
-                                        continue
-                                    queue.append(resolved)
-                        except Exception:
-                            pass
-
-            for maybe in ("docProps/app.xml", "docProps/core.xml"):
-                if maybe in names:
-                    keep.add(maybe)
-                    rels_name = _rels_path_for_part(maybe)
-                    if rels_name in names:
-                        keep.add(rels_name)
-
-            with zipfile.ZipFile(tmp_out, "w", compression=zipfile.ZIP_DEFLATED) as zout:
-                ct_xml = _read_from_zip(zin, "[Content_Types].xml")
-                if ct_xml:
-                    ct_xml2 = _prune_content_types_overrides(ct_xml, keep)
-                    zout.writestr("[Content_Types].xml", ct_xml2)
-
-                zout.writestr(root_rels_name, fixed_root_rels)
-
-                for name in sorted(keep):
-                    if name in ("[Content_Types].xml", root_rels_name):
-                        continue
-                    if name.startswith("ppt/media/") and name.lower().endswith(VIDEO_EXTS):
-                        continue
-                    if name not in names:
-                        continue
-
-                    if name.lower().endswith(".rels"):
-                        b = get_rels_xml(name)
-                        if b is None:
-                            continue
-                        zout.writestr(name, b)
-                    elif name == pres_rels_name and pres_rels_fixed is not None:
-                        zout.writestr(name, pres_rels_fixed)
-                    else:
-                        zout.writestr(name, zin.read(name))
+        index = PackageIndex(pptx_path)
+        index.write_split(tmp_out, set(index.slide_rids))
 
         os.replace(tmp_out, pptx_path)
         _log(log_callback, f"✅ [Prune] {os.path.basename(pptx_path)}：清理完成。")
 
-    # === Step 1: 提取與上傳影片 ===
-    def extract_and_upload_videos(self, pptx_path, extract_dir, file_prefix="", progress_callback=None, log_callback=None):
+    # === Step 1: 提取與上傳影片 (可設定同時上傳數) ===
+    def extract_and_upload_videos(self, pptx_path, extract_dir, file_prefix="", progress_callback=None, log_callback=None, max_workers=1,
+                                  manifest: Optional[RunManifest] = None):
         if not self.drive_service:
             _log(log_callback, "❌ 服務未初始化，無法上傳影片。")
             return {}
 
-        if not os.path.exists(extract_dir):
-            os.makedirs(extract_dir)
+        if manifest is not None and manifest.is_done("videos"):
+            video_map = manifest.video_map()
+            _log(log_callback, f"⏭️ 執行紀錄：{len(video_map)} 個影片/音訊皆已上傳，跳過 Step 1。")
+            return video_map
 
-        safe_prefix = file_prefix if file_prefix else "default"
-        map_filename = f"video_map_{safe_prefix}.json"
-        map_path = map_filename
+        # extract_dir 保留以相容既有呼叫；影片已改為直接由 zip 串流上傳，不再解壓到磁碟
+        map_lock = threading.Lock()
+        if manifest is not None:
+            # 對照表存在執行紀錄中，只沿用同一份來源簡報的結果
+            video_map = manifest.video_map()
 
-        video_map = {}
-        if os.path.exists(map_path):
-            try:
-                with open(map_path, "r", encoding="utf-8") as f:
-                    video_map = json.load(f)
-            except Exception:
-                pass
-
-        with zipfile.ZipFile(pptx_path, "r") as z:
-            video_files = [
-                f for f in z.infolist()
-                if f.filename.startswith("ppt/media/")
-                and f.filename.lower().endswith(VIDEO_EXTS)
-            ]
-            video_files.sort(key=lambda f: natural_sort_key(os.path.basename(f.filename)))
-            total_videos = len(video_files)
-
-            _log(log_callback, f"📊 掃描完成：共發現 {total_videos} 個影片檔。")
+            def record_link(original_filename, web_link):
+                with map_lock:
+                    video_map[original_filename] = web_link
+                manifest.record_video(original_filename, web_link)
+        else:
+            safe_prefix = file_prefix if file_prefix else "default"
+            map_filename = f"video_map_{safe_prefix}.json"
+            map_path = map_filename
 
-            for idx, file_info in enumerate(video_files):
-                original_filename = os.path.basename(file_info.filename)
+            video_map = {}
+            if os.path.exists(map_path):
+                try:
+                    with open(map_path, "r", encoding="utf-8") as f:
+                        video_map = json.load(f)
+                except Exception:
+                    pass
 
-                if original_filename in video_map:
-                    _log(log_callback, f"⏭️ ({idx+1}/{total_videos}) {original_filename} 本地紀錄已存在，跳過。")
-                    continue
+            # 每完成一支就寫回對照表，平行上傳時以鎖保護，確保中斷後可續傳
+            def record_link(original_filename, web_link):
+                with map_lock:
+                    video_map[original_filename] = web_link
+                    _write_json_atomic(map_path, video_map)
 
-                _log(log_callback, f"📦 ({idx+1}/{total_videos}) 正在解壓縮與查重：{original_filename} ...")
+        with zipfile.ZipFile(pptx_path, "r") as z:
+            # 音訊 (旁白等) 與影片一樣上傳並改為連結
+            video_files = [f for f in z.infolist() if _is_offload_media_part(f.filename)]
+        video_files.sort(key=lambda f: natural_sort_key(os.path.basename(f.filename)))
+        total_videos = len(video_files)
 
-                z.extract(file_info, extract_dir)
-                full_path = os.path.join(extract_dir, file_info.filename)
+        total_audio = sum(1 for f in video_files if _is_audio_part(f.filename))
+        _log(log_callback, f"📊 掃描完成：共發現 {total_videos - total_audio} 個影片檔、{total_audio} 個音訊檔。")
 
-                upload_name = f"[{file_prefix}]_{original_filename}" if file_prefix else original_filename
+        name_prefix = self._drive_name_prefix(file_prefix)
+        if name_prefix and any(os.path.basename(f.filename) not in video_map for f in video_files):
+            try:
+                # 一次列出同前綴的雲端檔案，之後查重都在本機完成
+                known = self.drive_index.names(self.drive_service, name_prefix)
+                _log(log_callback, f"🔍 雲端索引：前綴 {name_prefix} 共 {len(known)} 個檔案。")
+            except Exception as e:
+                print(f"查詢 Drive 失敗: {e}")
 
-                existing_file = self._check_drive_file_exists(upload_name)
-                if existing_file:
-                    _, web_link = existing_file
-                    _log(log_callback, f"☁️ ({idx+1}/{total_videos}) 雲端已有檔案：{upload_name}，直接使用！")
-                    video_map[original_filename] = web_link
-                    with open(map_path, "w", encoding="utf-8") as f:
-                        json.dump(video_map, f, indent=4)
-                    continue
+        if any(os.path.basename(f.filename) not in video_map for f in video_files):
+            try:
+                checksums = self.checksum_index.checksums(self.drive_service)
+                _log(log_callback, f"🔍 內容索引：雲端共 {len(checksums)} 個影片/音訊可供比對。")
+            except Exception as e:
+                print(f"查詢 Drive 失敗: {e}")
 
-                _log(log_callback, f"⬆️ ({idx+1}/{total_videos}) 開始上傳：{upload_name} ...")
+        pending_videos = []
+        for idx, file_info in enumerate(video_files):
+            original_filename = os.path.basename(file_info.filename)
+            if original_filename in video_map:
+                _log(log_callback, f"⏭️ ({idx+1}/{total_videos}) {original_filename} 本地紀錄已存在，跳過。")
+                continue
+            pending_videos.append((idx, file_info))
+
+        max_workers = max(1, int(max_workers or 1))
+        if max_workers == 1 or len(pending_videos) <= 1:
+            for idx, file_info in pending_videos:
+                self._upload_single_video(
+                    pptx_path, file_info, file_prefix, f"({idx+1}/{total_videos})",
+                    self.drive_service, progress_callback, record_link, log_callback,
+                )
+            self._mark_videos_done(manifest, video_files, video_map)
+            return video_map
+
+        _log(log_callback, f"🚀 平行上傳：{len(pending_videos)} 個影片/音訊，同時 {max_workers} 個。")
+        progress = _UploadProgress()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(
+                    self._upload_single_video,
+                    pptx_path, file_info, file_prefix, f"({idx+1}/{total_videos})",
+                    None, progress.update, record_link, log_callback,
+                )
+                for idx, file_info in pending_videos
+            }
+            while futures:
+                done, futures = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+                progress.flush(progress_callback)
+                for future in done:
+                    future.result()
+
+        self._mark_videos_done(manifest, video_files, video_map)
+        return video_map
 
-                try:
-                    file_metadata = {"name": upload_name}
-                    CHUNK_SIZE = 5 * 1024 * 1024
-                    media = MediaFileUpload(full_path, resumable=True, chunksize=CHUNK_SIZE)
-
-                    request = self.drive_service.files().create(
-                        body=file_metadata, media_body=media, fields="id, webViewLink"
-                    )
-
-                    response = None
-                    while response is None:
-                        status, response = request.next_chunk()
-                        if status and progress_callback:
-                            # 這裡傳遞的是單個檔案的上傳進度
-                            progress_callback(upload_name, int(status.resumable_progress), int(status.total_size))
-
-                    file = response
-                    self.drive_service.permissions().create(
-                        fileId=file.get("id"),
-                        body={"type": "anyone", "role": "reader"},
-                    ).execute()
+    @staticmethod
+    def _mark_videos_done(manifest, video_files, video_map):
+        # 全部影片都有連結才算完成，否則下次只補傳缺少的部分
+        if manifest is not None and all(os.path.basename(f.filename) in video_map for f in video_files):
+            manifest.mark_done("videos")
+
+    def _upload_single_video(self, pptx_path, file_info, file_prefix, tag,
+                             drive_service, progress_callback, record_link, log_callback):
+        with self.metrics.span("video.upload", attrs={"file": os.path.basename(file_info.filename)}) as span:
+            result = self._upload_video_member(
+                pptx_path, file_info, file_prefix, tag, drive_service, progress_callback, record_link, log_callback
+            )
+            span.set(result=result)
+            if result == "uploaded":
+                span.add_bytes(file_info.file_size)
+
+    def _upload_video_member(self, pptx_path, file_info, file_prefix, tag,
+                             drive_service, progress_callback, record_link, log_callback) -> str:
+        """回傳 "existing" (同名)、"duplicate" (同內容)、"uploaded" 或 "failed"。"""
+        # drive_service 為 None 時表示在背景執行緒，改用該執行緒專屬的服務
+        drive_service = drive_service or self._thread_service("drive", "v3")
+        original_filename = os.path.basename(file_info.filename)
+
+        _log(log_callback, f"📦 {tag} 正在查重：{original_filename} ...")
+
+        upload_name = f"[{file_prefix}]_{original_filename}" if file_prefix else original_filename
+
+        existing_file = self._check_drive_file_exists(
+            upload_name, drive_service, prefix=self._drive_name_prefix(file_prefix)
+        )
+        if existing_file:
+            _, web_link = existing_file
+            _log(log_callback, f"☁️ {tag} 雲端已有檔案：{upload_name}，直接使用！")
+            record_link(original_filename, web_link)
+            return "existing"
+
+        # 內容查重：同一支影片可能以其他檔名或前綴上傳過
+        md5 = None
+        try:
+            md5 = _zip_member_md5(pptx_path, file_info)
+            same_content = self.checksum_index.lookup(drive_service, md5)
+            if same_content:
+                _, web_link = same_content
+                _log(log_callback, f"♻️ {tag} 雲端已有相同內容的影片：{original_filename}，直接使用！")
+                record_link(original_filename, web_link)
+                return "duplicate"
+        except Exception as e:
+            print(f"內容查重失敗: {e}")
 
-                    video_map[original_filename] = file.get("webViewLink")
-                    with open(map_path, "w", encoding="utf-8") as f:
-                        json.dump(video_map, f, indent=4)
+        _log(log_callback, f"⬆️ {tag} 開始上傳：{upload_name} ...")
 
-                except Exception as e:
-                    print(f"上傳失敗: {e}")
-                    pass
+        stream = None
+        try:
+            file_metadata = {"name": upload_name, "appProperties": dict([DRIVE_APP_PROPERTY])}
+            CHUNK_SIZE = 5 * 1024 * 1024
+            # 直接由 zip 成員串流分段上傳
+            stream = ZipMemberStream(pptx_path, file_info)
+            mimetype = mimetypes.guess_type(original_filename)[0] or "application/octet-stream"
+            media = MediaIoBaseUpload(stream, mimetype=mimetype, resumable=True, chunksize=CHUNK_SIZE)
+
+            request = drive_service.files().create(
+                body=file_metadata, media_body=media, fields="id, webViewLink, md5Checksum"
+            )
+
+            response = None
+            while response is None:
+                status, response = request.next_chunk()
+                if status and progress_callback:
+                    # 這裡傳遞的是單個檔案的上傳進度
+                    progress_callback(upload_name, int(status.resumable_progress), int(status.total_size))
+
+            file = response
+            drive_service.permissions().create(
+                fileId=file.get("id"),
+                body={"type": "anyone", "role": "reader"},
+            ).execute()
 
-        return video_map
+            self.drive_index.add(upload_name, file.get("id"), file.get("webViewLink"))
+            if file.get("md5Checksum") or md5:
+                self.checksum_index.add(file.get("md5Checksum") or md5, file.get("id"), file.get("webViewLink"))
+            record_link(original_filename, file.get("webViewLink"))
+            return "uploaded"
 
-    # === Step 2: 置換為圖片連結 (加入進度回報) ===
-    def replace_videos_with_images(self, input_pptx, output_pptx, video_map, progress_callback=None):
-        if os.path.exists(output_pptx):
-            print(f"Step 2: {output_pptx} 已存在，跳過。")
-            return
+        except Exception as e:
+            print(f"上傳失敗: {e}")
+            return "failed"
+        finally:
+            if stream is not None:
+                stream.close()
+
+    # === Step 2: 置換為圖片連結 (單次串流改寫，加入進度回報) ===
+    def replace_videos_with_images(self, input_pptx, output_pptx, video_map, progress_callback=None,
+                                   manifest: Optional[RunManifest] = None):
+        # 只沿用執行紀錄中雜湊相符的產出；其他留在磁碟上的檔案一律重新產生
+        inputs = {"video_map": _json_digest(video_map)}
+        if manifest is not None and manifest.artifact_valid("links", output_pptx, inputs):
+            print(f"Step 2: {output_pptx} 已完成 (執行紀錄相符)，跳過。")
+            return manifest.stage("links").get("replaced", 0)
 
         icon_path = "play_icon.png"
         self._create_play_icon(icon_path)
-
-        prs = Presentation(input_pptx)
-        total_slides = len(prs.slides) # 計算總頁數用於進度
-
-        for i, slide in enumerate(prs.slides):
-            # 回報進度
-            if progress_callback:
-                progress_callback(i + 1, total_slides)
-
-            slide_video_filenames = []
-            for rel in slide.part.rels.values():
-                if "media" in rel.target_ref:
-                    fname = os.path.basename(rel.target_ref)
-                    if fname in video_map:
-                        slide_video_filenames.append(fname)
-
-            shapes_to_replace = []
-            for shape in slide.shapes:
-                if shape.shape_type == MSO_SHAPE_TYPE.MEDIA:
-                    target_filename = None
-                    if len(slide_video_filenames) >= 1:
-                        target_filename = slide_video_filenames[0]
-
-                    if target_filename and target_filename in video_map:
-                        shapes_to_replace.append({
-                            "shape": shape,
-                            "link": video_map[target_filename],
-                            "left": shape.left, "top": shape.top,
-                            "width": shape.width, "height": shape.height,
-                        })
-
-            for item in shapes_to_replace:
-                sp = item["shape"]
-                sp.element.getparent().remove(sp.element)
-                pic = slide.shapes.add_picture(
-                    icon_path, item["left"], item["top"], item["width"], item["height"]
+        with open(icon_path, "rb") as f:
+            icon_bytes = f.read()
+
+        # 一次開檔、一次寫出；進度以「含影片的投影片」為單位
+        replaced = _rewrite_media_as_links(
+            input_pptx, output_pptx, video_map, icon_bytes, progress_callback=progress_callback
+        )
+        print(f"Step 2: 共置換 {replaced} 個影片/音訊物件。")
+        if manifest is not None:
+            manifest.record_artifact("links", output_pptx, inputs, replaced=replaced)
+        return replaced
+
+    def _transcode_legacy_images(self, zin, file_list, display_sizes, executor=None,
+                                 cache: Optional[ImageCache] = None) -> Tuple[dict, int, int]:
+        """Step 3 前置：BMP/TIFF 轉成 PNG/JPEG，回傳 ({原 part: (新 part, 內容)}, 快取命中, 未命中)。
+
+        新檔名必須在寫出任何 rels 與 [Content_Types].xml 之前決定，所以先轉完這類圖片
+        (通常只有少數幾張)；轉檔後沒有變小的維持原檔。"""
+        names = {item.filename for item in file_list}
+        results = {}
+        pending = deque()
+        inflight_bytes = 0
+        hits = misses = 0
+
+        def collect():
+            nonlocal inflight_bytes
+            item, future, cache_key = pending.popleft()
+            inflight_bytes -= item.file_size
+            try:
+                result, wall, cpu_used = future.result()
+            except Exception as e:
+                print(f"   ❌ 轉換圖片 {item.filename} 失敗: {e}，保留原檔。")
+                return
+            if wall is not None:
+                self.metrics.record(
+                    "image.transcode", wall, cpu_used, nbytes=item.file_size,
+                    attrs={"part": item.filename, "output_bytes": len(result[1]) if result else None},
                 )
-                pic.click_action.hyperlink.address = item["link"]
-
-        prs.save(output_pptx)
-
-    # === Step 3: 檔案瘦身 (加入進度回報) ===
-    def shrink_pptx(self, input_pptx, output_pptx, progress_callback=None):
-        if os.path.exists(output_pptx):
-            print(f"Step 3: {output_pptx} 已存在，跳過。")
-            return
-
-        print("🚀 開始執行 Step 3: 圖片壓縮 (1280px/Q50)...")
-
-        with zipfile.ZipFile(input_pptx, "r") as zin:
-            # 計算總檔案數用於進度
-            file_list = zin.infolist()
-            total_files = len(file_list)
-
-            with zipfile.ZipFile(output_pptx, "w", compression=zipfile.ZIP_DEFLATED) as zout:
-                for i, item in enumerate(file_list):
-                    # 回報進度
-                    if progress_callback:
-                        progress_callback(i + 1, total_files)
+            if cache_key:
+                cache.put(cache_key, result[1] if result else b"")
+            if result:
+                fmt, data = result
+                new_name = _unique_part_name(
+                    names, posixpath.splitext(item.filename)[0] + TRANSCODE_FORMATS[fmt][0]
+                )
+                names.add(new_name)
+                results[item.filename] = (new_name, data)
 
-                    name = item.filename
+        for item in file_list:
+            if not _is_transcode_part(item.filename):
+                continue
+            data = zin.read(item.filename)
+            display_px = display_sizes.get(item.filename)
+            cache_key = None
+            future = Future()
+            if cache is not None:
+                cache_key = cache.make_key(data, SHRINK_MAX_EDGE, SHRINK_JPEG_QUALITY, "TRANSCODE", display_px)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    # 快取內容的格式由檔頭判斷；空內容 (或不比原檔小) 代表轉檔不會變小
+                    hits += 1
+                    cache_key = None
+                    fmt = Image.open(io.BytesIO(cached)).format if 0 < len(cached) < len(data) else None
+                    future.set_result(((fmt, cached) if fmt in TRANSCODE_FORMATS else None, None, None))
+            if not future.done():
+                if cache_key:
+                    misses += 1
+                if executor is not None:
+                    future = executor.submit(_timed_recompress, item.filename, data, display_px, True)
+                    inflight_bytes += item.file_size
+                else:
+                    try:
+                        future.set_result(_timed_recompress(item.filename, data, display_px, True))
+                    except Exception as e:
+                        future.set_exception(e)
+            pending.append((item, future, cache_key))
+            while pending and (inflight_bytes > SHRINK_MAX_INFLIGHT_BYTES or pending[0][1].done()):
+                collect()
+
+        while pending:
+            collect()
+        return results, hits, misses
+
+    # === Step 3: 檔案瘦身 (加入進度回報，可多行程壓縮圖片) ===
+    def shrink_pptx(self, input_pptx, output_pptx, progress_callback=None, workers=1,
+                    cache: Optional[ImageCache] = None, log_callback=None,
+                    manifest: Optional[RunManifest] = None, target_dpi: Optional[int] = None):
+        # target_dpi：依圖片在投影片上的最大顯示尺寸縮到該解析度 (仍不超過長邊上限)
+        inputs = None
+        if manifest is not None:
+            inputs = {
+                "input_sha256": _sha256_file(input_pptx),
+                "max_edge": SHRINK_MAX_EDGE,
+                "quality": SHRINK_JPEG_QUALITY,
+                "target_dpi": target_dpi,
+            }
+            if manifest.artifact_valid("shrink", output_pptx, inputs):
+                print(f"Step 3: {output_pptx} 已完成 (執行紀錄相符)，跳過。")
+                return
+
+        workers = max(1, int(workers or 1))
+        print(f"🚀 開始執行 Step 3: 圖片壓縮 (1280px/Q50，{workers} 個工作行程)...")
+
+        kept = 0
+        executor = _image_process_pool(workers) if workers > 1 else None
+        try:
+            with zipfile.ZipFile(input_pptx, "r") as zin, open(input_pptx, "rb") as src:
+                # 計算總檔案數用於進度
+                file_list = zin.infolist()
+                total_files = len(file_list)
+                display_sizes = _display_pixel_sizes(zin, target_dpi) if target_dpi else {}
+                if target_dpi:
+                    sized = sum(1 for v in display_sizes.values() if v)
+                    _log(log_callback, f"📐 [Shrink] 依顯示尺寸 ({target_dpi} DPI) 縮圖：{sized}/{len(display_sizes)} 張圖片可判斷尺寸。")
+
+                transcoded, hits, misses = self._transcode_legacy_images(zin, file_list, display_sizes, executor, cache)
+                renames = {old: new for old, (new, _) in transcoded.items()}
+                if transcoded:
+                    _log(log_callback, f"🔄 [Shrink] {len(transcoded)} 張 BMP/TIFF 圖片轉為 PNG/JPEG。")
+
+                with ParallelZipWriter(output_pptx) as zout:
+                    # 依原始順序排隊寫出：(item, future, 原圖大小, 待寫入快取的 key)
+                    pending = deque()
+                    inflight_bytes = 0
+                    written = 0
+
+                    def write_next():
+                        nonlocal inflight_bytes, written, kept
+                        item, future, size, cache_key = pending.popleft()
+                        name = item.filename
+                        inflight_bytes -= size
+
+                        data = None
+                        completed = False
+                        if future is not None:
+                            try:
+                                data, wall, cpu_used = future.result()
+                                completed = True
+                                if wall is not None:
+                                    self.metrics.record(
+                                        "image.recompress", wall, cpu_used, nbytes=item.file_size,
+                                        attrs={"part": name, "output_bytes": len(data) if data is not None else None},
+                                    )
+                            except Exception as e:
+                                print(f"   ❌ 壓縮圖片 {name} 失敗: {e}，保留原圖。")
+
+                        if data:
+                            zout.writestr(renames.get(name, name), data)
+                            if cache_key:
+                                cache.put(cache_key, data)
+                        else:
+                            # 未變更的成員直接搬移壓縮位元組
+                            zout.copy(zin, src, item)
+                            if completed:
+                                kept += 1
+                            if cache_key and completed:
+                                # 空內容代表「重新壓縮不會變小」，下次直接保留原圖
+                                cache.put(cache_key, b"")
+
+                        # 回報進度
+                        written += 1
+                        if progress_callback:
+                            progress_callback(written, total_files)
+
+                    for item in file_list:
+                        name = item.filename
+
+                        # 移除影片與音訊實體
+                        if _is_offload_media_part(name):
+                            written += 1
+                            continue
 
-                    # 移除影片實體
-                    if name.startswith("ppt/media/") and name.lower().endswith(VIDEO_EXTS):
-                        continue
+                        future = None
+                        size = 0
+                        cache_key = None
 
-                    # 處理圖片
-                    if name.startswith("ppt/media/") and name.lower().endswith(IMAGE_EXTS):
-                        try:
+                        if name in transcoded:
+                            # 已轉檔：以新檔名寫出
+                            future = Future()
+                            future.set_result((transcoded[name][1], None, None))
+                        elif renames and (name == PackageIndex.CONTENT_TYPES or name.endswith(".rels")):
+                            # 同一趟改寫引用到更名圖片的 rels 與 [Content_Types].xml
                             file_data = zin.read(name)
-                            # 小於 50KB 不壓縮
-                            if len(file_data) < 50 * 1024:
-                                zout.writestr(item, file_data)
-                                continue
-
-                            img = Image.open(io.BytesIO(file_data))
-                            
-                            # [規格] 1280px
-                            img.thumbnail((1280, 1280), Image.Resampling.LANCZOS)
-
-                            output_buffer = io.BytesIO()
-                            ext = os.path.splitext(name)[1].lower()
-
-                            # [規格] Quality 50
-                            if ext in (".jpg", ".jpeg"):
-                                img = img.convert("RGB")
-                                img.save(output_buffer, format="JPEG", quality=50, optimize=True)
-                                zout.writestr(name, output_buffer.getvalue())
-                            elif ext == ".png":
-                                img.save(output_buffer, format="PNG", optimize=True)
-                                zout.writestr(name, output_buffer.getvalue())
+                            try:
+                                if name == PackageIndex.CONTENT_TYPES:
+                                    rewritten = _rename_content_types(file_data, renames)
+                                else:
+                                    rewritten = _rename_relationship_targets(_part_for_rels_path(name), file_data, renames)
+                            except Exception as e:
+                                print(f"   ⚠️ 更新 {name} 的圖片檔名失敗: {e}")
+                                rewritten = None
+                            if rewritten is not None:
+                                future = Future()
+                                future.set_result((rewritten, None, None))
+
+                        # 處理圖片 (小於 50KB 不壓縮；未能轉檔的 BMP/TIFF 保留原檔)
+                        elif _is_image_part(name) and _shrink_format(name) and item.file_size >= SHRINK_MIN_BYTES:
+                            file_data = zin.read(name)
+                            fmt = _shrink_format(name)
+                            display_px = display_sizes.get(name)
+                            cached = None
+                            if cache is not None and fmt:
+                                cache_key = cache.make_key(file_data, SHRINK_MAX_EDGE, SHRINK_JPEG_QUALITY, fmt, display_px)
+                                cached = cache.get(cache_key)
+
+                            # 空的快取內容代表先前重新壓縮不會變小 (不比原圖小的快取內容一律保留原圖)；
+                            # 未快取時只讀檔頭判斷
+                            keep_original = (cached is not None and not 0 < len(cached) < len(file_data)) or (
+                                cached is None and _is_well_compressed(name, file_data, display_px)
+                            )
+                            if cache_key and cached is None and not keep_original:
+                                misses += 1
+
+                            if keep_original:
+                                # 保留原圖：不送去解碼
+                                kept += 1
+                                cache_key = None
+                            elif cached is not None:
+                                # 命中快取：不需解碼/編碼，直接寫入
+                                hits += 1
+                                cache_key = None
+                                future = Future()
+                                future.set_result((cached, None, None))
+                            elif executor is not None:
+                                future = executor.submit(_timed_recompress, name, file_data, display_px)
+                                size = len(file_data)
+                                inflight_bytes += size
                             else:
-                                zout.writestr(item, file_data)
-                            continue
-
-                        except Exception as e:
-                            print(f"   ❌ 壓縮圖片 {name} 失敗: {e}，保留原圖。")
-                            zout.writestr(item, zin.read(name))
-                            continue
-
-                    zout.writestr(item, zin.read(name))
-
-    # === Step 4: 拆分與上傳 (加入前綴處理) ===
-    def split_and_upload(self, slim_pptx, split_jobs, file_prefix="", progress_callback=None, log_callback=None, debug_mode=False):
+                                future = Future()
+                                try:
+                                    future.set_result(_timed_recompress(name, file_data, display_px))
+                                except Exception as e:
+                                    future.set_exception(e)
+
+                        pending.append((item, future, size, cache_key))
+                        while pending and (
+                            inflight_bytes > SHRINK_MAX_INFLIGHT_BYTES
+                            or pending[0][1] is None
+                            or pending[0][1].done()
+                        ):
+                            write_next()
+
+                    while pending:
+                        write_next()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        if cache is not None:
+            _log(log_callback, f"🗂️ [Shrink] 圖片快取：命中 {hits} 張、未命中 {misses} 張。")
+        if kept:
+            _log(log_callback, f"⏩ [Shrink] {kept} 張圖片已夠小或重新壓縮不會變小，保留原圖。")
+        if manifest is not None:
+            manifest.record_artifact("shrink", output_pptx, inputs)
+
+    # === Step 4: 拆分與上傳 (加入前綴處理，拆分與上傳管線並行) ===
+    def split_and_upload(self, slim_pptx, split_jobs, file_prefix="", progress_callback=None, log_callback=None, debug_mode=False, max_workers=1, queue_depth=2,
+                         manifest: Optional[RunManifest] = None, fit_to_budget: bool = True, image_workers: int = 1):
+        # fit_to_budget：拆分檔超過 SPLIT_SIZE_BUDGET_MB 時依 SIZE_BUDGET_LADDER 逐級降低圖片畫質，
+        # 各任務最後採用的等級記錄在 job["image_level"] / job["image_quality"]；
+        # image_workers 為重新壓縮圖片的工作行程數 (與 Step 3 相同的行程池設定)
         if not self.drive_service:
             _log(log_callback, "❌ 服務未初始化，無法上傳拆分檔。")
             return []
 
-        results = []
         total_jobs = len(split_jobs)
+        pending_jobs = []
 
         # Debug 模式目錄 (如果未來需要啟用)
         debug_dir = "debug_output"
@@ -617,101 +2773,223 @@ class PPTAutomationBot:
 
             # Debug Mode (略)
             if debug_mode:
-                results.append(job)
                 continue
 
             # 一般模式
+            if manifest is not None:
+                # 只採用這份來源簡報的執行紀錄，不沿用任務上殘留的舊連結
+                job.pop("final_link", None)
+                job.pop("presentation_id", None)
+                manifest.restore_job(job)
+
             if job.get("final_link"):
                 _log(log_callback, f"⏭️ ({current_num}/{total_jobs}) {display_name} 本地已完成，跳過。")
-                results.append(job)
                 continue
 
-            existing_file = self._check_drive_file_exists(display_name)
+            existing_file = self._check_drive_file_exists(
+                display_name, prefix=self._drive_name_prefix(file_prefix)
+            )
             if existing_file:
                 file_id, web_link = existing_file
                 _log(log_callback, f"☁️ ({current_num}/{total_jobs}) 雲端已有簡報：{display_name}，直接使用！")
                 job["final_link"] = web_link
                 job["presentation_id"] = file_id
-                results.append(job)
+                if manifest is not None:
+                    manifest.record_job(job)
                 continue
 
-            temp_split_name = f"temp_{uuid.uuid4().hex[:6]}.pptx"
+            pending_jobs.append((job, display_name, f"({current_num}/{total_jobs})"))
+
+        if pending_jobs:
+            self._split_upload_pipeline(
+                slim_pptx, pending_jobs, progress_callback, log_callback, max_workers, queue_depth, manifest,
+                fit_to_budget, image_workers,
+            )
+
+        # 任務物件就地更新，結果維持原本的任務順序
+        return list(split_jobs)
+
+    def _split_upload_pipeline(self, slim_pptx, pending_jobs, progress_callback, log_callback, max_workers, queue_depth, manifest=None,
+                               fit_to_budget=True, image_workers=1):
+        max_workers = max(1, int(max_workers or 1))
+        image_workers = max(1, int(image_workers or 1))
+        executor = None
+
+        def image_pool():
+            # 只有拆分檔超過上限時才啟動壓縮行程池，同一批拆分共用
+            nonlocal executor
+            if image_workers > 1 and executor is None:
+                executor = _image_process_pool(image_workers)
+            return executor, image_workers
+        work_dir = os.path.dirname(os.path.abspath(slim_pptx))
+        # 拆分階段最多先做好 queue_depth 份，避免暫存檔堆積
+        ready = queue.Queue(maxsize=max(1, int(queue_depth or 1)))
+        progress = _UploadProgress()
+
+        def build_splits():
+            # 整份簡報只解析一次，所有任務共用同一份依賴圖
+            index: Optional[PackageIndex] = None
             try:
-                _log(log_callback, f"✂️ ({current_num}/{total_jobs}) 正在拆分：{display_name} ...")
-
-                prs = Presentation(slim_pptx)
-                xml_slides = prs.slides._sldIdLst
-                slides = list(xml_slides)
-                # 轉換為 0-based index
-                keep_indices = set(range(job["start"] - 1, job["end"]))
-
-                # 倒序刪除不需要的投影片
-                for i in range(len(slides) - 1, -1, -1):
-                    if i not in keep_indices:
-                        xml_slides.remove(slides[i])
-
-                prs.save(temp_split_name)
+                for job, display_name, tag in pending_jobs:
+                    temp_split_name = os.path.join(work_dir, f"temp_{uuid.uuid4().hex[:6]}.pptx")
+                    try:
+                        _log(log_callback, f"✂️ {tag} 正在拆分：{display_name} ...")
+
+                        with self.metrics.span("split.build", attrs={"file": display_name}) as span:
+                            if index is None:
+                                index = PackageIndex(slim_pptx)
+
+                            # 直接由依賴圖輸出：只寫入可達的 part，不需再跑 python-pptx 與清理流程
+                            keep, level = self._write_split_within_budget(
+                                index, temp_split_name, index.slide_rids_for_range(job["start"], job["end"]),
+                                fit_to_budget, display_name, tag, log_callback, image_pool,
+                            )
+                            # 記錄影片連結數，Step 5 可略過不含影片的簡報
+                            job["video_links"] = index.count_external_links(keep, "drive.google.com")
+                            job["image_level"] = level
+                            job["image_quality"] = _ladder_label(level)
+
+                            file_size = os.path.getsize(temp_split_name)
+                            span.add_bytes(file_size)
+                            span.set(slides=job["end"] - job["start"] + 1, parts=len(keep), image_level=level)
+                        size_mb = file_size / (1024 * 1024)
+
+                        if size_mb > SPLIT_SIZE_BUDGET_MB:
+                            error_msg = f"⛔️ 檔案過大：{display_name} 仍有 {size_mb:.2f} MB (超過 {SPLIT_SIZE_BUDGET_MB} MB 上限)。"
+                            _log(log_callback, error_msg)
+                            job["error_too_large"] = True
+                            job["size_mb"] = size_mb
+                            os.remove(temp_split_name)
+                            continue
 
-                # 拆分後立刻執行清理
+                        ready.put((job, display_name, tag, temp_split_name, size_mb))
+                    except Exception as e:
+                        print(f"拆分失敗: {e}")
+                        if os.path.exists(temp_split_name):
+                            os.remove(temp_split_name)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=True)
+                for _ in range(max_workers):
+                    ready.put(None)
+
+        def upload_splits():
+            drive_service = None
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+                job, display_name, tag, temp_split_name, size_mb = item
                 try:
-                    self._prune_pptx_package_fast(temp_split_name, log_callback=log_callback)
+                    drive_service = drive_service or self._thread_service("drive", "v3")
+                    with self.metrics.span("split.upload", attrs={"file": display_name}) as span:
+                        span.add_bytes(os.path.getsize(temp_split_name))
+                        self._upload_split(
+                            drive_service, job, display_name, tag, temp_split_name, size_mb,
+                            progress.update, log_callback,
+                        )
+                    if manifest is not None:
+                        manifest.record_job(job)
                 except Exception as e:
-                    _log(log_callback, f"⚠️ [Prune] 失敗但不致命：{e}")
-
-                file_size = os.path.getsize(temp_split_name)
-                size_mb = file_size / (1024 * 1024)
-
-                if size_mb > 99:
-                    error_msg = f"⛔️ 檔案過大：{display_name} 仍有 {size_mb:.2f} MB (超過 100MB 限制)。"
-                    _log(log_callback, error_msg)
-                    job["error_too_large"] = True
-                    job["size_mb"] = size_mb
-                    results.append(job)
+                    print(f"上傳失敗: {e}")
+                finally:
+                    if os.path.exists(temp_split_name):
+                        os.remove(temp_split_name)
+
+        with ThreadPoolExecutor(max_workers=max_workers + 1) as pool:
+            futures = {pool.submit(build_splits)}
+            futures.update(pool.submit(upload_splits) for _ in range(max_workers))
+            while futures:
+                done, futures = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+                progress.flush(progress_callback)
+                for future in done:
+                    future.result()
+
+    @staticmethod
+    def _write_split_within_budget(index, out_path, keep_rids, fit_to_budget, display_name, tag, log_callback,
+                                   image_pool=None):
+        """寫出拆分檔；超過上限時依品質階梯重新壓縮該檔的圖片，直到符合或用完所有等級。
+
+        image_pool() 回傳 (executor 或 None, 工作行程數)，只在真的需要重新壓縮時才呼叫。
+        某等級沒有任何圖片變小時直接跳到下一級，不重複寫出相同的檔案。
+        回傳 (keep, level)：level 為實際有圖片變小的最後一級，0 代表未降低畫質。"""
+        budget = SPLIT_SIZE_BUDGET_MB * 1024 * 1024
+        keep = index.reachable_parts(keep_rids)
+        level = 0
+        if fit_to_budget:
+            estimate = index.estimate_split_size(keep)
+            if estimate > budget:
+                # 預估已超過上限：不必先寫出原畫質版本
+                _log(log_callback, f"📏 {tag} {display_name} 預估 {estimate / (1024 * 1024):.1f} MB，超過 {SPLIT_SIZE_BUDGET_MB} MB，開始降低圖片畫質...")
+                level = 1
+
+        applied = 0
+        while True:
+            overrides = None
+            changed = False
+            if level:
+                max_edge, quality = SIZE_BUDGET_LADDER[level - 1]
+                executor, workers = image_pool() if image_pool else (None, 1)
+                overrides = _reencode_split_images(index, keep, max_edge, quality, executor, workers)
+                changed = any(data is not None for data in overrides.values())
+                if changed:
+                    applied = level
+                elif os.path.exists(out_path):
+                    # 這一級沒有任何圖片變小，已寫出的檔案不會更小
+                    if level >= len(SIZE_BUDGET_LADDER):
+                        return keep, applied
+                    level += 1
                     continue
-
-                _log(log_callback, f"⬆️ ({current_num}/{total_jobs}) 正在上傳：{display_name} (大小: {size_mb:.2f} MB)...")
-
-                file_metadata = {"name": display_name, "mimeType": "application/vnd.google-apps.presentation"}
-
-                CHUNK_SIZE = 5 * 1024 * 1024
-                media = MediaFileUpload(
-                    temp_split_name,
-                    mimetype="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                    resumable=True,
-                    chunksize=CHUNK_SIZE,
-                )
-
-                request = self.drive_service.files().create(
-                    body=file_metadata, media_body=media, fields="id, webViewLink"
-                )
-
-                response = None
-                while response is None:
-                    status, response = request.next_chunk()
-                    if status and progress_callback:
-                        # 回報單檔上傳進度
-                        progress_callback(display_name, int(status.resumable_progress), int(status.total_size))
-
-                file = response
-                self.drive_service.permissions().create(
-                    fileId=file.get("id"), body={"type": "anyone", "role": "reader"}
-                ).execute()
-
-                job["final_link"] = file.get("webViewLink")
-                job["presentation_id"] = file.get("id")
-                results.append(job)
-
-            except Exception as e:
-                print(f"上傳失敗: {e}")
-                results.append(job)
-            finally:
-                if os.path.exists(temp_split_name):
-                    os.remove(temp_split_name)
-
-        return results
-
-    # === Step 5: 內嵌優化 (加入進度回報) ===
-    def embed_videos_in_slides(self, processed_jobs, progress_callback=None, log_callback=None, debug_mode=False):
+            index.write_split(out_path, keep_rids, image_overrides=overrides)
+            size = os.path.getsize(out_path)
+            if changed:
+                _log(log_callback, f"🪶 {tag} {display_name} 圖片 {_ladder_label(level)}：{size / (1024 * 1024):.1f} MB")
+            if not fit_to_budget or size <= budget or level >= len(SIZE_BUDGET_LADDER):
+                return keep, applied
+            level += 1
+
+    def _upload_split(self, drive_service, job, display_name, tag, temp_split_name, size_mb, progress_callback, log_callback):
+        _log(log_callback, f"⬆️ {tag} 正在上傳：{display_name} (大小: {size_mb:.2f} MB)...")
+
+        file_metadata = {
+            "name": display_name,
+            "mimeType": "application/vnd.google-apps.presentation",
+            "appProperties": dict([DRIVE_APP_PROPERTY]),
+        }
+
+        CHUNK_SIZE = 5 * 1024 * 1024
+        media = MediaFileUpload(
+            temp_split_name,
+            mimetype="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+            resumable=True,
+            chunksize=CHUNK_SIZE,
+        )
+
+        request = drive_service.files().create(
+            body=file_metadata, media_body=media, fields="id, webViewLink"
+        )
+
+        response = None
+        while response is None:
+            status, response = request.next_chunk()
+            if status and progress_callback:
+                # 回報單檔上傳進度
+                progress_callback(display_name, int(status.resumable_progress), int(status.total_size))
+
+        file = response
+        drive_service.permissions().create(
+            fileId=file.get("id"), body={"type": "anyone", "role": "reader"}
+        ).execute()
+
+        self.drive_index.add(display_name, file.get("id"), file.get("webViewLink"))
+        job["final_link"] = file.get("webViewLink")
+        job["presentation_id"] = file.get("id")
+
+    # === Step 5: 內嵌優化 (加入進度回報，可同時處理多份簡報) ===
+    def embed_videos_in_slides(self, processed_jobs, progress_callback=None, log_callback=None, debug_mode=False, max_workers=1,
+                               manifest: Optional[RunManifest] = None, audio_links=None):
+        # audio_links：Step 1 上傳的音訊連結；Slides 無法以音訊建立影片播放器，保留連結圖示
+        audio_ids = {m.group(1) for m in (re.search(r"/file/d/([a-zA-Z0-9-_]+)", u) for u in audio_links or ()) if m}
         if debug_mode:
             return processed_jobs
         
@@ -719,20 +2997,63 @@ class PPTAutomationBot:
             return processed_jobs
 
         jobs_to_process = [j for j in processed_jobs if "presentation_id" in j]
+
+        # 拆分時已確認不含影片連結的簡報，不必再讀取
+        skipped = [j for j in jobs_to_process if j.get("video_links") == 0]
+        if skipped:
+            _log(log_callback, f"⏭️ {len(skipped)} 份簡報不含影片連結，略過優化。")
+        jobs_to_process = [j for j in jobs_to_process if j.get("video_links") != 0]
+
+        if manifest is not None:
+            embedded = [j for j in jobs_to_process if manifest.is_embedded(j)]
+            if embedded:
+                _log(log_callback, f"⏭️ {len(embedded)} 份簡報先前已完成優化，跳過。")
+            jobs_to_process = [j for j in jobs_to_process if not manifest.is_embedded(j)]
+
         total_jobs = len(jobs_to_process)
-        count = 0
+        max_workers = max(1, int(max_workers or 1))
+
+        if max_workers == 1 or total_jobs <= 1:
+            for count, job in enumerate(jobs_to_process, start=1):
+                # 回報進度
+                if progress_callback:
+                    progress_callback(count, total_jobs)
+                if self._embed_single_presentation(self.slides_service, job, f"({count}/{total_jobs})", log_callback,
+                                                   audio_ids) and manifest is not None:
+                    manifest.record_embedded(job)
+            return processed_jobs
 
-        for job in jobs_to_process:
-            count += 1
-            # 回報進度
-            if progress_callback:
-                progress_callback(count, total_jobs)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(self._embed_single_presentation, None, job, f"({count}/{total_jobs})", log_callback, audio_ids): job
+                for count, job in enumerate(jobs_to_process, start=1)
+            }
+            done_count = 0
+            not_done = set(futures)
+            while not_done:
+                done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result() and manifest is not None:
+                        manifest.record_embedded(futures[future])
+                    done_count += 1
+                    # 回報進度
+                    if progress_callback:
+                        progress_callback(done_count, total_jobs)
 
-            pid = job["presentation_id"]
-            _log(log_callback, f"🔧 ({count}/{total_jobs}) 正在優化播放器：{job['filename']} ...")
+        return processed_jobs
+
+    def _embed_single_presentation(self, slides_service, job, tag, log_callback, audio_ids=frozenset()):
+        slides_service = slides_service or self._thread_service("slides", "v1")
+        pid = job["presentation_id"]
+        _log(log_callback, f"🔧 {tag} 正在優化播放器：{job['filename']} ...")
 
+        with self.metrics.span("embed.presentation", attrs={"file": job["filename"]}) as span:
             try:
-                presentation = self.slides_service.presentations().get(presentationId=pid).execute()
+                # 只取判斷與建立影片所需的欄位，避免下載整份簡報 JSON
+                presentation = slides_service.presentations().get(
+                    presentationId=pid,
+                    fields="slides(objectId,pageElements(objectId,size,transform,image(imageProperties(link(url)))))",
+                ).execute()
                 requests = []
 
                 for slide in presentation.get("slides", []):
@@ -742,7 +3063,7 @@ class PPTAutomationBot:
                             url = element["image"].get("imageProperties", {}).get("link", {}).get("url", "")
                             if "drive.google.com" in url:
                                 match = re.search(r"/file/d/([a-zA-Z0-9-_]+)", url)
-                                if match:
+                                if match and match.group(1) not in audio_ids:
                                     vid_id = match.group(1)
                                     requests.append({
                                         "createVideo": {
@@ -757,18 +3078,21 @@ class PPTAutomationBot:
                                     })
                                     requests.append({"deleteObject": {"objectId": element["objectId"]}})
 
+                span.set(videos=len(requests) // 2)
                 if requests:
-                    self.slides_service.presentations().batchUpdate(
+                    slides_service.presentations().batchUpdate(
                         presentationId=pid, body={"requests": requests}
                     ).execute()
+                return True
 
             except Exception as e:
                 print(f"優化失敗: {e}")
-
-        return processed_jobs
+                span.set(error=type(e).__name__)
+                return False
 
     # === Step 6: 寫入 Google Sheet (欄位調整) ===
-    def log_to_sheets(self, completed_jobs, log_callback=None, debug_mode=False):
+    def log_to_sheets(self, completed_jobs, log_callback=None, debug_mode=False,
+                      manifest: Optional[RunManifest] = None):
         if debug_mode:
             return
         
@@ -776,18 +3100,11 @@ class PPTAutomationBot:
             _log(log_callback, "❌ 服務未初始化，無法寫入試算表。")
             return
 
-        existing_ids = set()
+        index = SheetIdIndex()
         try:
             _log(log_callback, "🔍 正在比對 Google Sheet 既有資料，避免重複寫入...")
-            # 讀取 A 欄比對 ID
-            result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=SPREADSHEET_ID,
-                range="Presentations!A:A",
-            ).execute()
-            rows = result.get("values", [])
-            for r in rows:
-                if r:
-                    existing_ids.add(r[0])
+            # 只增量讀取上次之後新增的列
+            existing_ids = index.sync(self.sheets_service, log_callback=log_callback)
 
         except HttpError as err:
             if err.resp.status == 403:
@@ -804,7 +3121,12 @@ class PPTAutomationBot:
             print(f"讀取 Sheet 失敗: {e}")
             raise e
 
-        values = []
+        # 先前執行寫入失敗、仍在排隊的列，與本次一起送出
+        carried = index.take_pending()
+        if carried:
+            _log(log_callback, f"📦 補寫先前未完成的 {len(carried)} 筆資料。")
+        values = list(carried)
+        queued_ids = {r[0] for r in carried}
         jobs_to_mark_done = []
 
         for job in completed_jobs:
@@ -812,6 +3134,9 @@ class PPTAutomationBot:
                 continue
 
             job_id = job.get("id")
+            if job_id in queued_ids:
+                jobs_to_mark_done.append(job)
+                continue
             if job_id in existing_ids:
                 _log(log_callback, f"⏭️ 任務 {job['filename']} (ID: {job_id}) 已存在於報表中，跳過。")
                 continue
@@ -831,10 +3156,13 @@ class PPTAutomationBot:
                 ""  # CustomThumbnail (目前無縮圖，填空)
             ]
             values.append(row)
+            queued_ids.add(job_id)
             jobs_to_mark_done.append(job)
 
         if values:
             _log(log_callback, f"📝 正在寫入 {len(values)} 筆新資料到 Google Sheets...")
+            # 先記錄在本地，若這次寫入失敗下次會自動補寫
+            index.queue(values)
 
             body = {"values": values}
             self.sheets_service.spreadsheets().values().append(
@@ -843,8 +3171,12 @@ class PPTAutomationBot:
                 valueInputOption="USER_ENTERED",
                 body=body,
             ).execute()
+            index.mark_appended(values)
 
             for job in jobs_to_mark_done:
                 job["logged_to_sheet"] = True
         else:
-            _log(log_callback, "✅ 所有資料皆已存在於 Sheet 中，同步完成。")
\ No newline at end of file
+            _log(log_callback, "✅ 所有資料皆已存在於 Sheet 中，同步完成。")
+
+        if manifest is not None:
+            manifest.mark_done("sheets")
\ No newline at end of file
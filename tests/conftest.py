@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+
+@pytest.fixture
+def synthetic_deck(tmp_path):
+    """小型合成簡報：4 頁、1 支影片、3 張圖片。"""
+    path = str(tmp_path / "deck.pptx")
+    benchmark.make_synthetic_deck(path, slides=4, videos=1, video_bytes=64 * 1024, images=3, image_size=(320, 240))
+    return path
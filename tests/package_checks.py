@@ -0,0 +1,55 @@
+"""OPC 套件的結構檢查：每個內部關聯都指向存在的 part，每個 part 都有內容類型。"""
+import posixpath
+import zipfile
+
+from lxml import etree
+
+import ppt_processor as pp
+
+CT = f"{{{pp.CT_NS}}}"
+REL = f"{{{pp.PKG_REL_NS}}}"
+
+
+def _rels_source(rels_name: str) -> str:
+    # ppt/slides/_rels/slide1.xml.rels -> ppt/slides/slide1.xml；_rels/.rels -> 套件根目錄
+    folder, base = posixpath.split(rels_name)
+    return posixpath.join(posixpath.dirname(folder), base[:-len(".rels")])
+
+
+def relationship_targets(z: zipfile.ZipFile, rels_name: str):
+    """回傳 [(Type, Target, 是否外部, 解析後的 part)]。"""
+    source = _rels_source(rels_name)
+    out = []
+    for rel in etree.fromstring(z.read(rels_name)).iter(f"{REL}Relationship"):
+        external = rel.get("TargetMode", "").lower() == "external"
+        target = rel.get("Target", "")
+        out.append((rel.get("Type"), target, external, None if external else pp._resolve_target(source, target)))
+    return out
+
+
+def assert_package_valid(path: str) -> None:
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        names = set(z.namelist())
+
+        for rels_name in (n for n in names if n.endswith(".rels")):
+            for rel_type, target, external, part in relationship_targets(z, rels_name):
+                if not external:
+                    assert part in names, f"{rels_name} 指向不存在的 {target}"
+
+        types = etree.fromstring(z.read("[Content_Types].xml"))
+        defaults = {d.get("Extension").lower() for d in types.iter(f"{CT}Default")}
+        overrides = {o.get("PartName").lstrip("/") for o in types.iter(f"{CT}Override")}
+        for part in overrides:
+            assert part in names, f"[Content_Types].xml 的 Override 指向不存在的 {part}"
+        for name in names - {"[Content_Types].xml"}:
+            if name.endswith("/"):
+                continue
+            ext = posixpath.basename(name).rsplit(".", 1)[-1].lower()
+            assert name in overrides or ext in defaults, f"{name} 沒有內容類型"
+
+
+def slide_count(path: str) -> int:
+    with zipfile.ZipFile(path) as z:
+        root = etree.fromstring(z.read("ppt/presentation.xml"))
+    return len(list(root.iter(f"{{{pp.PML_NS}}}sldId")))
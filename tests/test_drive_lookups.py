@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+import benchmark
+import ppt_processor as pp
+from fake_google import FakeGoogle, FakeGoogleConfig
+
+
+def _publish(fake, deck, work_dir, splits):
+    bot = pp.PPTAutomationBot(creds=object(), service_factory=fake.service_factory())
+    bot.extract_and_upload_videos(deck, os.path.join(work_dir, "media"), file_prefix="deck")
+    slides = pp.PackageIndex(deck).slide_count
+    jobs = [{"id": f"b{i}", "filename": f"part{i}", "start": i + 1, "end": i + 1} for i in range(min(splits, slides))]
+    return bot.split_and_upload(deck, jobs, "deck")
+
+
+@pytest.mark.parametrize("videos,splits", [(2, 2), (5, 6)])
+def test_existence_checks_do_not_grow_with_items(tmp_path, monkeypatch, videos, splits):
+    monkeypatch.chdir(tmp_path)
+    deck = str(tmp_path / "deck.pptx")
+    benchmark.make_synthetic_deck(deck, slides=6, videos=videos, video_bytes=16 * 1024, images=0)
+    with FakeGoogle(FakeGoogleConfig()) as fake:
+        results = _publish(fake, deck, str(tmp_path), splits)
+        calls = fake.stats()["calls"]
+    assert all(r.get("final_link") for r in results)
+    # 檔名索引與內容索引各列一次
+    assert calls["drive.files.list"] == 2
+
+
+def test_tagged_uploads_are_found_without_uploading_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deck = str(tmp_path / "deck.pptx")
+    benchmark.make_synthetic_deck(deck, slides=3, videos=2, video_bytes=16 * 1024, images=0)
+    with FakeGoogle(FakeGoogleConfig()) as fake:
+        _publish(fake, deck, str(tmp_path), 3)
+        created = fake.stats()["calls"]["drive.files.create"]
+        # 不靠本機的影片對照表，只靠雲端索引找到已上傳的檔案
+        os.remove("video_map_deck.json")
+        _publish(fake, deck, str(tmp_path), 3)
+        assert fake.stats()["calls"]["drive.files.create"] == created
@@ -0,0 +1,36 @@
+import os
+import threading
+
+import metrics
+
+
+def test_counters_use_total_suffix():
+    recorder = metrics.MetricsRecorder()
+    with recorder.span("stage", step="shrink"):
+        pass
+    text = metrics.prometheus_text(recorder.summary())
+    counters = [line.split()[2] for line in text.splitlines() if line.startswith("# TYPE") and line.endswith("counter")]
+    assert "pptbot_span_count_total" in counters
+    assert all(name.endswith("_total") for name in counters)
+
+
+def test_concurrent_atomic_writes_do_not_collide(tmp_path):
+    path = str(tmp_path / "publish_metrics.prom")
+    errors = []
+
+    def write(n):
+        try:
+            for _ in range(20):
+                metrics._write_text_atomic(path, f"value {n}\n")
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert os.listdir(tmp_path) == ["publish_metrics.prom"]
+    assert open(path, encoding="utf-8").read() in {f"value {n}\n" for n in range(4)}
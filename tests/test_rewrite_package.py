@@ -0,0 +1,70 @@
+import zipfile
+
+
+import benchmark
+import ppt_processor as pp
+from package_checks import assert_package_valid, relationship_targets, slide_count
+
+VIDEO_LINK = "https://drive.google.com/file/d/abc123/view?usp=drivesdk"
+
+
+def test_link_rewrite_and_shrink_keep_package_valid(synthetic_deck, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = benchmark.make_stub_bot()
+    linked, slim = str(tmp_path / "linked.pptx"), str(tmp_path / "slim.pptx")
+
+    replaced = bot.replace_videos_with_images(synthetic_deck, linked, {"media1.mp4": VIDEO_LINK})
+    assert replaced == 1
+    assert_package_valid(linked)
+    with zipfile.ZipFile(linked) as z:
+        external = [t for n in z.namelist() if n.endswith(".rels")
+                    for _, t, is_external, _ in relationship_targets(z, n) if is_external]
+    assert VIDEO_LINK in external
+
+    bot.shrink_pptx(linked, slim)
+    assert_package_valid(slim)
+    with zipfile.ZipFile(slim) as z:
+        assert not [n for n in z.namelist() if n.endswith(".mp4")]
+    assert slide_count(slim) == 4
+
+
+def test_transcoded_images_are_renamed_everywhere(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deck, slim = str(tmp_path / "bmp.pptx"), str(tmp_path / "slim.pptx")
+    benchmark.make_synthetic_deck(deck, slides=3, videos=0, images=2, image_size=(320, 240), image_format="BMP")
+
+    benchmark.make_stub_bot().shrink_pptx(deck, slim)
+
+    assert_package_valid(slim)
+    with zipfile.ZipFile(slim) as z:
+        names = z.namelist()
+        assert not [n for n in names if n.endswith(".bmp")]
+        images = [n for n in names if n.startswith("ppt/media/image")]
+        assert len(images) == 2 and all(n.endswith((".png", ".jpg")) for n in images)
+
+
+def test_rename_relationship_targets_keeps_relative_form():
+    rels = (
+        f'<Relationships xmlns="{pp.PKG_REL_NS}">'
+        '<Relationship Id="rId1" Type="t" Target="../media/image1.bmp"/>'
+        '<Relationship Id="rId2" Type="t" Target="../media/image2.png"/>'
+        '<Relationship Id="rId3" Type="t" Target="https://example.com/image1.bmp" TargetMode="External"/>'
+        '</Relationships>'
+    ).encode()
+    out = pp._rename_relationship_targets("ppt/slides/slide1.xml", rels, {"ppt/media/image1.bmp": "ppt/media/image1.png"})
+    assert b'Target="../media/image1.png"' in out
+    assert b'Target="../media/image2.png"' in out
+    assert b'Target="https://example.com/image1.bmp"' in out
+    assert pp._rename_relationship_targets("ppt/slides/slide1.xml", rels, {"ppt/media/other.bmp": "ppt/media/other.png"}) is None
+
+
+def test_rename_content_types_moves_overrides_and_adds_defaults():
+    ct = (
+        f'<Types xmlns="{pp.CT_NS}">'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/ppt/media/image1.tiff" ContentType="image/tiff"/>'
+        '</Types>'
+    ).encode()
+    out = pp._rename_content_types(ct, {"ppt/media/image1.tiff": "ppt/media/image1.jpg"})
+    assert b'PartName="/ppt/media/image1.jpg" ContentType="image/jpeg"' in out
+    assert b'Extension="jpg"' in out
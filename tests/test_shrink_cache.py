@@ -0,0 +1,44 @@
+import io
+import random
+import zipfile
+
+from PIL import Image
+
+import benchmark
+import ppt_processor as pp
+from package_checks import assert_package_valid
+
+
+def _low_quality_deck(path, tmp_path):
+    """圖片已是低品質 JPEG：以 Step 3 的品質重新壓縮只會變大，應保留原圖。"""
+    base = str(tmp_path / "base.pptx")
+    benchmark.make_synthetic_deck(base, slides=2, videos=0, images=2, image_size=(1000, 800))
+    rng = random.Random(7)
+    with zipfile.ZipFile(base) as zin, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            data = zin.read(info.filename)
+            if info.filename.startswith("ppt/media/image"):
+                img = Image.frombytes("RGB", (1000, 800), rng.randbytes(1000 * 800 * 3))
+                buf = io.BytesIO()
+                img.save(buf, "JPEG", quality=30)
+                data = buf.getvalue()
+            zout.writestr(info, data)
+
+
+def _media(path):
+    with zipfile.ZipFile(path) as z:
+        return {n: z.read(n) for n in z.namelist() if n.startswith("ppt/media/")}
+
+
+def test_keep_original_marker_survives_cache_hit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deck = str(tmp_path / "deck.pptx")
+    _low_quality_deck(deck, tmp_path)
+    cache = pp.ImageCache(str(tmp_path / "cache"))
+    bot = benchmark.make_stub_bot()
+
+    for run in ("first.pptx", "second.pptx"):
+        out = str(tmp_path / run)
+        bot.shrink_pptx(deck, out, cache=cache)
+        assert_package_valid(out)
+        assert _media(out) == _media(deck)
@@ -0,0 +1,91 @@
+import io
+import zipfile
+
+from PIL import Image
+
+import benchmark
+import ppt_processor as pp
+from package_checks import assert_package_valid
+
+
+def _image_sizes(path):
+    with zipfile.ZipFile(path) as z:
+        return {n: Image.open(z.open(n)).size for n in z.namelist() if n.startswith("ppt/media/image")}
+
+
+def test_over_budget_split_steps_down_until_it_fits(tmp_path, monkeypatch):
+    deck, out = str(tmp_path / "deck.pptx"), str(tmp_path / "split.pptx")
+    benchmark.make_synthetic_deck(deck, slides=4, videos=0, images=4, image_size=(1100, 700))
+    monkeypatch.setattr(pp, "SPLIT_SIZE_BUDGET_MB", 0.5)
+
+    index = pp.PackageIndex(deck)
+    keep, level = pp.PPTAutomationBot._write_split_within_budget(
+        index, out, set(index.slide_rids), True, "deck.pptx", "(1/1)", None,
+    )
+
+    assert level >= 1
+    assert_package_valid(out)
+    assert all(max(size) <= pp.SIZE_BUDGET_LADDER[level - 1][0] for size in _image_sizes(out).values())
+
+
+def _index_and_images(tmp_path, image_format):
+    deck = str(tmp_path / f"{image_format}.pptx")
+    benchmark.make_synthetic_deck(deck, slides=2, videos=0, images=2, image_size=(1100, 700), image_format=image_format)
+    index = pp.PackageIndex(deck)
+    keep = index.reachable_parts(set(index.slide_rids))
+    return index, keep, {n for n in keep if n.startswith("ppt/media/image")}
+
+
+def test_reencode_lowers_jpeg_quality_within_level_edge(tmp_path, monkeypatch):
+    index, keep, images = _index_and_images(tmp_path, "JPEG")
+    monkeypatch.setattr(index, "display_pixel_sizes", lambda dpi=None: {})
+
+    out = pp._reencode_split_images(index, keep, 1280, 40)
+    assert set(out) == images
+    assert all(data is not None and Image.open(io.BytesIO(data)).size == (1100, 700) for data in out.values())
+
+
+def test_reencode_skips_png_within_level_edge(tmp_path, monkeypatch):
+    index, keep, images = _index_and_images(tmp_path, "PNG")
+
+    # 不限顯示尺寸時，PNG 只有長邊超過該等級才需要重新壓縮
+    monkeypatch.setattr(index, "display_pixel_sizes", lambda dpi=None: {})
+    assert pp._reencode_split_images(index, keep, 1280, 40) == {}
+    assert set(pp._reencode_split_images(index, keep, 1024, 35)) == images
+
+    # 顯示尺寸較小時依顯示尺寸縮圖
+    monkeypatch.setattr(index, "display_pixel_sizes", lambda dpi=None: {n: (300, 200) for n in images})
+    out = pp._reencode_split_images(index, keep, 1280, 40)
+    assert set(out) == images
+    assert all(max(Image.open(io.BytesIO(data)).size) <= 320 for data in out.values())
+
+
+def test_level_is_not_reported_when_no_image_shrinks(tmp_path, monkeypatch):
+    deck, out = str(tmp_path / "deck.pptx"), str(tmp_path / "split.pptx")
+    benchmark.make_synthetic_deck(deck, slides=2, videos=0, images=2, image_size=(800, 600))
+    monkeypatch.setattr(pp, "SPLIT_SIZE_BUDGET_MB", 0.001)
+    # 重新壓縮都不會變小 (保留原圖)
+    monkeypatch.setattr(pp, "_recompress_image", lambda *args: None)
+    logs = []
+
+    index = pp.PackageIndex(deck)
+    keep, level = pp.PPTAutomationBot._write_split_within_budget(
+        index, out, set(index.slide_rids), True, "deck.pptx", "(1/1)", logs.append,
+    )
+
+    assert level == 0
+    assert not [line for line in logs if "🪶" in line]
+    with zipfile.ZipFile(deck) as zin, zipfile.ZipFile(out) as zout:
+        for name in (n for n in zin.namelist() if n.startswith("ppt/media/image")):
+            assert zout.read(name) == zin.read(name)
+
+
+def test_within_budget_split_is_not_reencoded(synthetic_deck, tmp_path, monkeypatch):
+    out = str(tmp_path / "split.pptx")
+    monkeypatch.setattr(pp, "_recompress_image", lambda *args: (_ for _ in ()).throw(AssertionError("不應重新壓縮")))
+    index = pp.PackageIndex(synthetic_deck)
+    keep, level = pp.PPTAutomationBot._write_split_within_budget(
+        index, out, set(index.slide_rids), True, "deck.pptx", "(1/1)", None,
+    )
+    assert level == 0
+    assert_package_valid(out)
@@ -0,0 +1,42 @@
+import zipfile
+
+from lxml import etree
+
+import ppt_processor as pp
+from package_checks import assert_package_valid, slide_count
+
+PRESENTATION = (
+    f'<p:presentation xmlns:p="{pp.PML_NS}" xmlns:r="{pp.OFFICE_NS}">'
+    '<p:sldIdLst>'
+    '<p:sldId id="256" r:id="rId2"/><p:sldId id="257" r:id="rId3"/><p:sldId id="258" r:id="rId4"/>'
+    '</p:sldIdLst>'
+    '<p:custShowLst><p:custShow name="短版" id="0"><p:sldLst>'
+    '<p:sld r:id="rId2"/><p:sld r:id="rId4"/>'
+    '</p:sldLst></p:custShow></p:custShowLst>'
+    '<p:extLst><p:ext uri="{521415D9-36F7-43E2-AB2F-B90AF26B5E84}">'
+    f'<p14:sectionLst xmlns:p14="{pp.P14_NS}"><p14:section name="全部" id="{{00000000-0000-0000-0000-000000000001}}">'
+    '<p14:sldIdLst><p14:sldId id="256"/><p14:sldId id="257"/><p14:sldId id="258"/></p14:sldIdLst>'
+    '</p14:section></p14:sectionLst></p:ext></p:extLst>'
+    '</p:presentation>'
+).encode()
+
+
+def test_filter_presentation_slides_drops_unkept_references():
+    root = etree.fromstring(pp._filter_presentation_slides(PRESENTATION, {"rId3", "rId4"}))
+    r_id = f"{{{pp.OFFICE_NS}}}id"
+
+    assert [s.get(r_id) for s in root.iter(f"{{{pp.PML_NS}}}sldId")] == ["rId3", "rId4"]
+    assert [s.get(r_id) for s in root.iter(f"{{{pp.PML_NS}}}sld")] == ["rId4"]
+    assert [s.get("id") for s in root.iter(f"{{{pp.P14_NS}}}sldId")] == ["257", "258"]
+
+
+def test_write_split_keeps_only_requested_slides(synthetic_deck, tmp_path):
+    index = pp.PackageIndex(synthetic_deck)
+    out = str(tmp_path / "split.pptx")
+    index.write_split(out, index.slide_rids_for_range(2, 3))
+
+    assert_package_valid(out)
+    with zipfile.ZipFile(out) as z:
+        slides = sorted(n for n in z.namelist() if n.startswith("ppt/slides/slide"))
+    assert slides == ["ppt/slides/slide2.xml", "ppt/slides/slide3.xml"]
+    assert slide_count(out) == 2
@@ -0,0 +1,65 @@
+import zipfile
+
+import pytest
+
+import ppt_processor as pp
+
+
+def _rewrite(src_path, out_path):
+    """XML 以 writestr 重新壓縮，其餘成員原樣搬移。"""
+    with zipfile.ZipFile(src_path) as zin, open(src_path, "rb") as src, pp.ParallelZipWriter(out_path, workers=2) as zout:
+        for info in zin.infolist():
+            if info.filename.endswith(".xml"):
+                zout.writestr(info.filename, zin.read(info.filename))
+            else:
+                zout.copy(zin, src, info)
+
+
+@pytest.mark.parametrize("raw_write", [True, False])
+def test_rewritten_package_passes_testzip(synthetic_deck, tmp_path, monkeypatch, raw_write):
+    if raw_write and not pp.ZIP_RAW_WRITE:
+        pytest.skip("此 Python 版本未啟用 raw 寫入")
+    monkeypatch.setattr(pp, "ZIP_RAW_WRITE", raw_write)
+    out = str(tmp_path / "out.pptx")
+    _rewrite(synthetic_deck, out)
+
+    with zipfile.ZipFile(synthetic_deck) as zin, zipfile.ZipFile(out) as zout:
+        assert zout.testzip() is None
+        assert zout.namelist() == zin.namelist()
+        for info in zin.infolist():
+            copied = zout.getinfo(info.filename)
+            assert copied.CRC == info.CRC
+            assert zout.read(info.filename) == zin.read(info.filename)
+
+
+def test_raw_copy_keeps_compressed_bytes(synthetic_deck, tmp_path):
+    if not pp.ZIP_RAW_WRITE:
+        pytest.skip("此 Python 版本未啟用 raw 寫入")
+    out = str(tmp_path / "out.pptx")
+    _rewrite(synthetic_deck, out)
+
+    with zipfile.ZipFile(synthetic_deck) as zin, zipfile.ZipFile(out) as zout:
+        for info in zin.infolist():
+            if info.filename.endswith(".xml"):
+                continue
+            copied = zout.getinfo(info.filename)
+            assert (copied.compress_type, copied.compress_size) == (info.compress_type, info.compress_size)
+
+
+def test_raw_write_disabled_outside_checked_versions(monkeypatch):
+    monkeypatch.setattr(pp, "ZIP_RAW_WRITE_PY_VERSIONS", ((2, 0), (2, 7)))
+    assert pp._zip_raw_write_supported() is False
+
+
+def test_fallback_copy_leaves_source_zipinfo_untouched(synthetic_deck, tmp_path, monkeypatch):
+    monkeypatch.setattr(pp, "ZIP_RAW_WRITE", False)
+    index = pp.PackageIndex(synthetic_deck)
+    before = [(i.filename, i.header_offset, i.compress_size, i.CRC, i.flag_bits) for i in index.infos]
+
+    for n in range(2):
+        out = str(tmp_path / f"split{n}.pptx")
+        index.write_split(out, set(index.slide_rids))
+        with zipfile.ZipFile(out) as z:
+            assert z.testzip() is None
+
+    assert [(i.filename, i.header_offset, i.compress_size, i.CRC, i.flag_bits) for i in index.infos] == before